@@ -1,8 +1,173 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils.functional import cached_property
 
-from analytics.models import Trip, RouteStop, DailyLog, LogEntry
+from analytics.models import Trip, RouteStop, DailyLog, LogEntry, ArchivedTrip, IdempotencyKey, DriverDayTimeline
+from analytics.purge import purge_trips
+from analytics.timeline import remove_trips_from_timelines
 
-admin.site.register(Trip)
-admin.site.register(RouteStop)
-admin.site.register(DailyLog)
-admin.site.register(LogEntry)
\ No newline at end of file
+# Up to this many rows a changelist gets an exact count; past it the count is estimated or capped
+EXACT_COUNT_LIMIT = 10000
+# Sorts after any character a search term can end with in code point order, so a prefix becomes a range
+PREFIX_UPPER_BOUND = '\U0010ffff'
+
+
+def estimated_row_count(model, using):
+    """The planner's row estimate for a model's table, without scanning it; None if unavailable"""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            # Row counts recorded by the last ANALYZE; without statistics the count is capped instead
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+            row = cursor.fetchone()
+            return int(row[0].split()[0]) if row else None
+    return None
+
+
+def prefix_condition(field, term, vendor):
+    """Index-backed "field starts with term" (case-sensitive)"""
+    if vendor == 'sqlite':
+        # Text columns use SQLite's BINARY collation, which orders by code point, so the prefix is a range
+        # on the column's index; SQLite's LIKE is case-insensitive and would scan
+        return Q(**{f'{field}__gte': term, f'{field}__lt': term + PREFIX_UPPER_BOUND})
+    # Other collations need not order by code point, so the range could miss rows; LIKE 'term%' is
+    # served by the varchar_pattern_ops index PostgreSQL adds to every indexed CharField
+    return Q(**{f'{field}__startswith': term})
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that never counts a large table in full.
+
+    Unfiltered changelists use the database's row estimate once it passes EXACT_COUNT_LIMIT; filtered
+    ones count at most EXACT_COUNT_LIMIT + 1 matching rows.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > EXACT_COUNT_LIMIT:
+                return estimate
+        return queryset.order_by()[:EXACT_COUNT_LIMIT + 1].count()
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """Changelists that stay fast on large tables: estimated counts and index-friendly prefix search.
+
+    Search matches search_fields by case-sensitive prefix (and ids exactly), so it runs as index range
+    scans instead of the LIKE '%term%' scans of the default search. Unfiltered SQLite changelists only
+    get an estimate once ANALYZE has recorded row counts.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+
+        vendor = connections[queryset.db].vendor
+        condition = Q()
+        for field in self.search_fields:
+            condition |= prefix_condition(field, term, vendor)
+        if term.isdigit():
+            condition |= Q(pk=int(term))
+        return queryset.filter(condition), False
+
+
+@admin.register(Trip)
+class TripAdmin(ScalableAdmin):
+    list_display = ['id', 'driver_name', 'pickup_location', 'dropoff_location', 'total_distance', 'created_at']
+    search_fields = ['driver_name']
+    search_help_text = 'Driver name prefix (case-sensitive) or trip id'
+    date_hierarchy = 'created_at'
+    actions = ['purge_selected']
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            remove_trips_from_timelines([obj.pk])
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        # Backs the built-in "delete selected" action, which otherwise bypasses the timelines
+        with transaction.atomic():
+            remove_trips_from_timelines(list(queryset.values_list('pk', flat=True)))
+            super().delete_queryset(request, queryset)
+
+    @admin.action(description='Purge selected trips (chunked, without loading related rows)', permissions=['delete'])
+    def purge_selected(self, request, queryset):
+        totals = None
+        for totals in purge_trips(queryset):
+            pass
+        if totals is None:
+            return
+        self.message_user(
+            request,
+            f'Purged {totals["trips"]} trips, {totals["rows"]} rows in {totals["seconds"]:.2f}s '
+            f'({totals["rows_per_second"]:.0f} rows/s).',
+            messages.SUCCESS,
+        )
+
+
+@admin.register(RouteStop)
+class RouteStopAdmin(ScalableAdmin):
+    list_display = ['id', 'trip_id', 'order', 'stop_type', 'location_name', 'cumulative_hours']
+    list_filter = ['stop_type']
+    raw_id_fields = ['trip']
+    ordering = ['-id']
+
+
+@admin.register(DailyLog)
+class DailyLogAdmin(ScalableAdmin):
+    list_display = ['id', 'driver_name', 'date', 'trip_id', 'total_hours_driving', 'total_hours_on_duty']
+    search_fields = ['driver_name']
+    search_help_text = 'Driver name prefix (case-sensitive) or log id'
+    date_hierarchy = 'date'
+    raw_id_fields = ['trip']
+    ordering = ['-date', '-id']
+
+
+@admin.register(DriverDayTimeline)
+class DriverDayTimelineAdmin(ScalableAdmin):
+    list_display = ['driver_name', 'date', 'total_hours_driving', 'total_hours_on_duty', 'updated_at']
+    search_fields = ['driver_name']
+    search_help_text = 'Driver name prefix (case-sensitive) or timeline id'
+    date_hierarchy = 'date'
+    ordering = ['-date', 'driver_name']
+
+
+@admin.register(LogEntry)
+class LogEntryAdmin(ScalableAdmin):
+    list_display = ['id', 'daily_log', 'status', 'start_time', 'end_time', 'location']
+    list_select_related = ['daily_log']
+    list_filter = ['status']
+    raw_id_fields = ['daily_log']
+    ordering = ['-id']
+
+
+@admin.register(ArchivedTrip)
+class ArchivedTripAdmin(ScalableAdmin):
+    list_display = ['trip_id', 'driver_name', 'trip_created_at', 'archive_file', 'archived_at']
+    search_fields = ['driver_name']
+    search_help_text = 'Driver name prefix (case-sensitive) or index entry id'
+    date_hierarchy = 'trip_created_at'
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(ScalableAdmin):
+    list_display = ['key', 'status_code', 'claimed_at', 'created_at']
+    search_fields = ['key']
+    search_help_text = 'Key prefix (case-sensitive)'
+    date_hierarchy = 'created_at'
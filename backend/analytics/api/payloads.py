@@ -0,0 +1,112 @@
+"""
+Read-optimized builders for the nested trip and daily log payloads.
+
+They return exactly what TripSerializer and DailyLogSerializer return, field for field and in the same
+order, but from values() rows grouped in Python: no model instances and no per-field serializer calls.
+Field order is read from the serializers themselves, so the two paths cannot drift apart.
+"""
+from django.db import models
+from django.utils import timezone
+
+from analytics.models import Trip, RouteStop, TripWaypoint, DailyLog, LogEntry
+from .serializers import (
+    TripSerializer, RouteStopSerializer, TripWaypointSerializer, DailyLogSerializer, LogEntrySerializer,
+)
+
+
+def datetime_representation(value):
+    """DRF's ISO 8601 DateTimeField output: converted to the current timezone, UTC written as Z"""
+    value = value.astimezone(timezone.get_current_timezone()).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+def field_representation(model_field):
+    """The to_representation of the serializer field DRF maps a model field to, or None for identity"""
+    if isinstance(model_field, models.DateTimeField):
+        return datetime_representation
+    if isinstance(model_field, (models.DateField, models.TimeField)):
+        return lambda value: value.isoformat()
+    if isinstance(model_field, models.FloatField):
+        return float
+    return None
+
+
+class PayloadLayout:
+    """Output fields of a ModelSerializer, mapped to the values() columns and converters that produce them"""
+
+    def __init__(self, model, serializer_class):
+        declared = serializer_class._declared_fields
+        self.fields = []
+        for name in serializer_class().fields:
+            if name in declared:
+                self.fields.append((name, None, None))
+                continue
+            model_field = model._meta.get_field(name)
+            self.fields.append((name, model_field.attname, field_representation(model_field)))
+        self.columns = [attname for _, attname, _ in self.fields if attname is not None]
+
+    def build(self, row, nested=None):
+        payload = {}
+        for name, attname, convert in self.fields:
+            if attname is None:
+                payload[name] = nested[name]
+                continue
+            value = row[attname]
+            payload[name] = value if value is None or convert is None else convert(value)
+        return payload
+
+
+TRIP_LAYOUT = PayloadLayout(Trip, TripSerializer)
+WAYPOINT_LAYOUT = PayloadLayout(TripWaypoint, TripWaypointSerializer)
+ROUTE_STOP_LAYOUT = PayloadLayout(RouteStop, RouteStopSerializer)
+DAILY_LOG_LAYOUT = PayloadLayout(DailyLog, DailyLogSerializer)
+LOG_ENTRY_LAYOUT = PayloadLayout(LogEntry, LogEntrySerializer)
+
+
+def grouped_payloads(queryset, layout, key):
+    """Build payloads for the queryset's rows, grouped by a foreign key column"""
+    groups = {}
+    for row in queryset.values(*layout.columns):
+        groups.setdefault(row[key], []).append(layout.build(row))
+    return groups
+
+
+def daily_log_payloads(daily_logs):
+    """DailyLogSerializer(daily_logs, many=True).data for a trip's logs, from two values() queries"""
+    logs = list(daily_logs.order_by('date', 'id').values(*DAILY_LOG_LAYOUT.columns))
+    entries = grouped_payloads(
+        LogEntry.objects.filter(daily_log_id__in=daily_logs.values('pk')).order_by('start_time', 'id'),
+        LOG_ENTRY_LAYOUT, 'daily_log_id',
+    )
+    return [DAILY_LOG_LAYOUT.build(log, {'entries': entries.get(log['id'], [])}) for log in logs]
+
+
+def trip_payloads(trips):
+    """TripSerializer(trips, many=True).data for a Trip queryset, in its order, from five values() queries"""
+    rows = list(trips.values(*TRIP_LAYOUT.columns))
+    trip_ids = trips.values('pk')
+
+    waypoints = grouped_payloads(
+        TripWaypoint.objects.filter(trip_id__in=trip_ids).order_by('order', 'id'), WAYPOINT_LAYOUT, 'trip_id'
+    )
+    route_stops = grouped_payloads(
+        RouteStop.objects.filter(trip_id__in=trip_ids).order_by('order', 'id'), ROUTE_STOP_LAYOUT, 'trip_id'
+    )
+    # Logs come back ordered by date across all trips, which is each trip's own order once grouped
+    logs = {}
+    for log in daily_log_payloads(DailyLog.objects.filter(trip_id__in=trip_ids)):
+        logs.setdefault(log['trip'], []).append(log)
+
+    return [
+        TRIP_LAYOUT.build(row, {
+            'waypoints': waypoints.get(row['id'], []),
+            'route_stops': route_stops.get(row['id'], []),
+            'daily_logs': logs.get(row['id'], []),
+        })
+        for row in rows
+    ]
+
+
+def trip_payload(trip_id):
+    """TripSerializer(trip).data for one trip"""
+    return trip_payloads(Trip.objects.filter(pk=trip_id))[0]
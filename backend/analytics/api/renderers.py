@@ -0,0 +1,61 @@
+import numpy as np
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; without it this is the stock JSONRenderer
+    orjson = None
+
+
+def is_digit(values):
+    return (values >= ord('0')) & (values <= ord('9'))
+
+
+def has_exponent_range_floats(ret):
+    """Whether orjson output may hold a float that the json module writes in exponent form.
+
+    Those floats (below 1e-4 or from 1e16 up) come out differently in orjson, either with an
+    unpadded exponent (1e16 vs 1e+16) or in positional form (0.00001 vs 1e-05). Only the bytes around
+    each e and each decimal point are inspected; a false positive inside some string value only costs
+    a fallback to the json module.
+    """
+    # Padding keeps every neighbour lookup below in bounds
+    data = np.frombuffer(b'  ' + ret + b'      ', dtype=np.uint8)
+
+    # A digit, then e and an optionally negative exponent
+    e = np.flatnonzero(data == ord('e'))
+    if (is_digit(data[e - 1]) & (is_digit(data[e + 1]) | (data[e + 1] == ord('-')))).any():
+        return True
+
+    # A number starting 0.0000
+    dot = np.flatnonzero(data == ord('.'))
+    small = (data[dot - 1] == ord('0')) & ~is_digit(data[dot - 2])
+    for offset in range(1, 5):
+        small &= data[dot + offset] == ord('0')
+    return bool(small.any())
+
+
+class OrjsonRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed, byte for byte like the stock renderer.
+
+    orjson already writes compact, UTF-8 JSON like DRF's defaults; the remaining differences are
+    patched up: U+2028/U+2029 are escaped as DRF does, and output that may hold a float the json
+    module writes in exponent form is re-encoded with the json module instead.
+    Indented output requested through the Accept header also goes through the stock renderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            # Dates go through DRF's encoder, which formats them differently from orjson
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if has_exponent_range_floats(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'\xe2\x80' in ret:
+            ret = ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+        return ret
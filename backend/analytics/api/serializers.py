@@ -1,6 +1,13 @@
+import numpy as np
 from rest_framework import serializers
 
-from analytics.models import Trip, RouteStop, DailyLog, LogEntry
+from analytics.export import EXPORT_FORMATS
+from analytics.geometry import MAX_ZOOM
+from analytics.models import Trip, RouteStop, TripWaypoint, TripGeometry, DailyLog, LogEntry
+from analytics.optimize import optimize_stop_order
+from analytics.simulation import DEFAULT_SAMPLES, MAX_SAMPLES
+from analytics.timeline import MAX_TIMELINE_DAYS
+from analytics.util import trip_waypoints
 
 
 class RouteStopSerializer(serializers.ModelSerializer):
@@ -9,6 +16,12 @@ class RouteStopSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class TripWaypointSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TripWaypoint
+        fields = '__all__'
+
+
 class LogEntrySerializer(serializers.ModelSerializer):
     class Meta:
         model = LogEntry
@@ -24,6 +37,7 @@ class DailyLogSerializer(serializers.ModelSerializer):
 
 
 class TripSerializer(serializers.ModelSerializer):
+    waypoints = TripWaypointSerializer(many=True, read_only=True)
     route_stops = RouteStopSerializer(many=True, read_only=True)
     daily_logs = DailyLogSerializer(many=True, read_only=True)
 
@@ -32,17 +46,213 @@ class TripSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class WaypointInputSerializer(serializers.Serializer):
+    stop_type = serializers.ChoiceField(choices=TripWaypoint.STOP_TYPE_CHOICES)
+    location_name = serializers.CharField(max_length=500)
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+    load_id = serializers.CharField(max_length=100, required=False, allow_blank=True)
+
+
 class TripCreateSerializer(serializers.Serializer):
+    """
+    Accepts either the classic pickup/dropoff pair or an ordered list of waypoints.
+    Validated data always carries both: the pickup/dropoff fields mirror the first and last waypoint.
+    With optimize_order, waypoints are resequenced first, keeping each load's pickups before its drops.
+    """
+    MAX_WAYPOINTS = 100
+
     current_location = serializers.CharField(max_length=500)
     current_lat = serializers.FloatField()
     current_lng = serializers.FloatField()
-    pickup_location = serializers.CharField(max_length=500)
-    pickup_lat = serializers.FloatField()
-    pickup_lng = serializers.FloatField()
-    dropoff_location = serializers.CharField(max_length=500)
-    dropoff_lat = serializers.FloatField()
-    dropoff_lng = serializers.FloatField()
+    pickup_location = serializers.CharField(max_length=500, required=False)
+    pickup_lat = serializers.FloatField(required=False)
+    pickup_lng = serializers.FloatField(required=False)
+    dropoff_location = serializers.CharField(max_length=500, required=False)
+    dropoff_lat = serializers.FloatField(required=False)
+    dropoff_lng = serializers.FloatField(required=False)
+    waypoints = WaypointInputSerializer(many=True, required=False)
+    optimize_order = serializers.BooleanField(default=False)
     current_cycle_hours = serializers.FloatField()
     driver_name = serializers.CharField(max_length=200, required=False, allow_blank=True)
     home_terminal = serializers.CharField(max_length=500, required=False, allow_blank=True)
 
+    def validate(self, attrs):
+        waypoints = attrs.get('waypoints')
+        if waypoints:
+            if len(waypoints) > self.MAX_WAYPOINTS:
+                raise serializers.ValidationError(
+                    {'waypoints': f'A trip can have at most {self.MAX_WAYPOINTS} waypoints.'}
+                )
+            if attrs['optimize_order']:
+                waypoints = attrs['waypoints'] = self.optimized(attrs, waypoints)
+            first, last = waypoints[0], waypoints[-1]
+            attrs.update(
+                pickup_location=first['location_name'],
+                pickup_lat=first['latitude'],
+                pickup_lng=first['longitude'],
+                dropoff_location=last['location_name'],
+                dropoff_lat=last['latitude'],
+                dropoff_lng=last['longitude'],
+            )
+            return attrs
+
+        required = ['pickup_location', 'pickup_lat', 'pickup_lng', 'dropoff_location', 'dropoff_lat', 'dropoff_lng']
+        missing = {field: 'This field is required.' for field in required if field not in attrs}
+        if missing:
+            raise serializers.ValidationError(missing)
+
+        attrs['waypoints'] = trip_waypoints(attrs)
+        return attrs
+
+    def optimized(self, attrs, waypoints):
+        pickup_loads = {w['load_id'] for w in waypoints if w.get('load_id') and w['stop_type'] == 'pickup'}
+        orphans = sorted({
+            w['load_id'] for w in waypoints
+            if w.get('load_id') and w['stop_type'] == 'dropoff' and w['load_id'] not in pickup_loads
+        })
+        if orphans:
+            raise serializers.ValidationError(
+                {'waypoints': f'Loads without a pickup: {", ".join(orphans)}.'}
+            )
+        return optimize_stop_order(attrs['current_lat'], attrs['current_lng'], waypoints)
+
+
+class DriverAvailabilityQuerySerializer(serializers.Serializer):
+    pickup_lat = serializers.FloatField(min_value=-90, max_value=90)
+    pickup_lng = serializers.FloatField(min_value=-180, max_value=180)
+    dropoff_lat = serializers.FloatField(min_value=-90, max_value=90)
+    dropoff_lng = serializers.FloatField(min_value=-180, max_value=180)
+    start_within_hours = serializers.FloatField(min_value=0, default=2)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+
+class CoordinateArrayField(serializers.Field):
+    """A list of [lat, lng] pairs, validated and parsed in one shot into an (n, 2) numpy array"""
+    default_error_messages = {
+        'invalid': 'Expected a list of [lat, lng] pairs.',
+        'empty': 'At least one coordinate is required.',
+        'out_of_range': 'Latitudes must be within [-90, 90] and longitudes within [-180, 180].',
+    }
+
+    def to_internal_value(self, data):
+        try:
+            points = np.asarray(data, dtype=np.float64)
+        except (TypeError, ValueError):
+            self.fail('invalid')
+        if points.ndim != 2 or points.shape[1] != 2 or not np.isfinite(points).all():
+            if points.size == 0:
+                self.fail('empty')
+            self.fail('invalid')
+        if (np.abs(points[:, 0]) > 90).any() or (np.abs(points[:, 1]) > 180).any():
+            self.fail('out_of_range')
+        return points
+
+    def to_representation(self, value):
+        return np.asarray(value).tolist()
+
+
+class DistanceMatrixSerializer(serializers.Serializer):
+    # Cells returned in one response, whether as a full matrix or as k nearest per origin
+    MAX_MATRIX_CELLS = 1_000_000
+    # Distances computed for a k query; the chunked top-k keeps memory flat but not time
+    MAX_NEAREST_CELLS = 10_000_000
+
+    origins = CoordinateArrayField()
+    destinations = CoordinateArrayField()
+    k = serializers.IntegerField(min_value=1, max_value=1000, required=False)
+
+    def validate(self, attrs):
+        origins, destinations = len(attrs['origins']), len(attrs['destinations'])
+        if 'k' not in attrs:
+            if origins * destinations > self.MAX_MATRIX_CELLS:
+                raise serializers.ValidationError(
+                    f'At most {self.MAX_MATRIX_CELLS} origin/destination pairs per request; use k for larger sets.'
+                )
+            return attrs
+        if origins * destinations > self.MAX_NEAREST_CELLS:
+            raise serializers.ValidationError(
+                f'At most {self.MAX_NEAREST_CELLS} origin/destination pairs per request with k.'
+            )
+        if origins * min(attrs['k'], destinations) > self.MAX_MATRIX_CELLS:
+            raise serializers.ValidationError(
+                f'At most {self.MAX_MATRIX_CELLS} results per request; lower k or split the origins.'
+            )
+        return attrs
+
+
+class TripReplanSerializer(serializers.Serializer):
+    current_lat = serializers.FloatField(min_value=-90, max_value=90)
+    current_lng = serializers.FloatField(min_value=-180, max_value=180)
+    current_time = serializers.DateTimeField(required=False)
+    hours_since_rest = serializers.FloatField(min_value=0, help_text="On-duty hours since the last 10-hour break")
+    cycle_hours = serializers.FloatField(min_value=0, required=False, help_text="Hours used in the current 8-day cycle")
+    completed_stops = serializers.IntegerField(min_value=0, required=False)
+
+
+class TripPositionSerializer(serializers.Serializer):
+    current_lat = serializers.FloatField(min_value=-90, max_value=90)
+    current_lng = serializers.FloatField(min_value=-180, max_value=180)
+    current_time = serializers.DateTimeField(required=False)
+
+
+class TripGeometrySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TripGeometry
+        fields = ['trip', 'min_zoom', 'tolerance', 'point_count', 'polyline']
+
+
+class GeometryQuerySerializer(serializers.Serializer):
+    zoom = serializers.IntegerField(min_value=0, max_value=MAX_ZOOM, default=0)
+
+
+class SimulationQuerySerializer(serializers.Serializer):
+    samples = serializers.IntegerField(min_value=100, max_value=MAX_SAMPLES, default=DEFAULT_SAMPLES)
+    seed = serializers.IntegerField(min_value=0, required=False, help_text="Makes the run reproducible")
+
+
+class TripsNearQuerySerializer(serializers.Serializer):
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lng = serializers.FloatField(min_value=-180, max_value=180)
+    radius = serializers.FloatField(min_value=0, max_value=1000, default=50, help_text="Miles")
+
+
+class FleetMapQuerySerializer(serializers.Serializer):
+    bbox = serializers.CharField(help_text="west,south,east,north in degrees, as Leaflet's toBBoxString() gives it")
+    zoom = serializers.IntegerField(min_value=0, max_value=MAX_ZOOM)
+
+    def validate_bbox(self, value):
+        try:
+            west, south, east, north = (float(part) for part in value.split(','))
+        except ValueError:
+            raise serializers.ValidationError('Expected four comma-separated numbers: west,south,east,north.')
+        if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+            raise serializers.ValidationError('Expected west <= east within [-180, 180] and south <= north within [-90, 90].')
+        return west, south, east, north
+
+
+class AuditExportQuerySerializer(serializers.Serializer):
+    start = serializers.DateField()
+    end = serializers.DateField()
+    driver_name = serializers.CharField(required=False)
+    format = serializers.ChoiceField(choices=EXPORT_FORMATS, default='pdf')
+    merge = serializers.BooleanField(default=False, help_text="One PDF per driver instead of one file per day")
+
+    def validate(self, data):
+        if data['start'] > data['end']:
+            raise serializers.ValidationError({'end': 'Must not be before start.'})
+        return data
+
+
+class DriverTimelineQuerySerializer(serializers.Serializer):
+    driver_name = serializers.CharField(max_length=200)
+    start = serializers.DateField()
+    end = serializers.DateField(required=False, help_text="Defaults to start")
+
+    def validate(self, data):
+        data.setdefault('end', data['start'])
+        if data['start'] > data['end']:
+            raise serializers.ValidationError({'end': 'Must not be before start.'})
+        if (data['end'] - data['start']).days >= MAX_TIMELINE_DAYS:
+            raise serializers.ValidationError({'end': f'At most {MAX_TIMELINE_DAYS} days can be read at once.'})
+        return data
@@ -1,12 +1,22 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
-from .views import TripViewSet
+from .views import (
+    TripViewSet, DriverAvailabilityView, DistanceMatrixView, DailyLogSheetView, AuditExportView,
+    TripEventsView, FleetMapView, DriverTimelineView,
+)
 
 router = DefaultRouter()
 router.register(r'trips', TripViewSet, basename='trip')
 
 urlpatterns = [
+    path('distance-matrix/', DistanceMatrixView.as_view(), name='distance-matrix'),
+    path('daily-logs/export/', AuditExportView.as_view(), name='daily-log-export'),
+    path('daily-logs/<int:pk>/sheet.<str:fmt>', DailyLogSheetView.as_view(), name='daily-log-sheet'),
+    path('trips/<int:pk>/events/', TripEventsView.as_view(), name='trip-events'),
+    path('fleet/map/', FleetMapView.as_view(), name='fleet-map'),
+    path('drivers/availability/', DriverAvailabilityView.as_view(), name='driver-availability'),
+    path('drivers/timeline/', DriverTimelineView.as_view(), name='driver-timeline'),
     path('', include(router.urls)),
 ]
 
@@ -1,26 +1,122 @@
+import time
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections, transaction
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.views import View
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from analytics.models import Trip, RouteStop
-from .serializers import TripSerializer, TripCreateSerializer, DailyLogSerializer
+from analytics.models import Trip, RouteStop, TripWaypoint, DailyLog
+from .serializers import (
+    TripSerializer, TripCreateSerializer, DriverAvailabilityQuerySerializer,
+    DistanceMatrixSerializer, TripReplanSerializer, TripPositionSerializer, GeometryQuerySerializer, TripGeometrySerializer,
+    TripsNearQuerySerializer, FleetMapQuerySerializer, SimulationQuerySerializer,
+    AuditExportQuerySerializer, DriverTimelineQuerySerializer,
+)
+from .payloads import daily_log_payloads, trip_payload, trip_payloads
+from ..archive import archived_trip_payload
+from ..availability import find_available_drivers, update_driver_status
 from ..constants import TripConstants
-from ..util import generate_route_stops, generate_daily_logs
+from ..corridor import save_trip_corridor, trips_near
+from ..export import AuditExport, async_chunks, audit_logs
+from ..fleet import fleet_map_clusters
+from ..geometry import geometry_for_zoom, save_trip_geometry
+from ..idempotency import idempotent
+from ..live import publish_position, publish_replan, trip_event_stream
+from ..metrics import REQUEST_LATENCY, REQUEST_QUERIES, TRIP_ROUTE_STOPS, render_metrics
+from ..rendering import SHEET_FORMATS, cached_log_sheet
+from ..simulation import simulate_trip
+from ..replan import plan_start, remaining_route, replan_trip
+from ..replicas import current_replica, on_replica, replica_reads
+from ..timeline import driver_timeline, remove_trips_from_timelines
+from ..util import (
+    default_log_start, generate_route_stops, generate_daily_logs, calculate_distance_matrix, nearest_destinations,
+)
+
+
+class MetricsMixin:
+    """Records the latency and database query count of every request, by view and action"""
+
+    def dispatch(self, request, *args, **kwargs):
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(count_query))
+            response = super().dispatch(request, *args, **kwargs)
 
+        view = type(self).__name__
+        action = getattr(self, 'action', None) or request.method.lower()
+        REQUEST_LATENCY.observe(
+            time.perf_counter() - started, view=view, action=action, method=request.method,
+            status=response.status_code,
+        )
+        REQUEST_QUERIES.observe(queries, view=view, action=action)
+        return response
 
-class TripViewSet(viewsets.ModelViewSet):
+
+class TripViewSet(MetricsMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows trips to be viewed or created.
     On creation, it calculates route stops (fuel and rest breaks) and generates daily logs.
+    Reads build the nested payloads from values() rows rather than through TripSerializer;
+    archived trips are still served by id from cold storage. List, retrieve and daily_logs read
+    from a read replica when one is configured.
 
     @api {get} /trips/ List Trips
-    @api {post} /trips/ Create Trip
+    @api {post} /trips/ Create Trip (retries with the same Idempotency-Key header get the first response)
     @api {get} /trips/{id}/ Retrieve Trip
     @api {get} /trips/{id}/daily_logs/ Get Daily Logs for Trip
+    @api {post} /trips/{id}/replan/ Replan Trip from the Driver's Live Position
+    @api {post} /trips/{id}/position/ Report the Driver's Position to Live Progress Streams
+    @api {get} /trips/{id}/geometry/?zoom= Get Route Polyline Simplified for a Map Zoom
+    @api {get} /trips/{id}/simulation/?samples=&seed= Get Monte Carlo ETA Percentiles and 10-Hour Reset Risk
+    @api {get} /trips/near/?lat=&lng=&radius= List Trips Whose Route Passes Within radius Miles of a Point
     """
     queryset = Trip.objects.all()
     serializer_class = TripSerializer
 
+    @replica_reads
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            payloads = {p['id']: p for p in trip_payloads(Trip.objects.filter(pk__in=[trip.pk for trip in page]))}
+            return self.get_paginated_response([payloads[trip.pk] for trip in page])
+        return Response(trip_payloads(queryset))
+
+    @replica_reads
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            trip = self.get_object()
+        except Http404:
+            return Response(self.get_archived_payload())
+        return Response(trip_payload(trip.pk))
+
+    def get_archived_payload(self):
+        """The stored payload of a trip moved to cold storage, so archived trips stay readable by id"""
+        try:
+            payload = archived_trip_payload(int(self.kwargs['pk']))
+        except ValueError:
+            payload = None
+        if payload is None:
+            raise Http404
+        return payload
+
+    @idempotent
     def create(self, request, *args, **kwargs):
         serializer = TripCreateSerializer(data=request.data)
         if serializer.is_valid():
@@ -28,39 +124,300 @@ class TripViewSet(viewsets.ModelViewSet):
 
             route_stops, total_distance, total_time = generate_route_stops(trip_data)
 
-            trip = Trip.objects.create(
-                driver_name=trip_data['driver_name'],
-                current_location=trip_data['current_location'],
-                current_lat=trip_data['current_lat'],
-                current_lng=trip_data['current_lng'],
-                pickup_location=trip_data['pickup_location'],
-                pickup_lat=trip_data['pickup_lat'],
-                pickup_lng=trip_data['pickup_lng'],
-                dropoff_location=trip_data['dropoff_location'],
-                dropoff_lat=trip_data['dropoff_lat'],
-                dropoff_lng=trip_data['dropoff_lng'],
-                current_cycle_hours=trip_data['current_cycle_hours'],
-                total_distance=total_distance,
-                estimated_drive_time=total_distance / TripConstants.AVERAGE_SPEED_MILES_PER_HOUR,
-                total_trip_time=total_time,
-                fuel_stops_needed=len([s for s in route_stops if s['stop_type'] == 'fuel']),
-                rest_breaks_needed=len([s for s in route_stops if s['stop_type'] == 'rest'])
-            )
-
-            for stop_data in route_stops:
-                RouteStop.objects.create(trip=trip, **stop_data)
-
-            generate_daily_logs(trip, route_stops)
+            with transaction.atomic():
+                trip = self.persist_trip(trip_data, route_stops, total_distance, total_time)
 
             response_serializer = TripSerializer(trip)
             return Response(response_serializer.data, status=status.HTTP_201_CREATED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def persist_trip(self, trip_data, route_stops, total_distance, total_time):
+        """Write a planned trip with its waypoints, route stops and daily logs"""
+        trip = Trip.objects.create(
+            driver_name=trip_data.get('driver_name'),
+            current_location=trip_data['current_location'],
+            current_lat=trip_data['current_lat'],
+            current_lng=trip_data['current_lng'],
+            pickup_location=trip_data['pickup_location'],
+            pickup_lat=trip_data['pickup_lat'],
+            pickup_lng=trip_data['pickup_lng'],
+            dropoff_location=trip_data['dropoff_location'],
+            dropoff_lat=trip_data['dropoff_lat'],
+            dropoff_lng=trip_data['dropoff_lng'],
+            current_cycle_hours=trip_data['current_cycle_hours'],
+            total_distance=total_distance,
+            estimated_drive_time=total_distance / TripConstants.AVERAGE_SPEED_MILES_PER_HOUR,
+            total_trip_time=total_time,
+            fuel_stops_needed=len([s for s in route_stops if s['stop_type'] == 'fuel']),
+            rest_breaks_needed=len([s for s in route_stops if s['stop_type'] == 'rest'])
+        )
+
+        TripWaypoint.objects.bulk_create(
+            TripWaypoint(trip=trip, order=order, **waypoint)
+            for order, waypoint in enumerate(trip_data['waypoints'], start=1)
+        )
+        RouteStop.objects.bulk_create(RouteStop(trip=trip, **stop_data) for stop_data in route_stops)
+        TRIP_ROUTE_STOPS.observe(len(route_stops))
+
+        # The logs and the driver's availability share one start, so the driver frees up when the logs end
+        start = default_log_start()
+        generate_daily_logs(trip, route_stops, start)
+        save_trip_geometry(trip, route_stops)
+        save_trip_corridor(trip, route_stops)
+        available_at = timezone.make_aware(start) + timedelta(hours=total_time)
+        update_driver_status(trip, route_stops, total_time, trip_data, available_at=available_at)
+        return trip
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            remove_trips_from_timelines([instance.pk])
+            instance.delete()
+
     @action(detail=True, methods=['get'])
+    @replica_reads
     def daily_logs(self, request, pk=None):
         """Get daily logs for a specific trip"""
+        try:
+            trip = self.get_object()
+        except Http404:
+            return Response(self.get_archived_payload()['daily_logs'])
+        return Response(daily_log_payloads(trip.daily_logs.all()))
+
+    @action(detail=True, methods=['post'])
+    def replan(self, request, pk=None):
+        """Keep the completed part of a trip and re-plan the rest from the driver's position"""
+        trip = self.get_object()
+        serializer = TripReplanSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        changes = replan_trip(trip, **serializer.validated_data)
+        publish_replan(trip, changes)
+        return Response(TripSerializer(trip).data)
+
+    @action(detail=True, methods=['post'])
+    def position(self, request, pk=None):
+        """Publish the driver's position, the stop reached and the duty status to the trip's event streams"""
+        trip = self.get_object()
+        serializer = TripPositionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        progress = publish_position(
+            trip, data['current_lat'], data['current_lng'], data.get('current_time') or timezone.now()
+        )
+        return Response(progress)
+
+    @action(detail=True, methods=['get'])
+    def geometry(self, request, pk=None):
+        """Get the encoded route polyline with only the detail a map at this zoom can show"""
         trip = self.get_object()
-        daily_logs = trip.daily_logs.all()
-        serializer = DailyLogSerializer(daily_logs, many=True)
-        return Response(serializer.data)
+        serializer = GeometryQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        geometry = geometry_for_zoom(trip, serializer.validated_data['zoom'])
+        return Response(TripGeometrySerializer(geometry).data)
+
+    @action(detail=True, methods=['get'])
+    def simulation(self, request, pk=None):
+        """Sample speeds and dwell times to put percentiles and the odds of an extra 10-hour reset on the plan"""
+        trip = self.get_object()
+        serializer = SimulationQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # After a replan the stored stops ahead were planned from the replan's position and driver state
+        origin, waypoints, completed_rests = remaining_route(trip)
+        result = simulate_trip(
+            origin['latitude'], origin['longitude'], waypoints,
+            hours_since_rest=origin['hours_since_rest'], miles_since_fuel=origin['miles_since_fuel'],
+            elapsed_hours=origin['elapsed_hours'], completed_rests=completed_rests, **serializer.validated_data,
+        )
+        # Hours count from the plan start, as total_trip_time does
+        start = timezone.make_aware(plan_start(trip))
+        result['eta'] = {
+            percentile: start + timedelta(hours=hours) for percentile, hours in result['arrival_hours'].items()
+        }
+        return Response(result)
+
+    @action(detail=False, methods=['get'])
+    def near(self, request):
+        """Trips whose route passes near a point (e.g. a closure), nearest first, pruned by corridor cells"""
+        serializer = TripsNearQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        query = serializer.validated_data
+        matches = trips_near(query['lat'], query['lng'], query['radius'])
+        trips = Trip.objects.in_bulk([trip_id for trip_id, _ in matches])
+        return Response([
+            {
+                'id': trip_id,
+                'driver_name': trips[trip_id].driver_name,
+                'pickup_location': trips[trip_id].pickup_location,
+                'dropoff_location': trips[trip_id].dropoff_location,
+                'created_at': trips[trip_id].created_at,
+                'distance_miles': round(distance, 3),
+            }
+            for trip_id, distance in matches
+        ])
+
+
+class TripEventsView(View):
+    """
+    Server-Sent Events stream of a trip's live progress; served by the ASGI application.
+
+    @api {get} /trips/{id}/events/ Stream Position, Stop Reached, Duty Status and Replan Events
+    """
+
+    async def get(self, request, pk):
+        if not await Trip.objects.filter(pk=pk).aexists():
+            raise Http404
+        response = StreamingHttpResponse(trip_event_stream(pk), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class DriverAvailabilityView(MetricsMixin, APIView):
+    """
+    API endpoint that ranks drivers who can legally run a load without a 10-hour reset.
+
+    @api {get} /drivers/availability/?pickup_lat=&pickup_lng=&dropoff_lat=&dropoff_lng=&start_within_hours=&limit=
+    """
+
+    def get(self, request):
+        serializer = DriverAvailabilityQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        load_miles, candidates = find_available_drivers(**serializer.validated_data)
+        return Response({'load_miles': load_miles, 'candidates': candidates})
+
+
+class DriverTimelineView(MetricsMixin, APIView):
+    """
+    API endpoint that returns a driver's full 24-hour duty timeline per day, merged across all of their
+    trips (where trips overlap the later one wins) and read from the materialized day timelines.
+
+    @api {get} /drivers/timeline/?driver_name=&start=&end= Get a Driver's Merged Duty Timeline
+    """
+
+    @replica_reads
+    def get(self, request):
+        serializer = DriverTimelineQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        query = serializer.validated_data
+        return Response({
+            'driver_name': query['driver_name'],
+            'days': driver_timeline(query['driver_name'], query['start'], query['end']),
+        })
+
+
+class FleetMapView(MetricsMixin, APIView):
+    """
+    API endpoint that clusters the route stops of all active trips for a fleet map viewport.
+
+    @api {get} /fleet/map/?bbox=west,south,east,north&zoom= Get Clustered Active Stops for a Map View
+    """
+
+    def get(self, request):
+        serializer = FleetMapQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        west, south, east, north = serializer.validated_data['bbox']
+        zoom, clusters = fleet_map_clusters(west, south, east, north, serializer.validated_data['zoom'])
+        return Response({'zoom': zoom, 'clusters': clusters})
+
+
+class DistanceMatrixView(MetricsMixin, APIView):
+    """
+    API endpoint for many-to-many distances between origins and destinations (in miles).
+    Without k it returns the full matrix; with k only the k nearest destinations per origin.
+
+    @api {post} /distance-matrix/ Compute Distance Matrix
+    """
+
+    def post(self, request):
+        serializer = DistanceMatrixSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        origins = serializer.validated_data['origins']
+        destinations = serializer.validated_data['destinations']
+        k = serializer.validated_data.get('k')
+
+        if k is None:
+            matrix = calculate_distance_matrix(origins, destinations)
+            return Response({'distances': matrix.round(3).tolist()})
+
+        indices, distances = nearest_destinations(origins, destinations, k)
+        return Response({'indices': indices.tolist(), 'distances': distances.round(3).tolist()})
+
+
+class DailyLogSheetView(MetricsMixin, APIView):
+    """
+    API endpoint that renders a daily log as a printable grid log sheet, cached until the log changes.
+
+    @api {get} /daily-logs/{id}/sheet.svg Get Log Sheet as SVG
+    @api {get} /daily-logs/{id}/sheet.pdf Get Log Sheet as PDF
+    """
+
+    def get(self, request, pk, fmt):
+        if fmt not in SHEET_FORMATS:
+            raise Http404
+        daily_log = get_object_or_404(DailyLog, pk=pk)
+
+        response = HttpResponse(cached_log_sheet(daily_log, fmt), content_type=SHEET_FORMATS[fmt])
+        response['Content-Disposition'] = f'inline; filename="daily-log-{daily_log.date}-{daily_log.pk}.{fmt}"'
+        return response
+
+
+class AuditExportView(MetricsMixin, APIView):
+    """
+    API endpoint that streams the log sheets of a date range as a ZIP while they are rendered.
+    The archive ends with an export.json holding the sheet count and throughput.
+
+    @api {get} /daily-logs/export/?start=&end=&driver_name=&format=pdf|svg&merge= Export Log Sheets
+    """
+
+    @replica_reads
+    def get(self, request):
+        serializer = AuditExportQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        params = serializer.validated_data
+        export = AuditExport(
+            audit_logs(params['start'], params['end'], params.get('driver_name')),
+            fmt=params['format'], merge=params['merge'],
+        )
+        chunks = export.stream_chunks()
+        replica = current_replica()
+        if replica is not None:
+            chunks = on_replica(chunks, replica)
+        if isinstance(request._request, ASGIRequest):
+            # A synchronous iterator would be read to the end before ASGI sends the first byte
+            chunks = async_chunks(chunks)
+        response = StreamingHttpResponse(chunks, content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="daily-logs-{params["start"]}-{params["end"]}.zip"'
+        response['X-Sheet-Count'] = str(len(export.log_ids))
+        return response
+
+
+class MetricsView(APIView):
+    """
+    Prometheus scrape endpoint: request latency and query counts, planner timings, per-trip output
+    sizes and cache hit/miss counts, summed over all worker processes.
+
+    @api {get} /metrics Get Metrics in the Prometheus Text Format
+    """
+
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
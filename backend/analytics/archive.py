@@ -0,0 +1,170 @@
+"""
+Cold storage for old trips.
+
+Trips are moved out of the database in batches, each batch appended as one gzip member per month to
+``ARCHIVE_DIR/trips-YYYY-MM.jsonl.gz`` (one trip payload per line, as the API serves it). An indexed
+ArchivedTrip row records which member holds each trip, so a read decompresses only that member.
+The archive file is written and synced before the trips are deleted, so a crash in between leaves the
+trips hot and the next run archives them again.
+"""
+import gzip
+import json
+import os
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from .api.payloads import trip_payloads
+from .corridor import save_trip_corridor
+from .geometry import save_trip_geometry
+from .models import ArchivedTrip, DailyLog, LogEntry, RouteStop, Trip, TripWaypoint
+from .purge import purge_chunk
+
+ARCHIVE_BATCH_SIZE = 200
+
+
+def archive_path(archive_file):
+    return os.path.join(settings.ARCHIVE_DIR, archive_file)
+
+
+def archive_file_for(created_at):
+    return f'trips-{created_at:%Y-%m}.jsonl.gz'
+
+
+def append_member(archive_file, payloads):
+    """Append payloads as one gzip member; return its offset and length"""
+    os.makedirs(settings.ARCHIVE_DIR, exist_ok=True)
+    renderer = JSONRenderer()
+    member = gzip.compress(b''.join(renderer.render(payload) + b'\n' for payload in payloads))
+    with open(archive_path(archive_file), 'ab') as f:
+        offset = f.seek(0, os.SEEK_END)
+        f.write(member)
+        f.flush()
+        os.fsync(f.fileno())
+    return offset, len(member)
+
+
+def read_member(archive_file, offset, length):
+    """The trip payloads of one gzip member"""
+    with open(archive_path(archive_file), 'rb') as f:
+        f.seek(offset)
+        member = f.read(length)
+    return [json.loads(line) for line in gzip.decompress(member).splitlines()]
+
+
+def archive_batch(trips):
+    """Write one batch of trips to their monthly archive files, index them and delete them from the database"""
+    payloads = trip_payloads(trips)
+    rows = {row['id']: row for row in trips.values('id', 'driver_name', 'created_at')}
+
+    by_file = defaultdict(list)
+    for payload in payloads:
+        by_file[archive_file_for(rows[payload['id']]['created_at'])].append(payload)
+
+    index = []
+    for archive_file, members in by_file.items():
+        offset, length = append_member(archive_file, members)
+        index.extend(
+            ArchivedTrip(
+                trip_id=payload['id'], driver_name=rows[payload['id']]['driver_name'] or '',
+                trip_created_at=rows[payload['id']]['created_at'], archive_file=archive_file,
+                offset=offset, length=length,
+            )
+            for payload in members
+        )
+
+    trip_ids = list(rows)
+    with transaction.atomic():
+        # A trip archived before, restored and archived again points at its newest copy
+        ArchivedTrip.objects.filter(trip_id__in=trip_ids).delete()
+        ArchivedTrip.objects.bulk_create(index)
+        purge_chunk(trip_ids)
+    return len(trip_ids)
+
+
+def archive_trips(before, batch_size=ARCHIVE_BATCH_SIZE):
+    """Archive every trip created before a cutoff, batch by batch; yields the running count"""
+    archived = 0
+    while True:
+        batch_ids = list(
+            Trip.objects.filter(created_at__lt=before).order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not batch_ids:
+            return
+        archived += archive_batch(Trip.objects.filter(pk__in=batch_ids).order_by('id'))
+        yield archived
+
+
+def archived_trip_payload(trip_id):
+    """The payload of an archived trip, exactly as the API served it before archival; None if not archived"""
+    entry = ArchivedTrip.objects.filter(trip_id=trip_id).first()
+    if entry is None:
+        return None
+    for payload in read_member(entry.archive_file, entry.offset, entry.length):
+        if payload['id'] == trip_id:
+            return payload
+    return None
+
+
+def model_values(model, payload):
+    """Model field values (by attname) parsed back from a payload's serialized representation.
+
+    Fields added after the payload was archived are left out, so they get their defaults.
+    """
+    return {
+        field.attname: field.to_python(payload[field.name])
+        for field in model._meta.concrete_fields if field.name in payload
+    }
+
+
+TIMESTAMP_FIELDS = ['created_at', 'updated_at']
+
+
+def restore_payload(payload):
+    """Recreate a trip and its children with their original ids and timestamps"""
+    # auto_now/auto_now_add stamp the current time on insert, so the archived timestamps are put back after
+    trip = Trip(**model_values(Trip, payload))
+    trip_timestamps = {field: getattr(trip, field) for field in TIMESTAMP_FIELDS}
+    trip.save(force_insert=True)
+    Trip.objects.filter(pk=trip.pk).update(**trip_timestamps)
+
+    TripWaypoint.objects.bulk_create(TripWaypoint(**model_values(TripWaypoint, w)) for w in payload['waypoints'])
+    RouteStop.objects.bulk_create(RouteStop(**model_values(RouteStop, s)) for s in payload['route_stops'])
+    save_trip_geometry(trip, payload['route_stops'])
+    save_trip_corridor(trip, payload['route_stops'])
+
+    log_values = [model_values(DailyLog, log) for log in payload['daily_logs']]
+    logs = DailyLog.objects.bulk_create(DailyLog(**values) for values in log_values)
+    for log, values in zip(logs, log_values):
+        for field in TIMESTAMP_FIELDS:
+            setattr(log, field, values[field])
+    DailyLog.objects.bulk_update(logs, TIMESTAMP_FIELDS)
+    entry_values = [model_values(LogEntry, entry) for log in payload['daily_logs'] for entry in log['entries']]
+    entries = LogEntry.objects.bulk_create(LogEntry(**values) for values in entry_values)
+    # Archives written before entries had updated_at keep the restore time
+    stamped = []
+    for entry, values in zip(entries, entry_values):
+        if 'updated_at' in values:
+            entry.updated_at = values['updated_at']
+            stamped.append(entry)
+    LogEntry.objects.bulk_update(stamped, ['updated_at'])
+
+
+def restore_trips(entries):
+    """Move archived trips back into the database, decompressing each archive member once"""
+    members = defaultdict(list)
+    for entry in entries:
+        members[(entry.archive_file, entry.offset, entry.length)].append(entry.trip_id)
+
+    restored = 0
+    for (archive_file, offset, length), trip_ids in members.items():
+        wanted = set(trip_ids)
+        payloads = [p for p in read_member(archive_file, offset, length) if p['id'] in wanted]
+        with transaction.atomic():
+            for payload in payloads:
+                restore_payload(payload)
+            ArchivedTrip.objects.filter(trip_id__in=trip_ids).delete()
+        restored += len(payloads)
+    return restored
@@ -0,0 +1,195 @@
+import threading
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .constants import TripConstants, HOSConstants
+from .metrics import CACHE_REQUESTS
+from .models import DriverStatus
+from .util import calculate_distance, calculate_distances, generate_route_stops, plan_start
+
+# Off-duty time that restarts the 70-hour cycle
+CYCLE_RESTART_HOURS = 34
+# How many drivers that pass the full planner are ranked per returned candidate
+SHORTLIST_FACTOR = 3
+
+
+def driver_state_after_trip(trip_data, route_stops, total_time):
+    """Derive the driver's HOS state at the end of a planned trip"""
+    last_rest = None
+    for index, stop in enumerate(route_stops):
+        if stop['stop_type'] == 'rest':
+            last_rest = index
+
+    if last_rest is None:
+        initial = trip_data.get('hours_since_rest', trip_data['current_cycle_hours'] % HOSConstants.MAX_DRIVING_HOURS)
+        hours_since_rest = initial + total_time
+    else:
+        rest = route_stops[last_rest]
+        hours_since_rest = total_time - (rest['cumulative_hours'] + rest['duration_hours'])
+
+    rest_hours = sum(s['duration_hours'] for s in route_stops if s['stop_type'] == 'rest')
+    cycle_used = trip_data['current_cycle_hours'] + total_time - rest_hours
+
+    return {
+        'hours_since_rest': hours_since_rest,
+        'remaining_drive_hours': max(0.0, HOSConstants.MAX_DRIVING_HOURS - hours_since_rest),
+        'remaining_window_hours': max(0.0, HOSConstants.MAX_DUTY_WINDOW_HOURS - hours_since_rest),
+        'remaining_cycle_hours': max(0.0, HOSConstants.MAX_CYCLE_HOURS - cycle_used),
+    }
+
+
+def update_driver_status(trip, route_stops, total_time, trip_data, available_at=None):
+    """Refresh the driver status index row for the driver of a freshly planned (or replanned) trip.
+
+    available_at defaults to the end of the trip as its daily logs lay it out (from plan_start).
+    """
+    if not trip.driver_name:
+        return None
+    if available_at is None:
+        available_at = timezone.make_aware(plan_start(trip)) + timedelta(hours=total_time)
+
+    last_stop = route_stops[-1]
+    status, _ = DriverStatus.objects.update_or_create(
+        driver_name=trip.driver_name,
+        defaults={
+            'location': last_stop['location_name'],
+            'latitude': last_stop['latitude'],
+            'longitude': last_stop['longitude'],
+            'available_at': available_at,
+            'last_trip': trip,
+            **driver_state_after_trip(trip_data, route_stops, total_time),
+        }
+    )
+    return status
+
+
+class DriverStatusIndex:
+    """Column-oriented, in-memory copy of the DriverStatus table for vectorized filtering"""
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        self.ids = np.array([r['id'] for r in rows], dtype=np.int64)
+        self.driver_names = [r['driver_name'] for r in rows]
+        self.locations = [r['location'] for r in rows]
+        self.latitudes = np.array([r['latitude'] for r in rows], dtype=np.float64)
+        self.longitudes = np.array([r['longitude'] for r in rows], dtype=np.float64)
+        self.available_at = np.array([r['available_at'].timestamp() for r in rows], dtype=np.float64)
+        self.hours_since_rest = np.array([r['hours_since_rest'] for r in rows], dtype=np.float64)
+        self.remaining_drive = np.array([r['remaining_drive_hours'] for r in rows], dtype=np.float64)
+        self.remaining_window = np.array([r['remaining_window_hours'] for r in rows], dtype=np.float64)
+        self.remaining_cycle = np.array([r['remaining_cycle_hours'] for r in rows], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_queryset(cls, queryset=None, version=None):
+        queryset = DriverStatus.objects.all() if queryset is None else queryset
+        rows = queryset.values(
+            'id', 'driver_name', 'location', 'latitude', 'longitude', 'available_at', 'hours_since_rest',
+            'remaining_drive_hours', 'remaining_window_hours', 'remaining_cycle_hours',
+        )
+        return cls(list(rows), version=version)
+
+    def hos_at(self, start_timestamps):
+        """Project each driver's remaining hours to their start times, applying 10h and 34h resets"""
+        off_duty = np.maximum(0.0, (start_timestamps - self.available_at) / 3600)
+        rested = off_duty >= HOSConstants.REQUIRED_REST_HOURS
+        restarted = off_duty >= CYCLE_RESTART_HOURS
+
+        hours_since_rest = np.where(rested, 0.0, self.hours_since_rest)
+        drive = np.where(rested, HOSConstants.MAX_DRIVING_HOURS, self.remaining_drive)
+        window = np.where(rested, HOSConstants.MAX_DUTY_WINDOW_HOURS, self.remaining_window)
+        cycle = np.where(restarted, HOSConstants.MAX_CYCLE_HOURS, self.remaining_cycle)
+        return hours_since_rest, drive, window, cycle
+
+
+_index_lock = threading.Lock()
+_index = None
+
+
+def get_driver_status_index():
+    """Return the process-wide index, rebuilding it only when the DriverStatus table has changed"""
+    global _index
+    state = DriverStatus.objects.aggregate(count=Count('id'), latest=Max('updated_at'))
+    version = (state['count'], state['latest'])
+
+    with _index_lock:
+        stale = _index is None or _index.version != version
+        CACHE_REQUESTS.inc(cache='driver_status_index', result='miss' if stale else 'hit')
+        if stale:
+            _index = DriverStatusIndex.from_queryset(version=version)
+        return _index
+
+
+def find_available_drivers(pickup_lat, pickup_lng, dropoff_lat, dropoff_lng, start_within_hours=2,
+                           limit=10, now=None, index=None):
+    """Rank drivers who can run a load without a 10-hour reset.
+
+    A vectorized filter over the whole index removes drivers who are too far out or lack the hours,
+    then the survivors get a full generate_route_stops pass in deadhead order, closest first, until
+    limit * SHORTLIST_FACTOR of them are confirmed to need no rest; those are ranked.
+    """
+    now = now or timezone.now()
+    index = get_driver_status_index() if index is None else index
+    load_miles = calculate_distance(pickup_lat, pickup_lng, dropoff_lat, dropoff_lng)
+    if not len(index):
+        return load_miles, []
+
+    now_ts = now.timestamp()
+    starts = np.maximum(index.available_at, now_ts)
+    hours_since_rest, drive, window, cycle = index.hos_at(starts)
+
+    deadhead = calculate_distances(index.latitudes, index.longitudes, pickup_lat, pickup_lng)
+    drive_needed = (deadhead + load_miles) / TripConstants.AVERAGE_SPEED_MILES_PER_HOUR
+    duty_needed = drive_needed + 2 * HOSConstants.STOP_DURATION_HOURS
+
+    eligible = (
+        (starts <= now_ts + start_within_hours * 3600)
+        & (drive >= drive_needed)
+        & (window >= duty_needed)
+        & (cycle >= duty_needed)
+    )
+    shortlist = np.flatnonzero(eligible)
+    shortlist = shortlist[np.argsort(deadhead[shortlist], kind='stable')]
+
+    candidates = []
+    for i in shortlist:
+        if len(candidates) >= limit * SHORTLIST_FACTOR:
+            break
+        trip_data = {
+            'current_lat': index.latitudes[i],
+            'current_lng': index.longitudes[i],
+            'pickup_location': 'Pickup',
+            'pickup_lat': pickup_lat,
+            'pickup_lng': pickup_lng,
+            'dropoff_location': 'Dropoff',
+            'dropoff_lat': dropoff_lat,
+            'dropoff_lng': dropoff_lng,
+            'current_cycle_hours': HOSConstants.MAX_CYCLE_HOURS - cycle[i],
+            'hours_since_rest': hours_since_rest[i],
+        }
+        route_stops, _, total_time = generate_route_stops(trip_data)
+        if any(stop['stop_type'] == 'rest' for stop in route_stops):
+            continue
+
+        start_delay = (starts[i] - now_ts) / 3600
+        candidates.append({
+            'driver_name': index.driver_names[i],
+            'location': index.locations[i],
+            'latitude': float(index.latitudes[i]),
+            'longitude': float(index.longitudes[i]),
+            'deadhead_miles': float(deadhead[i]),
+            'available_in_hours': float(start_delay),
+            'remaining_drive_hours': float(drive[i]),
+            'remaining_window_hours': float(window[i]),
+            'remaining_cycle_hours': float(cycle[i]),
+            'fuel_stops_needed': sum(1 for stop in route_stops if stop['stop_type'] == 'fuel'),
+            'hours_to_dropoff': float(start_delay + total_time),
+        })
+
+    candidates.sort(key=lambda c: (c['hours_to_dropoff'], c['deadhead_miles']))
+    return load_miles, candidates[:limit]
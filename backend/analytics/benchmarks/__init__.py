@@ -0,0 +1,70 @@
+"""
+Micro-benchmarks for the planning hot paths, run with ``python manage.py benchmark [suite ...]``.
+
+Each suite is a function registered with ``@benchmark`` that returns a list of result rows (dicts).
+Suites that write run inside ``scratch_environment()``.
+"""
+import tempfile
+import time
+from contextlib import contextmanager
+
+SUITES = {}
+
+
+def benchmark(name):
+    """Register a benchmark suite under ``name``"""
+    def decorator(func):
+        SUITES[name] = func
+        return func
+    return decorator
+
+
+def measure(func, repeat=5, number=1):
+    """Best wall-clock time in seconds of ``number`` calls to ``func``, over ``repeat`` rounds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+@contextmanager
+def scratch_environment():
+    """A throwaway migrated test database, a temporary planning cache and untouched process state.
+
+    Everything a suite writes (rows, cached plans, the driver status and fleet indexes, metrics) is
+    discarded afterwards, so suites run on any checkout without touching the configured database or
+    the caches and metrics the web workers share.
+    """
+    from django.conf import settings
+    from django.test.runner import DiscoverRunner
+    from django.test.utils import override_settings
+
+    from .. import availability, fleet, metrics
+
+    saved_indexes = availability._index, fleet._index
+    saved_metrics = {name: dict(metric.values) for name, metric in metrics.REGISTRY.items()}
+    runner = DiscoverRunner(verbosity=0, interactive=False)
+    with tempfile.TemporaryDirectory(prefix='benchmark-planning-') as cache_dir:
+        caches = {**settings.CACHES, 'planning': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': cache_dir,
+            'TIMEOUT': None,
+        }}
+        with override_settings(CACHES=caches, METRICS_DIR=None):
+            old_config = runner.setup_databases()
+            try:
+                yield
+            finally:
+                runner.teardown_databases(old_config)
+                availability._index, fleet._index = saved_indexes
+                for name, values in saved_metrics.items():
+                    metrics.REGISTRY[name].values = values
+
+
+def load_suites():
+    """Import the suite modules so their ``@benchmark`` registrations run"""
+    from . import distance_matrix, optimizer, planner, rendering, serialization  # noqa: F401
+    return SUITES
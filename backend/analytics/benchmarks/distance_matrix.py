@@ -0,0 +1,38 @@
+import numpy as np
+
+from . import benchmark, measure
+from ..util import calculate_distance, calculate_distance_matrix, nearest_destinations
+
+
+def random_points(count, seed):
+    rng = np.random.default_rng(seed)
+    return np.column_stack([rng.uniform(25, 49, count), rng.uniform(-124, -67, count)])
+
+
+@benchmark('distance_matrix')
+def distance_matrix_suite():
+    """Many-to-many Haversine throughput: full matrix and k-nearest, against the scalar loop"""
+    rows = []
+
+    origins, destinations = random_points(200, 0), random_points(200, 1)
+    seconds = measure(lambda: [
+        calculate_distance(o[0], o[1], d[0], d[1]) for o in origins.tolist() for d in destinations.tolist()
+    ], repeat=3)
+    rows.append({'mode': 'scalar loop', 'origins': 200, 'destinations': 200, 'k': '-',
+                 'seconds': round(seconds, 4), 'pairs_per_second': f'{200 * 200 / seconds:,.0f}'})
+
+    for count_o, count_d, k in ((1000, 1000, None), (2000, 5000, None), (2000, 5000, 10), (5000, 10000, 10)):
+        origins, destinations = random_points(count_o, 0), random_points(count_d, 1)
+        if k is None:
+            seconds = measure(lambda: calculate_distance_matrix(origins, destinations), repeat=3)
+        else:
+            seconds = measure(lambda: nearest_destinations(origins, destinations, k), repeat=3)
+        rows.append({
+            'mode': 'matrix' if k is None else 'k-nearest',
+            'origins': count_o,
+            'destinations': count_d,
+            'k': k or '-',
+            'seconds': round(seconds, 4),
+            'pairs_per_second': f'{count_o * count_d / seconds:,.0f}',
+        })
+    return rows
@@ -0,0 +1,50 @@
+import random
+import time
+
+from . import benchmark
+from ..optimize import StopOrderOptimizer, precedence_constraints, waypoint_distance_matrix
+
+
+def random_loads(stop_count, seed=0):
+    """Pickup/drop pairs scattered over the continental US"""
+    rng = random.Random(seed)
+    waypoints = []
+    for load in range(stop_count // 2):
+        for stop_type in ('pickup', 'dropoff'):
+            waypoints.append({
+                'stop_type': stop_type,
+                'location_name': f'Load {load} {stop_type}',
+                'latitude': rng.uniform(30, 47),
+                'longitude': rng.uniform(-120, -75),
+                'load_id': str(load),
+            })
+    return waypoints
+
+
+@benchmark('optimizer')
+def optimizer_suite():
+    """Stop-order optimization on 10 to 100 stop pickup/drop instances (1 s budget)"""
+    rows = []
+    for count in (10, 20, 50, 100):
+        waypoints = random_loads(count)
+        matrix = waypoint_distance_matrix(40.7128, -74.0060, waypoints)
+        optimizer = StopOrderOptimizer(matrix, precedence_constraints(waypoints), time_budget=1.0)
+
+        start = time.perf_counter()
+        optimizer.deadline = start + optimizer.time_budget
+        as_given = optimizer.path_length(list(range(1, count + 1)))
+        greedy = optimizer.path_length(optimizer.greedy_tour())
+        tour = [node + 1 for node in optimizer.solve()]
+        elapsed = time.perf_counter() - start
+
+        optimized = optimizer.path_length(tour)
+        rows.append({
+            'stops': count,
+            'as_given_miles': round(as_given),
+            'greedy_miles': round(greedy),
+            'optimized_miles': round(optimized),
+            'saved_pct': round(100 * (1 - optimized / as_given), 1),
+            'feasible': optimizer.is_feasible(tour),
+            'seconds': round(elapsed, 3),
+        })
+    return rows
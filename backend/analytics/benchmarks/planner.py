@@ -0,0 +1,54 @@
+import random
+
+from . import benchmark, measure
+from ..simulation import simulate_trip
+from ..util import plan_route
+
+
+def random_waypoints(count, seed=0):
+    """Waypoints scattered over the continental US, alternating pickups and drops"""
+    rng = random.Random(seed)
+    return [
+        {
+            'stop_type': 'pickup' if i % 2 == 0 else 'dropoff',
+            'location_name': f'Stop {i + 1}',
+            'latitude': rng.uniform(30, 47),
+            'longitude': rng.uniform(-120, -75),
+        }
+        for i in range(count)
+    ]
+
+
+@benchmark('planner')
+def planner_suite():
+    """Single-pass planner cost for trips with 2 to 50 waypoints"""
+    rows = []
+    for count in (2, 5, 10, 20, 50):
+        waypoints = random_waypoints(count)
+        route_stops, total_distance, _ = plan_route(40.7128, -74.0060, waypoints)
+        seconds = measure(lambda: plan_route(40.7128, -74.0060, waypoints), number=20)
+        rows.append({
+            'waypoints': count,
+            'route_stops': len(route_stops),
+            'miles': round(total_distance),
+            'ms_per_plan': round(seconds * 1000, 3),
+        })
+    return rows
+
+
+@benchmark('simulation')
+def simulation_suite():
+    """Monte Carlo ETA simulation cost per trip for 10k samples, against the single deterministic plan"""
+    rows = []
+    for count in (2, 5, 10, 20):
+        waypoints = random_waypoints(count)
+        seconds = measure(lambda: simulate_trip(40.7128, -74.0060, waypoints, samples=10000, seed=0))
+        result = simulate_trip(40.7128, -74.0060, waypoints, samples=10000, seed=0)
+        rows.append({
+            'waypoints': count,
+            'planned_hours': result['planned']['total_trip_time'],
+            'p95_hours': result['total_trip_time']['p95'],
+            'extra_reset_probability': result['extra_reset_probability'],
+            'ms_per_10k_samples': round(seconds * 1000, 3),
+        })
+    return rows
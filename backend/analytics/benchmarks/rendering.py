@@ -0,0 +1,42 @@
+from datetime import date, datetime, time
+
+from . import benchmark, measure
+from ..rendering import render_pdf, render_svg
+
+
+def synthetic_sheet(entry_count):
+    """A log sheet of alternating driving and on-duty entries spread over the day"""
+    minutes = 24 * 60 // entry_count
+    entries = []
+    for i in range(entry_count):
+        start, end = i * minutes, (i + 1) * minutes
+        entries.append({
+            'status': 'driving' if i % 2 else 'on_duty',
+            'start_time': time(start // 60, start % 60),
+            'end_time': time(min(end // 60, 23), end % 60 if end < 24 * 60 else 59),
+            'duration_hours': minutes / 60,
+            'location': f'Stop {i}, TX',
+            'remarks': '',
+        })
+    return {
+        'id': 1, 'trip_id': 1, 'date': date(2025, 1, 1), 'driver_name': 'Benchmark Driver',
+        'home_terminal': 'Dallas, TX', 'from_location': 'Dallas, TX', 'to_location': 'Denver, CO',
+        'total_miles': 640, 'updated_at': datetime(2025, 1, 1), 'entries': entries,
+    }
+
+
+@benchmark('rendering')
+def rendering_suite():
+    """Time to draw one daily log sheet as SVG and as a one-page PDF"""
+    rows = []
+    for entry_count in (4, 12, 48):
+        sheet = synthetic_sheet(entry_count)
+        for fmt, render in (('svg', render_svg), ('pdf', lambda s: render_pdf([s]))):
+            seconds = measure(lambda: render(sheet), repeat=5, number=20)
+            rows.append({
+                'format': fmt,
+                'entries': entry_count,
+                'ms_per_sheet': round(seconds * 1000, 3),
+                'sheets_per_second': f'{1 / seconds:,.0f}',
+            })
+    return rows
@@ -0,0 +1,56 @@
+from rest_framework.renderers import JSONRenderer
+
+from . import benchmark, measure, scratch_environment
+from .planner import random_waypoints
+from ..api.payloads import trip_payloads
+from ..api.renderers import OrjsonRenderer
+from ..api.serializers import TripCreateSerializer, TripSerializer
+from ..api.views import TripViewSet
+from ..models import Trip
+from ..util import generate_route_stops
+
+
+def create_trips(count, waypoint_count):
+    """Plan and store trips with long multi-day routes, the way POST /trips/ does"""
+    trip_ids = []
+    for i in range(count):
+        serializer = TripCreateSerializer(data={
+            'driver_name': f'Benchmark Driver {i}',
+            'current_location': 'New York, NY',
+            'current_lat': 40.7128,
+            'current_lng': -74.0060,
+            'waypoints': random_waypoints(waypoint_count, seed=i),
+            'current_cycle_hours': 0,
+        })
+        serializer.is_valid(raise_exception=True)
+        trip_data = serializer.validated_data
+        route_stops, total_distance, total_time = generate_route_stops(trip_data)
+        trip_ids.append(TripViewSet().persist_trip(trip_data, route_stops, total_distance, total_time).pk)
+    return trip_ids
+
+
+@benchmark('serialization')
+def serialization_suite():
+    """Nested trip payloads: TripSerializer against values() rows, with the stock and orjson renderers"""
+    rows = []
+    with scratch_environment():
+        for trip_count in (1, 20, 100):
+            trips = Trip.objects.filter(pk__in=create_trips(trip_count, 10))
+            log_entries = sum(len(log['entries']) for trip in trip_payloads(trips) for log in trip['daily_logs'])
+            modes = [
+                ('TripSerializer + JSONRenderer', lambda: JSONRenderer().render(TripSerializer(trips, many=True).data)),
+                ('values() + JSONRenderer', lambda: JSONRenderer().render(trip_payloads(trips))),
+                ('values() + OrjsonRenderer', lambda: OrjsonRenderer().render(trip_payloads(trips))),
+            ]
+            baseline = None
+            for mode, func in modes:
+                seconds = measure(func, repeat=5)
+                baseline = baseline or seconds
+                rows.append({
+                    'trips': trip_count,
+                    'log_entries': log_entries,
+                    'mode': mode,
+                    'ms': round(seconds * 1000, 2),
+                    'speedup': f'{baseline / seconds:.1f}x',
+                })
+    return rows
@@ -1,3 +1,12 @@
 class TripConstants:
     EARTH_RADIUS_MILES = 3963.19
-    AVERAGE_SPEED_MILES_PER_HOUR = 48
\ No newline at end of file
+    AVERAGE_SPEED_MILES_PER_HOUR = 48
+    FUEL_INTERVAL_MILES = 1000
+
+
+class HOSConstants:
+    MAX_DRIVING_HOURS = 11
+    MAX_DUTY_WINDOW_HOURS = 14
+    MAX_CYCLE_HOURS = 70
+    REQUIRED_REST_HOURS = 10
+    STOP_DURATION_HOURS = 1
@@ -0,0 +1,183 @@
+"""
+Spatial corridor index of planned routes.
+
+At planning time the route is densified and the geohash cells its vertices fall in are stored, one
+indexed TripCorridorCell row per cell. A "trips near a point" query first takes the trips with a cell in
+the circle's bounding box (widened by half the vertex spacing, so no route within the radius can slip
+between two vertices) and only then measures exact point-to-route distances, for those trips alone.
+Cells do not wrap around the antimeridian, which no planned route crosses.
+"""
+import math
+
+import numpy as np
+from django.db.models import Q
+
+from .constants import TripConstants
+from .geometry import densify_route, to_unit_vectors
+from .models import RouteStop, Trip, TripCorridorCell
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Precision 4 cells are about 24 x 12 miles at mid latitudes
+CORRIDOR_PRECISION = 4
+CORRIDOR_SPACING_MILES = 5.0
+# Past this many cells a query falls back to coarser geohash prefixes
+MAX_QUERY_CELLS = 64
+MILES_PER_DEGREE_LATITUDE = TripConstants.EARTH_RADIUS_MILES * math.pi / 180
+# Segments this close to the nearest one count as tied when a position is matched to a route
+ROUTE_MATCH_TOLERANCE_MILES = 0.01
+
+
+def grid_bits(precision):
+    """Longitude and latitude bits of a geohash; longitude gets the odd one"""
+    bits = 5 * precision
+    return (bits + 1) // 2, bits // 2
+
+
+def cell_coordinates(lat, lng, precision):
+    """Column and row of the geohash cells holding the points"""
+    lng_bits, lat_bits = grid_bits(precision)
+    x = np.floor((np.asarray(lng, dtype=np.float64) + 180) / 360 * (1 << lng_bits)).astype(np.int64)
+    y = np.floor((np.asarray(lat, dtype=np.float64) + 90) / 180 * (1 << lat_bits)).astype(np.int64)
+    return np.clip(x, 0, (1 << lng_bits) - 1), np.clip(y, 0, (1 << lat_bits) - 1)
+
+
+def geohashes(x, y, precision):
+    """Geohash strings of cells given by column and row: their bits interleaved, longitude first"""
+    lng_bits, lat_bits = grid_bits(precision)
+    x, y = np.asarray(x, dtype=np.int64), np.asarray(y, dtype=np.int64)
+    code = np.zeros(np.broadcast(x, y).shape, dtype=np.int64)
+    for bit in range(5 * precision):
+        if bit % 2 == 0:
+            value = (x >> (lng_bits - 1 - bit // 2)) & 1
+        else:
+            value = (y >> (lat_bits - 1 - bit // 2)) & 1
+        code = (code << 1) | value
+    return [
+        ''.join(GEOHASH_ALPHABET[(int(c) >> shift) & 31] for shift in range(5 * (precision - 1), -1, -5))
+        for c in code.ravel()
+    ]
+
+
+def geohash(lat, lng, precision=CORRIDOR_PRECISION):
+    x, y = cell_coordinates(lat, lng, precision)
+    return geohashes(x, y, precision)[0]
+
+
+def route_cells(points, precision=CORRIDOR_PRECISION):
+    """The distinct cells of a densified route polyline"""
+    dense = densify_route(points, CORRIDOR_SPACING_MILES)
+    x, y = cell_coordinates(dense[:, 0], dense[:, 1], precision)
+    cells = np.unique(np.column_stack([x, y]), axis=0)
+    return sorted(set(geohashes(cells[:, 0], cells[:, 1], precision)))
+
+
+def save_trip_corridor(trip, route_stops):
+    """(Re)build the corridor cells of a trip from its start and route stops"""
+    points = [(trip.current_lat, trip.current_lng)] + [(s['latitude'], s['longitude']) for s in route_stops]
+    TripCorridorCell.objects.filter(trip=trip).delete()
+    return TripCorridorCell.objects.bulk_create(TripCorridorCell(trip=trip, cell=cell) for cell in route_cells(points))
+
+
+def query_cells(lat, lng, radius_miles):
+    """Geohash prefixes covering a circle's bounding box, at the finest precision with few enough of them"""
+    dlat = radius_miles / MILES_PER_DEGREE_LATITUDE
+    max_abs_lat = min(90.0, abs(lat) + dlat)
+    cos_lat = math.cos(math.radians(max_abs_lat))
+    dlng = 180.0 if cos_lat < 1e-6 else min(180.0, dlat / cos_lat)
+
+    for precision in range(CORRIDOR_PRECISION, 0, -1):
+        (x0, x1), (y0, y1) = cell_coordinates([lat - dlat, lat + dlat], [lng - dlng, lng + dlng], precision)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= MAX_QUERY_CELLS or precision == 1:
+            xs, ys = np.meshgrid(np.arange(x0, x1 + 1), np.arange(y0, y1 + 1))
+            return precision, geohashes(xs, ys, precision)
+
+
+def candidate_trip_ids(lat, lng, radius_miles):
+    """Trips with a corridor cell near the circle, read through the cell index"""
+    precision, prefixes = query_cells(lat, lng, radius_miles + CORRIDOR_SPACING_MILES / 2)
+    if precision == CORRIDOR_PRECISION:
+        cells = TripCorridorCell.objects.filter(cell__in=prefixes)
+    else:
+        # '~' sorts after every geohash character, so each prefix becomes one index range
+        ranges = Q()
+        for prefix in prefixes:
+            ranges |= Q(cell__gte=prefix, cell__lt=prefix + '~')
+        cells = TripCorridorCell.objects.filter(ranges)
+    return list(cells.values_list('trip_id', flat=True).distinct())
+
+
+def distances_to_segments(point, starts, ends):
+    """Great-circle distance (miles) from a point to each segment starts[i] -> ends[i]"""
+    p = to_unit_vectors(np.array([point], dtype=np.float64))[0]
+    a, b = to_unit_vectors(starts), to_unit_vectors(ends)
+
+    to_a = np.arccos(np.clip(a @ p, -1, 1))
+    to_b = np.arccos(np.clip(b @ p, -1, 1))
+    endpoint = np.minimum(to_a, to_b)
+
+    normal = np.cross(a, b)
+    norm = np.linalg.norm(normal, axis=1)
+    usable = norm > 1e-12
+    normal[usable] /= norm[usable, None]
+
+    # Closest point of the full great circle, and whether it lies between the segment's ends
+    offset = normal @ p
+    closest = p - offset[:, None] * normal
+    inside = usable & (np.einsum('ij,ij->i', np.cross(a, closest), normal) >= 0) & (
+        np.einsum('ij,ij->i', np.cross(closest, b), normal) >= 0
+    )
+    cross_track = np.abs(np.arcsin(np.clip(offset, -1, 1)))
+    return np.where(inside, cross_track, endpoint) * TripConstants.EARTH_RADIUS_MILES
+
+
+def route_progress(points, lat, lng):
+    """How far along a route (points in order) a position is: 1.5 is halfway from points[1] to points[2].
+
+    The position is matched to its nearest segment, the earliest one on ties, so on a route that doubles
+    back a driver is never placed further along than they are.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) < 2:
+        return 0.0
+    distances = distances_to_segments((lat, lng), points[:-1], points[1:])
+    segment = int(np.flatnonzero(distances <= distances.min() + ROUTE_MATCH_TOLERANCE_MILES)[0])
+
+    a, b, p = to_unit_vectors(np.array([points[segment], points[segment + 1], (lat, lng)]))
+    length = np.arccos(np.clip(a @ b, -1, 1))
+    if length < 1e-12:
+        return float(segment + 1)
+    # Along-track angle from the segment start, from the right triangle with the cross-track distance
+    cross_track = distances[segment] / TripConstants.EARTH_RADIUS_MILES
+    along = np.arccos(np.clip(np.clip(a @ p, -1, 1) / np.cos(cross_track), -1, 1))
+    return segment + float(min(along / length, 1.0))
+
+
+def trips_near(lat, lng, radius_miles):
+    """Trips whose planned route passes within radius_miles of a point, nearest first.
+
+    Returns (trip id, distance in miles) pairs.
+    """
+    candidates = candidate_trip_ids(lat, lng, radius_miles)
+    if not candidates:
+        return []
+
+    starts = {t['id']: (t['current_lat'], t['current_lng'])
+              for t in Trip.objects.filter(pk__in=candidates).values('id', 'current_lat', 'current_lng')}
+    routes = {trip_id: [start] for trip_id, start in starts.items()}
+    stops = RouteStop.objects.filter(trip_id__in=candidates).order_by('trip_id', 'order')
+    for trip_id, stop_lat, stop_lng in stops.values_list('trip_id', 'latitude', 'longitude'):
+        routes[trip_id].append((stop_lat, stop_lng))
+
+    trip_ids, segment_starts, segment_ends, first_segments = [], [], [], []
+    for trip_id, points in routes.items():
+        if len(points) < 2:
+            points = points * 2
+        trip_ids.append(trip_id)
+        first_segments.append(len(segment_starts))
+        segment_starts.extend(points[:-1])
+        segment_ends.extend(points[1:])
+
+    distances = distances_to_segments((lat, lng), np.array(segment_starts), np.array(segment_ends))
+    nearest = np.minimum.reduceat(distances, first_segments)
+    order = np.argsort(nearest, kind='stable')
+    return [(trip_ids[i], float(nearest[i])) for i in order if nearest[i] <= radius_miles]
@@ -0,0 +1,230 @@
+import json
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.text import slugify
+
+from .models import DailyLog, LogEntry
+from .rendering import ENTRY_FIELDS, LOG_FIELDS, PdfWriter, pdf_page_content, render_sheet, sheet_from_values
+
+EXPORT_BATCH_SIZE = 200
+# Batches rendered ahead of the one being written, per worker: keeps workers busy with bounded memory
+EXPORT_PREFETCH_PER_WORKER = 2
+EXPORT_FORMATS = ['pdf', 'svg']
+_pool_lock = threading.Lock()
+_pool = None
+
+
+def export_pool():
+    """The process-wide render pool of EXPORT_POOL_WORKERS processes, started on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(settings.EXPORT_POOL_WORKERS, initializer=django.setup)
+        return _pool
+
+
+def discard_export_pool(pool):
+    """Drop a pool whose processes died, so the next export starts a fresh one"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def audit_logs(start_date, end_date, driver_name=None):
+    """Daily logs in a date range, grouped by driver so each driver's pages are contiguous"""
+    logs = DailyLog.objects.filter(date__range=(start_date, end_date))
+    if driver_name:
+        logs = logs.filter(driver_name=driver_name)
+    return logs.order_by('driver_name', 'date', 'id')
+
+
+def sheet_batches(log_ids, batch_size=EXPORT_BATCH_SIZE):
+    """Plain log sheets for the ids, in order, read with two values() queries per batch"""
+    for first in range(0, len(log_ids), batch_size):
+        batch = log_ids[first:first + batch_size]
+        logs = {log['id']: log for log in DailyLog.objects.filter(pk__in=batch).values(*LOG_FIELDS)}
+        entries = {}
+        for entry in LogEntry.objects.filter(daily_log_id__in=batch).values(*ENTRY_FIELDS):
+            entries.setdefault(entry['daily_log_id'], []).append(entry)
+        yield [sheet_from_values(logs[pk], entries.get(pk, [])) for pk in batch if pk in logs]
+
+
+def driver_folder(driver_name):
+    return slugify(driver_name) or 'unassigned'
+
+
+def render_batch(sheets, fmt, merge):
+    """Worker task: (driver, archive name, bytes) per sheet; merged exports get bare page content streams"""
+    if merge:
+        return [(sheet['driver_name'], None, pdf_page_content(sheet)) for sheet in sheets]
+
+    rendered = []
+    for sheet in sheets:
+        name = f"{driver_folder(sheet['driver_name'])}/{sheet['date']}-log-{sheet['id']}.{fmt}"
+        output = render_sheet(sheet, fmt)
+        rendered.append((sheet['driver_name'], name, output.encode() if isinstance(output, str) else output))
+    return rendered
+
+
+class ChunkedStream:
+    """Write-only file object whose written bytes are handed out in chunks, for streaming responses"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+class CountingStream:
+    """Pass-through file object that counts the bytes written to it"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+class AuditExport:
+    """Render daily log sheets on the shared process pool and stream them into a ZIP as they finish.
+
+    Batches are rendered in parallel but written in order, and only a few batches are in flight at a
+    time, so neither the sheets nor the archive are ever held in memory as a whole. With ``merge`` the
+    archive holds one PDF per driver instead of one file per day. ``workers`` caps how many pool
+    processes one export keeps busy (at most the pool's EXPORT_POOL_WORKERS); ``workers=0`` renders in-process.
+    """
+
+    def __init__(self, queryset, fmt='pdf', merge=False, workers=None, batch_size=EXPORT_BATCH_SIZE):
+        self.log_ids = list(queryset.values_list('id', flat=True))
+        self.fmt = 'pdf' if merge else fmt
+        self.merge = merge
+        pool_size = settings.EXPORT_POOL_WORKERS
+        self.workers = pool_size if workers is None else min(workers, pool_size)
+        self.batch_size = batch_size
+        self.stats = {'sheets': 0, 'total': len(self.log_ids), 'files': 0, 'bytes': 0, 'seconds': 0.0}
+
+    def rendered_batches(self):
+        batches = sheet_batches(self.log_ids, self.batch_size)
+        if not self.workers:
+            for batch in batches:
+                yield render_batch(batch, self.fmt, self.merge)
+            return
+
+        pool = export_pool()
+        pending = deque()
+        try:
+            for batch in batches:
+                pending.append(pool.submit(render_batch, batch, self.fmt, self.merge))
+                if len(pending) >= self.workers * EXPORT_PREFETCH_PER_WORKER:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        except BrokenProcessPool:
+            discard_export_pool(pool)
+            raise
+        finally:
+            # An abandoned download leaves its queued batches to be dropped, not rendered
+            for future in pending:
+                future.cancel()
+
+    def write_to(self, stream):
+        """Write the archive to a (possibly unseekable) stream, yielding progress after every batch"""
+        started = time.perf_counter()
+        output = CountingStream(stream)
+        compression = zipfile.ZIP_STORED if self.fmt == 'pdf' else zipfile.ZIP_DEFLATED
+        names = set()
+
+        with zipfile.ZipFile(output, 'w', compression=compression) as archive:
+            driver, entry, pdf = object(), None, None
+            for rendered in self.rendered_batches():
+                for driver_name, name, payload in rendered:
+                    if not self.merge:
+                        archive.writestr(name, payload)
+                        self.stats['files'] += 1
+                        continue
+                    if driver_name != driver:
+                        if pdf is not None:
+                            pdf.close()
+                            entry.close()
+                        name = f'{driver_folder(driver_name)}.pdf'
+                        suffix = 1
+                        while name in names:
+                            suffix += 1
+                            name = f'{driver_folder(driver_name)}-{suffix}.pdf'
+                        names.add(name)
+                        driver, entry = driver_name, archive.open(name, 'w', force_zip64=True)
+                        pdf = PdfWriter(entry)
+                        self.stats['files'] += 1
+                    pdf.add_page(payload)
+
+                self.stats['sheets'] += len(rendered)
+                self.update_stats(output, started)
+                yield self.progress()
+
+            if pdf is not None:
+                pdf.close()
+                entry.close()
+            self.update_stats(output, started)
+            archive.writestr('export.json', json.dumps({
+                'format': self.fmt, 'merged': self.merge, 'workers': self.workers, **self.progress(),
+            }, indent=2))
+
+        self.update_stats(output, started)
+
+    def update_stats(self, output, started):
+        self.stats['bytes'] = output.bytes_written
+        self.stats['seconds'] = time.perf_counter() - started
+
+    def progress(self):
+        seconds = self.stats['seconds']
+        return {**self.stats, 'sheets_per_second': self.stats['sheets'] / seconds if seconds else 0.0}
+
+    def stream_chunks(self):
+        """The archive as byte chunks for a StreamingHttpResponse, one chunk per batch"""
+        sink = ChunkedStream()
+        for _ in self.write_to(sink):
+            yield sink.drain()
+        yield sink.drain()
+
+
+async def async_chunks(chunks):
+    """A synchronous chunk iterator as an asynchronous one, so ASGI servers stream it chunk by chunk.
+
+    Each chunk is produced through sync_to_async, on the thread that runs the request's ORM code.
+    """
+    iterator = iter(chunks)
+    done = object()
+    try:
+        while True:
+            chunk = await sync_to_async(next)(iterator, done)
+            if chunk is done:
+                return
+            yield chunk
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close)()
@@ -0,0 +1,202 @@
+"""
+Fleet-wide map of active route stops, clustered on the server.
+
+A process-wide, column-oriented index holds the route stops of recent trips with their Web Mercator
+position and the time window of their trip, which runs from the start of its daily logs (the same start
+the driver's availability is computed from) for its planned duration. It is refreshed incrementally: each
+request checks the recent trips' count and last save time, reloads only the stops of trips saved since the
+last refresh (new or replanned), and rebuilds from scratch only when trips disappeared (purge, archive) or
+the index has aged past FLEET_INDEX_MAX_AGE. A map request keeps the stops
+of active trips inside the bounding box and merges them into grid cells of CLUSTER_CELL_PIXELS on screen,
+so the response grows with the screen size, not with the fleet.
+"""
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.db.models import Count, DateField, Max, OuterRef, Subquery, TimeField
+from django.utils import timezone
+
+from .geometry import MAX_MERCATOR_LATITUDE, MAX_ZOOM, TILE_SIZE_PIXELS
+from .metrics import CACHE_REQUESTS
+from .models import LogEntry, RouteStop, Trip
+
+# Trips planned longer ago than this are never active
+MAX_ACTIVE_TRIP_DAYS = 14
+FLEET_INDEX_MAX_AGE = timedelta(hours=1)
+CLUSTER_CELL_PIXELS = 64
+# Upper bound on grid cells a request may cover; wider views are clustered at a coarser zoom
+MAX_CLUSTER_CELLS = 4096
+
+STOP_FIELDS = ['id', 'trip_id', 'stop_type', 'latitude', 'longitude']
+
+
+def mercator_unit(latitudes, longitudes):
+    """[lat, lng] degrees -> Web Mercator x/y scaled to [0, 1), y growing southwards like map tiles"""
+    lat = np.radians(np.clip(latitudes, -MAX_MERCATOR_LATITUDE, MAX_MERCATOR_LATITUDE))
+    x = (np.asarray(longitudes, dtype=np.float64) + 180) / 360
+    y = (1 - np.log(np.tan(np.pi / 4 + lat / 2)) / np.pi) / 2
+    return np.clip(x, 0, np.nextafter(1, 0)), np.clip(y, 0, np.nextafter(1, 0))
+
+
+def trip_windows(trip_ids):
+    """Each trip's active window as (start, end) timestamps, from the start of its logs like plan_start"""
+    first_entry = LogEntry.objects.filter(daily_log__trip=OuterRef('pk')).order_by('daily_log__date', 'start_time')
+    trips = Trip.objects.filter(pk__in=trip_ids).annotate(
+        log_date=Subquery(first_entry.values('daily_log__date')[:1], output_field=DateField()),
+        log_time=Subquery(first_entry.values('start_time')[:1], output_field=TimeField()),
+    )
+    windows = {}
+    for row in trips.values('id', 'created_at', 'total_trip_time', 'log_date', 'log_time'):
+        if row['log_date'] is None:
+            start = row['created_at'].timestamp()
+        else:
+            start = timezone.make_aware(datetime.combine(row['log_date'], row['log_time'])).timestamp()
+        windows[row['id']] = (start, start + (row['total_trip_time'] or 0) * 3600)
+    return windows
+
+
+class ActiveStopIndex:
+    """Column-oriented, in-memory copy of the route stops of recent trips"""
+
+    def __init__(self, since):
+        self.since = since
+        self.built_at = timezone.now()
+        self.watermark = None
+        self.loaded_trips = set()
+        self.stop_ids = np.empty(0, dtype=np.int64)
+        self.trip_ids = np.empty(0, dtype=np.int64)
+        self.stop_types = np.empty(0, dtype=object)
+        self.latitudes = np.empty(0, dtype=np.float64)
+        self.longitudes = np.empty(0, dtype=np.float64)
+        self.x = np.empty(0, dtype=np.float64)
+        self.y = np.empty(0, dtype=np.float64)
+        self.starts = np.empty(0, dtype=np.float64)
+        self.ends = np.empty(0, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.stop_ids)
+
+    def trips(self):
+        return Trip.objects.filter(created_at__gte=self.since)
+
+    def append(self, rows, windows):
+        """Add stops given as values() rows, with their trips' windows as trip_windows() gives them"""
+        if not rows:
+            return
+        latitudes = np.array([r['latitude'] for r in rows], dtype=np.float64)
+        longitudes = np.array([r['longitude'] for r in rows], dtype=np.float64)
+        x, y = mercator_unit(latitudes, longitudes)
+        starts = np.array([windows[r['trip_id']][0] for r in rows], dtype=np.float64)
+        ends = np.array([windows[r['trip_id']][1] for r in rows], dtype=np.float64)
+
+        self.stop_ids = np.concatenate([self.stop_ids, [r['id'] for r in rows]])
+        self.trip_ids = np.concatenate([self.trip_ids, [r['trip_id'] for r in rows]])
+        self.stop_types = np.concatenate([self.stop_types, np.array([r['stop_type'] for r in rows], dtype=object)])
+        self.latitudes = np.concatenate([self.latitudes, latitudes])
+        self.longitudes = np.concatenate([self.longitudes, longitudes])
+        self.x = np.concatenate([self.x, x])
+        self.y = np.concatenate([self.y, y])
+        self.starts = np.concatenate([self.starts, starts])
+        self.ends = np.concatenate([self.ends, ends])
+
+    def drop_trips(self, trip_ids):
+        keep = ~np.isin(self.trip_ids, list(trip_ids))
+        for column in ('stop_ids', 'trip_ids', 'stop_types', 'latitudes', 'longitudes', 'x', 'y', 'starts', 'ends'):
+            setattr(self, column, getattr(self, column)[keep])
+
+    def refresh(self):
+        """Bring the index up to date; returns False when trips disappeared and it must be rebuilt"""
+        # Trips, not their stops: a range on the created_at index, a handful of rows per trip fewer
+        state = self.trips().aggregate(count=Count('id'), saved=Max('updated_at'))
+        if self.watermark is None or (state['saved'] is not None and state['saved'] > self.watermark):
+            changed = self.trips()
+            if self.watermark is not None:
+                changed = changed.filter(updated_at__gt=self.watermark)
+            changed_ids = list(changed.values_list('id', flat=True))
+            self.drop_trips(changed_ids)
+            self.append(
+                list(RouteStop.objects.filter(trip_id__in=changed_ids).values(*STOP_FIELDS)), trip_windows(changed_ids)
+            )
+            self.loaded_trips.update(changed_ids)
+            self.watermark = state['saved']
+        return len(self.loaded_trips) == state['count']
+
+    def active(self, moment):
+        return (self.starts <= moment) & (self.ends >= moment)
+
+
+_index_lock = threading.Lock()
+_index = None
+
+
+def get_active_stop_index():
+    """Return the process-wide index after an incremental refresh"""
+    global _index
+    with _index_lock:
+        now = timezone.now()
+        expired = _index is None or now - _index.built_at > FLEET_INDEX_MAX_AGE
+        if not expired and _index.refresh():
+            CACHE_REQUESTS.inc(cache='active_stop_index', result='hit')
+            return _index
+
+        CACHE_REQUESTS.inc(cache='active_stop_index', result='miss')
+        _index = ActiveStopIndex(now - timedelta(days=MAX_ACTIVE_TRIP_DAYS))
+        _index.refresh()
+        return _index
+
+
+def cluster_zoom(x0, x1, y0, y1, zoom):
+    """The zoom to grid at: the requested one, or coarser when the view would have too many cells"""
+    while zoom > 0:
+        cells = 2 ** zoom * TILE_SIZE_PIXELS // CLUSTER_CELL_PIXELS
+        if (x1 - x0) * cells * (y1 - y0) * cells <= MAX_CLUSTER_CELLS:
+            break
+        zoom -= 1
+    return zoom
+
+
+def fleet_map_clusters(min_lng, min_lat, max_lng, max_lat, zoom, moment=None, index=None):
+    """Clusters of active route stops inside a bounding box, for a map at a zoom level.
+
+    Each cluster reports its tile (z/x/y), stop count and centroid; a cluster of one stop also names
+    its trip and stop type so it can be drawn as a plain marker.
+    """
+    index = get_active_stop_index() if index is None else index
+    moment = (moment or timezone.now()).timestamp()
+    x0, y1 = mercator_unit(min_lat, min_lng)
+    x1, y0 = mercator_unit(max_lat, max_lng)
+    zoom = cluster_zoom(float(x0), float(x1), float(y0), float(y1), min(zoom, MAX_ZOOM))
+
+    visible = np.flatnonzero(
+        index.active(moment)
+        & (index.latitudes >= min_lat) & (index.latitudes <= max_lat)
+        & (index.longitudes >= min_lng) & (index.longitudes <= max_lng)
+    )
+    if not len(visible):
+        return zoom, []
+
+    cells_per_tile = TILE_SIZE_PIXELS // CLUSTER_CELL_PIXELS
+    cells = 2 ** zoom * cells_per_tile
+    column = np.floor(index.x[visible] * cells).astype(np.int64)
+    row = np.floor(index.y[visible] * cells).astype(np.int64)
+    keys, group, counts = np.unique(column * cells + row, return_inverse=True, return_counts=True)
+    latitudes = np.bincount(group, weights=index.latitudes[visible]) / counts
+    longitudes = np.bincount(group, weights=index.longitudes[visible]) / counts
+    # Any member of a single-stop cluster is that stop
+    members = np.empty(len(keys), dtype=np.int64)
+    members[group] = visible
+
+    clusters = []
+    for i, key in enumerate(keys):
+        cluster = {
+            'tile': [zoom, int(key // cells) // cells_per_tile, int(key % cells) // cells_per_tile],
+            'count': int(counts[i]),
+            'lat': round(float(latitudes[i]), 6),
+            'lng': round(float(longitudes[i]), 6),
+        }
+        if counts[i] == 1:
+            cluster['trip_id'] = int(index.trip_ids[members[i]])
+            cluster['stop_type'] = index.stop_types[members[i]]
+        clusters.append(cluster)
+    return zoom, clusters
@@ -0,0 +1,182 @@
+import math
+
+import numpy as np
+
+from .constants import TripConstants
+from .metrics import CACHE_REQUESTS
+from .models import TripGeometry
+
+# Spacing of the dense great-circle polyline before simplification
+DENSIFY_SPACING_MILES = 1.0
+# Zoom levels that get their own simplified polyline; each serves zooms up to the next level
+GEOMETRY_ZOOM_LEVELS = [0, 4, 7, 10, 13]
+MAX_ZOOM = 18
+TILE_SIZE_PIXELS = 256
+WEB_MERCATOR_RADIUS_METERS = 6378137
+MAX_MERCATOR_LATITUDE = 85.05112878
+
+
+def to_unit_vectors(points):
+    """[lat, lng] degrees -> 3D unit vectors"""
+    lat = np.radians(points[:, 0])
+    lng = np.radians(points[:, 1])
+    return np.column_stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)])
+
+
+def from_unit_vectors(vectors):
+    """3D unit vectors -> [lat, lng] degrees"""
+    lat = np.arctan2(vectors[:, 2], np.hypot(vectors[:, 0], vectors[:, 1]))
+    lng = np.arctan2(vectors[:, 1], vectors[:, 0])
+    return np.degrees(np.column_stack([lat, lng]))
+
+
+def densify_route(points, spacing_miles=DENSIFY_SPACING_MILES):
+    """Great-circle polyline through the points with a vertex at least every spacing_miles"""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) < 2:
+        return points
+
+    vectors = to_unit_vectors(points)
+    pieces = []
+    for a, b in zip(vectors[:-1], vectors[1:]):
+        omega = math.acos(min(1.0, max(-1.0, float(a @ b))))
+        steps = max(1, math.ceil(omega * TripConstants.EARTH_RADIUS_MILES / spacing_miles))
+        if omega < 1e-12:
+            pieces.append(a[None, :])
+            continue
+        # Spherical linear interpolation for every step of the leg at once
+        t = np.arange(steps)[:, None] / steps
+        pieces.append((np.sin((1 - t) * omega) * a + np.sin(t * omega) * b) / math.sin(omega))
+    pieces.append(vectors[-1:])
+
+    return from_unit_vectors(np.vstack(pieces))
+
+
+def to_web_mercator(points):
+    """[lat, lng] degrees -> Web Mercator x/y in meters, the plane the map draws straight lines in"""
+    lat = np.radians(np.clip(points[:, 0], -MAX_MERCATOR_LATITUDE, MAX_MERCATOR_LATITUDE))
+    lng = np.radians(points[:, 1])
+    return np.column_stack([lng, np.log(np.tan(np.pi / 4 + lat / 2))]) * WEB_MERCATOR_RADIUS_METERS
+
+
+def simplify(points, tolerance):
+    """Douglas-Peucker simplification in Web Mercator; tolerance is in projected meters.
+
+    Great circles are curves on the map, so they keep as many vertices as the zoom needs to draw
+    them smoothly; measuring in the map's own plane keeps the error under the tolerance on screen.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) < 3:
+        return points
+
+    projected = to_web_mercator(points)
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+
+        start, end = projected[first], projected[last]
+        inner = projected[first + 1:last] - start
+        chord = end - start
+        length = math.hypot(chord[0], chord[1])
+        if length == 0:
+            offsets = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            offsets = np.abs(inner[:, 0] * chord[1] - inner[:, 1] * chord[0]) / length
+
+        farthest = int(np.argmax(offsets))
+        if offsets[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+
+    return points[keep]
+
+
+def encode_polyline(points, precision=5):
+    """Encode [lat, lng] points in the Google encoded polyline format"""
+    factor = 10 ** precision
+    scaled = np.round(np.asarray(points, dtype=np.float64).reshape(-1, 2) * factor).astype(np.int64)
+    deltas = np.diff(scaled, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+
+    chunks = []
+    for value in deltas.ravel().tolist():
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+
+def decode_polyline(encoded, precision=5):
+    """Decode a Google encoded polyline into a list of (lat, lng) tuples"""
+    values, value, shift = [], 0, 0
+    for char in encoded:
+        byte = ord(char) - 63
+        value |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+
+    factor = 10 ** precision
+    lat = lng = 0
+    points = []
+    for dlat, dlng in zip(values[0::2], values[1::2]):
+        lat += dlat
+        lng += dlng
+        points.append((lat / factor, lng / factor))
+    return points
+
+
+def tolerance_for_zoom(zoom):
+    """Size of one map pixel at a zoom level, in Web Mercator meters"""
+    return 2 * math.pi * WEB_MERCATOR_RADIUS_METERS / (TILE_SIZE_PIXELS * 2 ** zoom)
+
+
+def build_geometry_levels(points):
+    """Dense route polyline simplified once per zoom level, as TripGeometry field values"""
+    dense = densify_route(points)
+
+    levels = []
+    upper_zooms = GEOMETRY_ZOOM_LEVELS[1:] + [MAX_ZOOM + 1]
+    for min_zoom, next_zoom in zip(GEOMETRY_ZOOM_LEVELS, upper_zooms):
+        # Simplify for the most detailed zoom this level serves, so error stays under a pixel
+        tolerance = tolerance_for_zoom(next_zoom - 1)
+        simplified = simplify(dense, tolerance)
+        levels.append({
+            'min_zoom': min_zoom,
+            'tolerance': tolerance,
+            'point_count': len(simplified),
+            'polyline': encode_polyline(simplified),
+        })
+    return levels
+
+
+def route_points(trip, route_stops):
+    """The trip's start followed by every route stop, in order"""
+    return [(trip.current_lat, trip.current_lng)] + [(s['latitude'], s['longitude']) for s in route_stops]
+
+
+def save_trip_geometry(trip, route_stops):
+    """(Re)build and store the multi-resolution polylines of a trip"""
+    levels = build_geometry_levels(route_points(trip, route_stops))
+    TripGeometry.objects.filter(trip=trip).delete()
+    return TripGeometry.objects.bulk_create(TripGeometry(trip=trip, **level) for level in levels)
+
+
+def geometry_for_zoom(trip, zoom):
+    """The stored polyline level that serves a zoom, building the levels first for older trips"""
+    geometry = trip.geometries.filter(min_zoom__lte=zoom).order_by('-min_zoom').first()
+    CACHE_REQUESTS.inc(cache='trip_geometry', result='miss' if geometry is None else 'hit')
+    if geometry is None:
+        route_stops = trip.route_stops.order_by('order').values('latitude', 'longitude')
+        save_trip_geometry(trip, list(route_stops))
+        geometry = trip.geometries.filter(min_zoom__lte=zoom).order_by('-min_zoom').first()
+    return geometry
@@ -0,0 +1,154 @@
+"""
+Idempotency-Key support for POST endpoints.
+
+The first request with a key inserts an in-flight IdempotencyKey row and runs; its response is stored
+on the row. Retries within IDEMPOTENCY_WINDOW get the stored response back without running the view
+again, and retries arriving while the first request still runs wait for it (woken at once in this
+process, by polling the row across processes). Reusing a key for a different request is rejected.
+Server errors are not stored, so the client's next retry runs the request again.
+
+An in-flight row is a lease: if its request has not finished IDEMPOTENCY_LEASE_SECONDS after claiming
+the key (its process died), a waiting retry takes the key over with a conditional UPDATE on claimed_at,
+so only one of several waiters wins, and runs the request itself. The outcome is only stored by the
+request currently holding the lease.
+"""
+import functools
+import hashlib
+import json
+import threading
+import time
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_WINDOW = timedelta(hours=24)
+IDEMPOTENCY_WAIT_SECONDS = 30
+IDEMPOTENCY_POLL_SECONDS = 0.05
+# Longer than any request runs, so a live request never loses its key
+IDEMPOTENCY_LEASE_SECONDS = 120
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def request_fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def claim(key, fingerprint):
+    """Insert the key as in flight; the claim time if this request got it, else None"""
+    claimed_at = timezone.now()
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(key=key, fingerprint=fingerprint, claimed_at=claimed_at)
+    except IntegrityError:
+        return None
+    return claimed_at
+
+
+def take_over(entry):
+    """Claim an in-flight key whose lease ran out; the new claim time, or None if another request won"""
+    claimed_at = timezone.now()
+    taken = IdempotencyKey.objects.filter(
+        pk=entry.pk, claimed_at=entry.claimed_at, status_code__isnull=True
+    ).update(claimed_at=claimed_at)
+    return claimed_at if taken else None
+
+
+def replay(entry):
+    response = Response(json.loads(entry.response_body) if entry.response_body else None, status=entry.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def run_and_store(key, claimed_at, view, request, args, kwargs):
+    """Run the view for the request that claimed the key and record its outcome, unless it lost the lease"""
+    done = threading.Event()
+    with _in_flight_lock:
+        _in_flight[key] = done
+    held = IdempotencyKey.objects.filter(key=key, claimed_at=claimed_at)
+    try:
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            held.delete()
+            raise
+        if response.status_code >= 500:
+            held.delete()
+        else:
+            held.update(
+                status_code=response.status_code,
+                response_body=JSONRenderer().render(response.data).decode() if response.data is not None else '',
+            )
+        return response
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
+        done.set()
+
+
+def wait_for(key, seconds):
+    """Sleep until the in-flight request of this process holding the key finishes, or at most seconds"""
+    with _in_flight_lock:
+        done = _in_flight.get(key)
+    if done is None:
+        time.sleep(seconds)
+    else:
+        done.wait(seconds)
+
+
+def idempotent(method):
+    """Make a view method honour the Idempotency-Key header"""
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return method(self, request, *args, **kwargs)
+        if not key or len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            return Response({'detail': f'{IDEMPOTENCY_HEADER} must be 1 to 255 characters.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        view = functools.partial(method, self)
+        fingerprint = request_fingerprint(request)
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            claimed_at = claim(key, fingerprint)
+            if claimed_at is not None:
+                return run_and_store(key, claimed_at, view, request, args, kwargs)
+
+            entry = IdempotencyKey.objects.filter(key=key).first()
+            if entry is None:
+                # The request holding the key failed and released it
+                continue
+            if entry.created_at < timezone.now() - IDEMPOTENCY_WINDOW:
+                entry.delete()
+                continue
+            if entry.fingerprint != fingerprint:
+                return Response({'detail': f'{IDEMPOTENCY_HEADER} was already used for a different request.'},
+                                status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if entry.status_code is not None:
+                return replay(entry)
+            if entry.claimed_at < timezone.now() - timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS):
+                claimed_at = take_over(entry)
+                if claimed_at is not None:
+                    return run_and_store(key, claimed_at, view, request, args, kwargs)
+                continue
+            if time.monotonic() >= deadline:
+                return Response({'detail': f'A request with this {IDEMPOTENCY_HEADER} is still in progress.'},
+                                status=status.HTTP_409_CONFLICT)
+            wait_for(key, IDEMPOTENCY_POLL_SECONDS)
+    return wrapper
+
+
+def prune_idempotency_keys(window=IDEMPOTENCY_WINDOW):
+    """Delete the stored outcomes that can no longer be replayed; returns how many"""
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=timezone.now() - window).delete()
+    return deleted
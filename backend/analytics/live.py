@@ -0,0 +1,206 @@
+"""
+Live trip progress pushed to dashboards over Server-Sent Events.
+
+Views publish small events (position, stop_reached, duty_status, replan) to an in-process hub and every
+open ``GET /api/trips/{id}/events/`` stream of that trip receives them. An idle subscriber costs one
+suspended coroutine and a short deque, so a process holds thousands of them. The streams need the ASGI
+application (backend/asgi.py); the hub lives in one process, so run a single ASGI worker or pin each
+trip's publishers and subscribers to the same one.
+"""
+import asyncio
+import itertools
+import json
+import threading
+from collections import deque
+from datetime import time
+
+from django.utils import timezone
+
+from .corridor import route_progress
+from .models import LogEntry
+from .replan import ARRIVAL_RADIUS_MILES
+from .util import calculate_distance
+
+SUBSCRIBER_QUEUE_SIZE = 64
+KEEPALIVE_SECONDS = 15
+RETRY_MILLISECONDS = 3000
+
+
+class Subscription:
+    """One open stream: events waiting to be sent, on the event loop that sends them"""
+
+    def __init__(self, trip_id, loop):
+        self.trip_id = trip_id
+        self.loop = loop
+        self.events = deque(maxlen=SUBSCRIBER_QUEUE_SIZE)
+        self.ready = asyncio.Event()
+        self.overflowed = False
+
+    def push(self, message):
+        """Queue an event; runs on the subscriber's loop. A client this far behind is told to resync."""
+        if len(self.events) == self.events.maxlen:
+            self.overflowed = True
+        self.events.append(message)
+        self.ready.set()
+
+    async def get(self):
+        while not self.events:
+            self.ready.clear()
+            await self.ready.wait()
+        if self.overflowed:
+            self.overflowed = False
+            self.events.clear()
+            return {'id': None, 'event': 'resync', 'data': {'trip_id': self.trip_id}}
+        return self.events.popleft()
+
+
+class TripEventHub:
+    """In-process pub/sub of trip events; publishing is thread-safe and never blocks on subscribers"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {}
+        self.progress = {}
+        self.sequence = itertools.count(1)
+
+    def subscribe(self, trip_id):
+        """Register a stream for a trip; must be called on the event loop that will read it"""
+        subscription = Subscription(trip_id, asyncio.get_running_loop())
+        with self.lock:
+            self.subscribers.setdefault(trip_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscribers.get(subscription.trip_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.subscribers[subscription.trip_id]
+                    self.progress.pop(subscription.trip_id, None)
+
+    def subscriber_count(self, trip_id=None):
+        with self.lock:
+            if trip_id is not None:
+                return len(self.subscribers.get(trip_id, ()))
+            return sum(len(subscriptions) for subscriptions in self.subscribers.values())
+
+    def publish(self, trip_id, event, data):
+        """Send an event to every open stream of a trip, from any thread"""
+        message = {'id': next(self.sequence), 'event': event, 'data': data}
+        with self.lock:
+            subscriptions = list(self.subscribers.get(trip_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.push, message)
+            except RuntimeError:
+                # The stream's loop is gone
+                self.unsubscribe(subscription)
+        return message
+
+    def update_progress(self, trip_id, **progress):
+        """Remember a trip's latest progress; returns the fields that changed.
+
+        Only trips with open streams are remembered, so the hub holds no state for trips nobody watches;
+        a trip's first stream gets its full progress with the next update.
+        """
+        with self.lock:
+            if trip_id not in self.subscribers:
+                return progress
+            current = self.progress.setdefault(trip_id, {})
+            changed = {key: value for key, value in progress.items() if current.get(key) != value}
+            current.update(changed)
+        return changed
+
+    def forget(self, trip_id):
+        with self.lock:
+            self.progress.pop(trip_id, None)
+
+
+HUB = TripEventHub()
+
+
+def format_event(message):
+    """One message in the text/event-stream format"""
+    lines = []
+    if message['id'] is not None:
+        lines.append(f'id: {message["id"]}')
+    lines.append(f'event: {message["event"]}')
+    lines.append(f'data: {json.dumps(message["data"], separators=(",", ":"), default=str)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+async def trip_event_stream(trip_id, hub=HUB):
+    """The body of an SSE response: events of one trip as they are published, with keep-alive comments"""
+    subscription = hub.subscribe(trip_id)
+    try:
+        yield f'retry: {RETRY_MILLISECONDS}\n: connected\n\n'
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.get(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            yield format_event(message)
+    finally:
+        hub.unsubscribe(subscription)
+
+
+def duty_status_at(trip, moment):
+    """Status of the trip's log entry covering a (naive) moment; None outside the logged timeline"""
+    clock = moment.time()
+    entry = (
+        LogEntry.objects.filter(daily_log__trip=trip, daily_log__date=moment.date(), start_time__lte=clock)
+        .order_by('-start_time').values('status', 'end_time').first()
+    )
+    # The last entry of a day ends at 23:59 and covers the day's final minute
+    if entry is None or (entry['end_time'] <= clock and entry['end_time'] != time(23, 59)):
+        return None
+    return entry['status']
+
+
+def reached_stop(trip, current_lat, current_lng):
+    """The last route stop a driver at this position has reached; None before the first one.
+
+    Judged by where the driver is, not by the clock: the stops behind the position projected onto the
+    route, plus the next one once the driver is within ARRIVAL_RADIUS_MILES of it.
+    """
+    stops = list(trip.route_stops.order_by('order').values(
+        'order', 'stop_type', 'location_name', 'latitude', 'longitude'
+    ))
+    points = [(trip.current_lat, trip.current_lng)] + [(stop['latitude'], stop['longitude']) for stop in stops]
+    reached = int(route_progress(points, current_lat, current_lng))
+    if reached < len(stops):
+        ahead = stops[reached]
+        if calculate_distance(ahead['latitude'], ahead['longitude'], current_lat, current_lng) <= ARRIVAL_RADIUS_MILES:
+            reached += 1
+    return stops[reached - 1] if reached else None
+
+
+def publish_position(trip, current_lat, current_lng, current_time, hub=HUB):
+    """Publish a driver position and, when they change, the stop reached and the duty status"""
+    moment = timezone.make_naive(current_time)
+    progress = {
+        'position': {'lat': current_lat, 'lng': current_lng, 'at': current_time.isoformat()},
+        'stop_reached': reached_stop(trip, current_lat, current_lng),
+        'duty_status': duty_status_at(trip, moment),
+    }
+    hub.publish(trip.pk, 'position', progress['position'])
+    changed = hub.update_progress(trip.pk, stop_reached=progress['stop_reached'], duty_status=progress['duty_status'])
+    if changed.get('stop_reached'):
+        hub.publish(trip.pk, 'stop_reached', changed['stop_reached'])
+    if changed.get('duty_status'):
+        hub.publish(trip.pk, 'duty_status', {'status': changed['duty_status'], 'at': current_time.isoformat()})
+    return progress
+
+
+def publish_replan(trip, changes, hub=HUB):
+    """Publish the new totals of a replanned trip and how many rows the replan touched"""
+    hub.forget(trip.pk)
+    return hub.publish(trip.pk, 'replan', {
+        'total_distance': trip.total_distance,
+        'total_trip_time': trip.total_trip_time,
+        'fuel_stops_needed': trip.fuel_stops_needed,
+        'rest_breaks_needed': trip.rest_breaks_needed,
+        'changes': changes,
+    })
@@ -0,0 +1,299 @@
+"""
+Open-loop load generator for sizing deployments, run with ``python manage.py loadtest``.
+
+Requests are scheduled at a fixed rate whatever the server's speed and handed to a pool of client
+threads, each with its own keep-alive connection. Latency is measured from the scheduled start, so time
+spent queued behind a saturated server counts (no coordinated omission). Meanwhile a probe samples how
+long a writer waits for the database lock: on SQLite by timing BEGIN IMMEDIATE on its own connection, on
+PostgreSQL by counting backends waiting on a lock.
+"""
+import http.client
+import json
+import queue
+import random
+import sqlite3
+import subprocess
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+from django.db import connections
+
+OPERATIONS = ['create', 'list', 'retrieve', 'daily_logs']
+DEFAULT_MIX = {'create': 1, 'list': 1, 'retrieve': 5, 'daily_logs': 3}
+LOCK_PROBE_INTERVAL_SECONDS = 0.1
+PERCENTILES = [50, 95, 99]
+
+# Recurring lanes between fixed terminals, with coordinates
+TERMINALS = [
+    ('New York, NY', 40.7128, -74.0060),
+    ('Chicago, IL', 41.8781, -87.6298),
+    ('Houston, TX', 29.7604, -95.3698),
+    ('Denver, CO', 39.7392, -104.9903),
+    ('Atlanta, GA', 33.7490, -84.3880),
+    ('Los Angeles, CA', 34.0522, -118.2437),
+    ('Memphis, TN', 35.1495, -90.0490),
+    ('Dallas, TX', 32.7767, -96.7970),
+]
+
+
+def parse_mix(value):
+    """'create=1,retrieve=5' -> {'create': 1.0, 'retrieve': 5.0}"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in OPERATIONS:
+            raise ValueError(f'Unknown operation {name.strip()!r}; expected one of {", ".join(OPERATIONS)}')
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def trip_request(rng):
+    """Body of a POST /trips/ on one of the recurring lanes"""
+    current, pickup, dropoff = rng.sample(TERMINALS, 3)
+    return {
+        'driver_name': f'Load Test {rng.randrange(50)}',
+        'current_location': current[0], 'current_lat': current[1], 'current_lng': current[2],
+        'pickup_location': pickup[0], 'pickup_lat': pickup[1], 'pickup_lng': pickup[2],
+        'dropoff_location': dropoff[0], 'dropoff_lat': dropoff[1], 'dropoff_lng': dropoff[2],
+        'current_cycle_hours': rng.choice([0, 10, 20, 35, 50]),
+    }
+
+
+def percentiles(values):
+    if not values:
+        return {f'p{p}': None for p in PERCENTILES}
+    points = np.percentile(np.asarray(values, dtype=np.float64), PERCENTILES)
+    return {f'p{p}': round(float(v), 3) for p, v in zip(PERCENTILES, points)}
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              timeout=5).stdout.strip() or None
+    except OSError:
+        return None
+
+
+class LockProbe(threading.Thread):
+    """Samples database lock waits in the background until stopped"""
+
+    def __init__(self, alias='default', interval=LOCK_PROBE_INTERVAL_SECONDS):
+        super().__init__(daemon=True)
+        self.connection = connections[alias]
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+
+    @property
+    def supported(self):
+        if self.connection.vendor == 'sqlite':
+            return not self.connection.is_in_memory_db()
+        return self.connection.vendor == 'postgresql'
+
+    def run(self):
+        if self.connection.vendor == 'sqlite':
+            self.probe_sqlite()
+        else:
+            self.probe_postgresql()
+
+    def probe_sqlite(self):
+        """Time how long a writer waits to take the database's write lock"""
+        database = sqlite3.connect(self.connection.settings_dict['NAME'], timeout=30, isolation_level=None)
+        try:
+            while not self.stopped.wait(self.interval):
+                started = time.perf_counter()
+                database.execute('BEGIN IMMEDIATE')
+                self.samples.append(time.perf_counter() - started)
+                database.execute('ROLLBACK')
+        finally:
+            database.close()
+
+    def probe_postgresql(self):
+        """Count the backends waiting on a lock"""
+        connection = connections.create_connection(self.connection.alias)
+        try:
+            with connection.cursor() as cursor:
+                while not self.stopped.wait(self.interval):
+                    cursor.execute("SELECT count(*) FROM pg_stat_activity WHERE wait_event_type = 'Lock'")
+                    self.samples.append(cursor.fetchone()[0])
+        finally:
+            connection.close()
+
+    def report(self):
+        if not self.supported:
+            return {'engine': self.connection.vendor, 'supported': False}
+        samples = np.asarray(self.samples, dtype=np.float64)
+        if self.connection.vendor == 'sqlite':
+            waits = samples * 1000
+            return {
+                'engine': 'sqlite', 'supported': True, 'samples': len(samples),
+                'measure': 'ms a writer waited for BEGIN IMMEDIATE',
+                **percentiles(waits.tolist()),
+                'max': round(float(waits.max()), 3) if len(waits) else None,
+            }
+        return {
+            'engine': 'postgresql', 'supported': True, 'samples': len(samples),
+            'measure': 'backends waiting on a lock',
+            'samples_with_waiters': int((samples > 0).sum()),
+            'mean_waiters': round(float(samples.mean()), 3) if len(samples) else None,
+            'max_waiters': int(samples.max()) if len(samples) else None,
+        }
+
+
+class LoadTest:
+    """Replay a weighted mix of trip API calls against a running server at a target request rate"""
+
+    def __init__(self, base_url, rps=20, duration=30, clients=8, mix=None, seed=0, timeout=30):
+        url = urlsplit(base_url)
+        self.scheme, self.netloc = url.scheme or 'http', url.netloc
+        self.prefix = url.path.rstrip('/') + '/api'
+        self.rps = rps
+        self.duration = duration
+        self.clients = clients
+        self.mix = mix or DEFAULT_MIX
+        self.seed = seed
+        self.timeout = timeout
+        self.trip_ids = []
+        self.trip_ids_lock = threading.Lock()
+        self.results = []
+
+    def connect(self):
+        connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        return connection_class(self.netloc, timeout=self.timeout)
+
+    def request(self, connection, method, path, body=None):
+        """Send one request on a keep-alive connection; returns (status, parsed JSON body or None)"""
+        headers = {'Accept': 'application/json'}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        connection.request(method, self.prefix + path, body=payload, headers=headers)
+        response = connection.getresponse()
+        data = response.read()
+        if response.status >= 400 or not data:
+            return response.status, None
+        return response.status, json.loads(data)
+
+    def load_trip_ids(self):
+        connection = self.connect()
+        try:
+            status, trips = self.request(connection, 'GET', '/trips/')
+            if status == 200:
+                self.trip_ids = [trip['id'] for trip in trips]
+            if not self.trip_ids:
+                status, trip = self.request(connection, 'POST', '/trips/', trip_request(random.Random(self.seed)))
+                if status == 201:
+                    self.trip_ids.append(trip['id'])
+        finally:
+            connection.close()
+
+    def call(self, connection, operation, rng):
+        if operation == 'create':
+            status, trip = self.request(connection, 'POST', '/trips/', trip_request(rng))
+            if status == 201:
+                with self.trip_ids_lock:
+                    self.trip_ids.append(trip['id'])
+            return status
+        if operation == 'list':
+            return self.request(connection, 'GET', '/trips/')[0]
+
+        with self.trip_ids_lock:
+            trip_id = rng.choice(self.trip_ids)
+        if operation == 'retrieve':
+            return self.request(connection, 'GET', f'/trips/{trip_id}/')[0]
+        return self.request(connection, 'GET', f'/trips/{trip_id}/daily_logs/')[0]
+
+    def client(self, work, number):
+        rng = random.Random(self.seed * 1000 + number)
+        connection = self.connect()
+        try:
+            while True:
+                item = work.get()
+                if item is None:
+                    return
+                scheduled, operation = item
+                sent = time.perf_counter()
+                try:
+                    status, error = self.call(connection, operation, rng), None
+                except (OSError, http.client.HTTPException, ValueError) as exc:
+                    status, error = None, type(exc).__name__
+                    connection.close()
+                    connection = self.connect()
+                finished = time.perf_counter()
+                self.results.append((operation, scheduled, sent, finished, status, error))
+        finally:
+            connection.close()
+
+    def run(self, probe=None):
+        """Run the test and return its report"""
+        self.load_trip_ids()
+        if not self.trip_ids:
+            raise RuntimeError(f'{self.scheme}://{self.netloc}{self.prefix}/trips/ returned no trips and creating one failed')
+
+        rng = random.Random(self.seed)
+        operations, weights = zip(*self.mix.items())
+        total = int(self.rps * self.duration)
+        schedule = rng.choices(operations, weights=weights, k=total)
+
+        work = queue.Queue()
+        clients = [threading.Thread(target=self.client, args=(work, n), daemon=True) for n in range(self.clients)]
+        for thread in clients:
+            thread.start()
+        if probe is not None and probe.supported:
+            probe.start()
+
+        started = time.perf_counter()
+        for i, operation in enumerate(schedule):
+            scheduled = started + i / self.rps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            work.put((scheduled, operation))
+        for _ in clients:
+            work.put(None)
+        for thread in clients:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if probe is not None and probe.is_alive():
+            probe.stopped.set()
+            probe.join()
+        return self.report(elapsed, probe)
+
+    def report(self, elapsed, probe=None):
+        def summary(results):
+            latencies = [(finished - scheduled) * 1000 for _, scheduled, _, finished, _, _ in results]
+            service = [(finished - sent) * 1000 for _, _, sent, finished, _, _ in results]
+            errors = sum(1 for *_, status, error in results if error or status is None or status >= 400)
+            return {
+                'requests': len(results),
+                'errors': errors,
+                'error_rate': round(errors / len(results), 4) if results else 0.0,
+                'latency_ms': percentiles(latencies),
+                'service_time_ms': percentiles(service),
+            }
+
+        status_codes = {}
+        for *_, status, error in self.results:
+            key = str(status) if status is not None else error
+            status_codes[key] = status_codes.get(key, 0) + 1
+
+        return {
+            'config': {
+                'url': f'{self.scheme}://{self.netloc}{self.prefix}', 'target_rps': self.rps,
+                'duration_seconds': self.duration, 'clients': self.clients, 'mix': self.mix, 'seed': self.seed,
+                'commit': current_commit(),
+            },
+            'elapsed_seconds': round(elapsed, 3),
+            'throughput_rps': round(len(self.results) / elapsed, 3) if elapsed else 0.0,
+            **summary(self.results),
+            'status_codes': status_codes,
+            'operations': {
+                operation: summary([r for r in self.results if r[0] == operation])
+                for operation in OPERATIONS if operation in self.mix
+            },
+            'db_lock_waits': probe.report() if probe is not None else None,
+        }
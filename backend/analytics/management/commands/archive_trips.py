@@ -0,0 +1,39 @@
+from datetime import date, datetime, time, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from analytics.archive import ARCHIVE_BATCH_SIZE, archive_trips
+from analytics.models import Trip
+
+DEFAULT_HOT_DAYS = 183
+
+
+class Command(BaseCommand):
+    help = 'Move trips older than a cutoff into compressed monthly archive files under ARCHIVE_DIR'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=DEFAULT_HOT_DAYS,
+                            help=f'Archive trips created more than this many days ago (default: {DEFAULT_HOT_DAYS})')
+        parser.add_argument('--before', type=date.fromisoformat, help='Archive trips created before this date instead')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Only count the trips that would be archived')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            cutoff = timezone.make_aware(datetime.combine(options['before'], time.min))
+        else:
+            cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+
+        if options['dry_run']:
+            count = Trip.objects.filter(created_at__lt=cutoff).count()
+            self.stdout.write(f'{count} trips created before {cutoff:%Y-%m-%d %H:%M} would be archived.')
+            return
+
+        archived = 0
+        for archived in archive_trips(cutoff, batch_size=options['batch_size']):
+            self.stdout.write(f'Archived {archived} trips...')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Archived {archived} trips created before {cutoff:%Y-%m-%d %H:%M}.')
+        )
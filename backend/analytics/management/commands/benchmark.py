@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics.benchmarks import load_suites
+
+
+class Command(BaseCommand):
+    help = 'Run the planning benchmark suites and print their results'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suites', nargs='*', help='Suites to run (default: all)')
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        suites = load_suites()
+        names = options['suites'] or sorted(suites)
+        unknown = [name for name in names if name not in suites]
+        if unknown:
+            raise CommandError(f'Unknown suites: {", ".join(unknown)}. Available: {", ".join(sorted(suites))}')
+
+        results = {}
+        for name in names:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: {suites[name].__doc__}'))
+            rows = suites[name]()
+            results[name] = rows
+            self.write_table(rows)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(results, f, indent=2)
+
+    def write_table(self, rows):
+        if not rows:
+            return
+        columns = list(rows[0])
+        widths = {c: max(len(c), *(len(str(row[c])) for row in rows)) for c in columns}
+        self.stdout.write('  '.join(c.rjust(widths[c]) for c in columns))
+        for row in rows:
+            self.stdout.write('  '.join(str(row[c]).rjust(widths[c]) for c in columns))
@@ -0,0 +1,41 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics.export import EXPORT_BATCH_SIZE, EXPORT_FORMATS, AuditExport, audit_logs
+
+
+class Command(BaseCommand):
+    help = 'Render the daily log sheets of a date range across a process pool into a ZIP for an audit'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Path of the ZIP archive to write')
+        parser.add_argument('--start', type=date.fromisoformat, required=True, help='First date (YYYY-MM-DD)')
+        parser.add_argument('--end', type=date.fromisoformat, required=True, help='Last date (YYYY-MM-DD)')
+        parser.add_argument('--driver', help='Only export this driver\'s logs')
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='pdf')
+        parser.add_argument('--merge', action='store_true', help='One PDF per driver instead of one file per day')
+        parser.add_argument('--workers', type=int, help='Rendering processes (default and maximum: EXPORT_POOL_WORKERS, 0 renders in-process)')
+        parser.add_argument('--batch-size', type=int, default=EXPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['start'] > options['end']:
+            raise CommandError('--start must not be after --end')
+
+        export = AuditExport(
+            audit_logs(options['start'], options['end'], options['driver']),
+            fmt=options['format'], merge=options['merge'], workers=options['workers'],
+            batch_size=options['batch_size'],
+        )
+        with open(options['output'], 'wb') as f:
+            for progress in export.write_to(f):
+                self.stderr.write(
+                    f"{progress['sheets']}/{progress['total']} sheets, "
+                    f"{progress['bytes'] / 1e6:.1f} MB, {progress['sheets_per_second']:,.0f} sheets/s"
+                )
+
+        stats = export.progress()
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {stats['sheets']} sheets in {stats['files']} files ({stats['bytes'] / 1e6:.1f} MB) "
+            f"in {stats['seconds']:.1f}s, {stats['sheets_per_second']:,.0f} sheets/s."
+        ))
@@ -0,0 +1,52 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics.loadtest import DEFAULT_MIX, LoadTest, LockProbe, parse_mix
+
+
+class Command(BaseCommand):
+    help = 'Replay a mix of trip API calls against a running server at a target rate and report latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Server to load (default: %(default)s)')
+        parser.add_argument('--rps', type=float, default=20, help='Target requests per second')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to send requests for')
+        parser.add_argument('--clients', type=int, default=8, help='Concurrent client connections')
+        parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                            help='Operation weights, e.g. create=1,list=1,retrieve=5,daily_logs=3')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--database', default='default',
+                            help='Database alias the server uses, for the lock-wait probe')
+        parser.add_argument('--no-lock-probe', action='store_true', help='Do not sample database lock waits')
+        parser.add_argument('--json', dest='json_path', help='Also write the report to this JSON file')
+
+    def handle(self, *args, **options):
+        load_test = LoadTest(
+            options['url'], rps=options['rps'], duration=options['duration'], clients=options['clients'],
+            mix=options['mix'], seed=options['seed'],
+        )
+        probe = None if options['no_lock_probe'] else LockProbe(options['database'])
+        try:
+            report = load_test.run(probe)
+        except (OSError, RuntimeError) as exc:
+            raise CommandError(f'Load test against {options["url"]} failed: {exc}')
+
+        self.stdout.write(
+            f'{report["requests"]} requests in {report["elapsed_seconds"]}s: {report["throughput_rps"]} req/s, '
+            f'error rate {report["error_rate"]:.2%}'
+        )
+        self.write_row('operation', 'requests', 'errors', 'p50 ms', 'p95 ms', 'p99 ms')
+        for name, summary in [('all', report)] + list(report['operations'].items()):
+            latency = summary['latency_ms']
+            self.write_row(name, summary['requests'], summary['errors'], latency['p50'], latency['p95'], latency['p99'])
+        if report['db_lock_waits'] is not None:
+            self.stdout.write(f'DB lock waits: {json.dumps(report["db_lock_waits"])}')
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS('Load test finished.'))
+
+    def write_row(self, *values):
+        self.stdout.write('  '.join(str(value).rjust(10) for value in values))
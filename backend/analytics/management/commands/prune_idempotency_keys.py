@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from analytics.idempotency import IDEMPOTENCY_WINDOW, prune_idempotency_keys
+
+
+class Command(BaseCommand):
+    help = f'Delete Idempotency-Key outcomes older than the replay window ({IDEMPOTENCY_WINDOW})'
+
+    def handle(self, *args, **options):
+        deleted = prune_idempotency_keys()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired idempotency keys.'))
@@ -0,0 +1,48 @@
+from datetime import date, datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from analytics.models import Trip
+from analytics.purge import PURGE_CHUNK_SIZE, purge_trips
+
+
+class Command(BaseCommand):
+    help = 'Permanently delete trips and everything planned for them in chunks of raw per-table deletes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('trip_ids', nargs='*', type=int, help='Trips to purge')
+        parser.add_argument('--id-range', nargs=2, type=int, metavar=('FIRST', 'LAST'),
+                            help='Purge trips with ids from FIRST to LAST inclusive')
+        parser.add_argument('--before', type=date.fromisoformat, help='Purge trips created before this date')
+        parser.add_argument('--driver', help='Only purge trips of this driver')
+        parser.add_argument('--chunk-size', type=int, default=PURGE_CHUNK_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would be deleted')
+
+    def handle(self, *args, **options):
+        trips = Trip.objects.all()
+        if options['trip_ids']:
+            trips = trips.filter(pk__in=options['trip_ids'])
+        if options['id_range']:
+            trips = trips.filter(pk__range=options['id_range'])
+        if options['before']:
+            trips = trips.filter(created_at__lt=timezone.make_aware(datetime.combine(options['before'], time.min)))
+        if options['driver']:
+            trips = trips.filter(driver_name=options['driver'])
+        if not (options['trip_ids'] or options['id_range'] or options['before'] or options['driver']):
+            raise CommandError('Give trip ids, --id-range, --before or --driver')
+
+        totals = None
+        for totals in purge_trips(trips, chunk_size=options['chunk_size'], dry_run=options['dry_run']):
+            self.stdout.write(f'{totals["trips"]} trips, {totals["rows"]} rows ({totals["rows_per_second"]:.0f} rows/s)...')
+
+        if totals is None:
+            self.stdout.write('No trips match.')
+            return
+        for table, rows in totals['tables'].items():
+            self.stdout.write(f'  {table}: {rows}')
+        verb = 'Would purge' if options['dry_run'] else 'Purged'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {totals["trips"]} trips, {totals["rows"]} rows in {totals["seconds"]:.2f}s '
+            f'({totals["rows_per_second"]:.0f} rows/s).'
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from analytics.corridor import save_trip_corridor
+from analytics.models import Trip
+
+
+class Command(BaseCommand):
+    help = 'Build the geohash corridor cells of trips planned before the index existed (or of every trip with --all)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rebuild the cells of every trip')
+
+    def handle(self, *args, **options):
+        trips = Trip.objects.all()
+        if not options['all']:
+            trips = trips.filter(corridor_cells__isnull=True)
+
+        rebuilt = cells = 0
+        for trip in trips.order_by('id').iterator():
+            route_stops = list(trip.route_stops.order_by('order').values('latitude', 'longitude'))
+            with transaction.atomic():
+                cells += len(save_trip_corridor(trip, route_stops))
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {cells} corridor cells for {rebuilt} trips.'))
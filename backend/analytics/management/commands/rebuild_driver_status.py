@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from analytics.availability import update_driver_status
+from analytics.models import Trip
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-driver HOS status index from each driver\'s most recent trip'
+
+    def handle(self, *args, **options):
+        latest_trips = {}
+        for trip in Trip.objects.exclude(driver_name__isnull=True).exclude(driver_name='').order_by('created_at').iterator():
+            latest_trips[trip.driver_name] = trip
+
+        rebuilt = 0
+        for trip in latest_trips.values():
+            route_stops = list(trip.route_stops.order_by('order').values(
+                'stop_type', 'location_name', 'latitude', 'longitude', 'duration_hours', 'cumulative_hours'
+            ))
+            if not route_stops or trip.total_trip_time is None:
+                continue
+
+            trip_data = {'current_cycle_hours': trip.current_cycle_hours}
+            update_driver_status(trip, route_stops, trip.total_trip_time, trip_data)
+            rebuilt += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt status for {rebuilt} drivers.')
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from analytics.timeline import rebuild_driver_timelines
+
+
+class Command(BaseCommand):
+    help = "Rebuild the merged per-driver day timelines from the trips' daily logs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--driver', help='Only rebuild this driver\'s days')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            days = rebuild_driver_timelines(options['driver'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {days} driver day timelines.'))
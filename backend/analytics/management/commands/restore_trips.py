@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics.archive import restore_trips
+from analytics.models import ArchivedTrip
+
+
+class Command(BaseCommand):
+    help = 'Move archived trips back from cold storage into the database, with their original ids'
+
+    def add_arguments(self, parser):
+        parser.add_argument('trip_ids', nargs='*', type=int, help='Ids of the archived trips to restore')
+        parser.add_argument('--month', help='Restore every trip archived for this month (YYYY-MM)')
+
+    def handle(self, *args, **options):
+        if not options['trip_ids'] and not options['month']:
+            raise CommandError('Give trip ids or --month.')
+
+        entries = ArchivedTrip.objects.all()
+        if options['trip_ids']:
+            entries = entries.filter(trip_id__in=options['trip_ids'])
+        if options['month']:
+            entries = entries.filter(archive_file=f'trips-{options["month"]}.jsonl.gz')
+
+        restored = restore_trips(entries)
+        self.stdout.write(self.style.SUCCESS(f'Restored {restored} trips.'))
@@ -0,0 +1,54 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from analytics.models import Trip
+from analytics.planning import frequent_lanes, plan_hit_rate, warm_lanes
+
+DEFAULT_LANES = 500
+DEFAULT_HISTORY_DAYS = 90
+DEFAULT_SAMPLE = 1000
+
+
+class Command(BaseCommand):
+    help = "Precompute the plans and log timelines of the most frequent lanes into the planning cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lanes', type=int, default=DEFAULT_LANES, help='How many of the most frequent lanes to warm')
+        parser.add_argument('--days', type=int, default=DEFAULT_HISTORY_DAYS, help='How much trip history to mine')
+        parser.add_argument('--sample', type=int, default=DEFAULT_SAMPLE,
+                            help='Measure the hit rate on this many of the most recent trips')
+        parser.add_argument('--workers', type=int, help='Planner processes (default: one per CPU, 0 plans inline)')
+
+    def handle(self, *args, **options):
+        if not settings.PLANNING_CACHE_DIR:
+            self.stdout.write(self.style.WARNING(
+                'The planning cache is local to this process; set PLANNING_CACHE_DIR so the web workers '
+                'see the warmed entries.'
+            ))
+
+        history = Trip.objects.filter(created_at__gte=timezone.now() - timedelta(days=options['days']))
+        sample = Trip.objects.filter(pk__in=list(
+            Trip.objects.order_by('-created_at').values_list('pk', flat=True)[:options['sample']]
+        ))
+
+        started = time.perf_counter()
+        lanes = frequent_lanes(history, options['lanes'])
+        covered = sum(count for _, count in lanes)
+        hit_rate_before = plan_hit_rate(sample)
+        written = warm_lanes([lane for lane, _ in lanes], workers=options['workers'])
+        hit_rate_after = plan_hit_rate(sample)
+
+        self.stdout.write(
+            f'{len(lanes)} lanes cover {covered} of {history.count()} trips from the last {options["days"]} days.'
+        )
+        self.stdout.write(
+            f'Plan cache hit rate on the {sample.count()} most recent trips: '
+            f'{hit_rate_before:.1%} -> {hit_rate_after:.1%} ({hit_rate_after - hit_rate_before:+.1%}).'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} planning cache entries in {time.perf_counter() - started:.2f}s.'
+        ))
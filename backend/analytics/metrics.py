@@ -0,0 +1,220 @@
+"""
+In-process metrics registry exposed in the Prometheus text format at /metrics.
+
+Recording only touches in-memory counters. For multi-process servers such as gunicorn, set
+METRICS_DIR to a directory shared by the workers: each process then writes a snapshot of its own
+values there at most every FLUSH_INTERVAL_SECONDS, and a scrape sums the snapshots of all processes.
+Snapshots of exited workers are kept so counters never go backwards; clear the directory when the
+server (re)starts.
+"""
+import atexit
+import bisect
+import functools
+import json
+import math
+import os
+import threading
+import time
+
+from django.conf import settings
+
+FLUSH_INTERVAL_SECONDS = 1.0
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+COUNT_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000]
+
+REGISTRY = {}
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY[name] = self
+
+    def key(self, labels):
+        return tuple(str(labels[label]) for label in self.labels)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        maybe_flush()
+
+    def merge(self, values, other):
+        for key, value in other.items():
+            values[key] = values.get(key, 0) + value
+
+    def samples(self, values):
+        for key, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labels, key)), value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = list(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # Per-bucket (not cumulative) counts, then sum and count
+                state = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+        maybe_flush()
+
+    def time(self, **labels):
+        """Decorator that observes the wall-clock duration of every call"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - started, **labels)
+            return wrapper
+        return decorator
+
+    def merge(self, values, other):
+        for key, state in other.items():
+            current = values.get(key)
+            values[key] = list(state) if current is None else [a + b for a, b in zip(current, state)]
+
+    def samples(self, values):
+        for key, state in sorted(values.items()):
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + [math.inf], state):
+                cumulative += count
+                le = '+Inf' if bound == math.inf else repr(float(bound))
+                yield f'{self.name}_bucket', {**labels, 'le': le}, cumulative
+            yield f'{self.name}_sum', labels, state[-2]
+            yield f'{self.name}_count', labels, state[-1]
+
+
+def snapshot():
+    """This process's values of every metric, as JSON-friendly data"""
+    data = {}
+    for name, metric in REGISTRY.items():
+        with metric.lock:
+            data[name] = [[list(key), value] for key, value in metric.values.items()]
+    return data
+
+
+def metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+_last_flush = 0.0
+
+
+def maybe_flush():
+    """Write this process's snapshot if METRICS_DIR is set and the last write is old enough"""
+    global _last_flush
+    if metrics_dir() and time.monotonic() - _last_flush >= FLUSH_INTERVAL_SECONDS:
+        _last_flush = time.monotonic()
+        flush()
+
+
+def flush():
+    directory = metrics_dir()
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'metrics-{os.getpid()}.json')
+    # Write and rename so a scrape never reads a half-written file
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(snapshot(), f)
+    os.replace(f'{path}.tmp', path)
+
+
+def reset_after_fork():
+    """Forked workers start from zero; whatever the parent counted is still reported by the parent"""
+    global _last_flush
+    _last_flush = 0.0
+    for metric in REGISTRY.values():
+        metric.lock = threading.Lock()
+        metric.values = {}
+
+
+atexit.register(flush)
+os.register_at_fork(after_in_child=reset_after_fork)
+
+
+def collect():
+    """Values of every metric summed over all processes: other workers' snapshots plus live values here"""
+    snapshots = [snapshot()]
+    directory = metrics_dir()
+    if directory and os.path.isdir(directory):
+        own = f'metrics-{os.getpid()}.json'
+        for filename in os.listdir(directory):
+            if filename.startswith('metrics-') and filename.endswith('.json') and filename != own:
+                try:
+                    with open(os.path.join(directory, filename)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+
+    totals = {name: {} for name in REGISTRY}
+    for data in snapshots:
+        for name, items in data.items():
+            if name in REGISTRY:
+                REGISTRY[name].merge(totals[name], {tuple(key): value for key, value in items})
+    return totals
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels.items()) + '}'
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for name, values in collect().items():
+        metric = REGISTRY[name]
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.type}')
+        for sample, labels, value in metric.samples(values):
+            lines.append(f'{sample}{format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'API request latency by view and action',
+    labels=('view', 'action', 'method', 'status'),
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries run per API request',
+    labels=('view', 'action'), buckets=COUNT_BUCKETS,
+)
+PLANNER_DURATION = Histogram('planner_duration_seconds', 'Time spent in planner steps', labels=('step',))
+TRIP_ROUTE_STOPS = Histogram('trip_route_stops', 'Route stops generated per planned trip', buckets=COUNT_BUCKETS)
+TRIP_LOG_ENTRIES = Histogram('trip_log_entries', 'Log entries generated per planned trip', buckets=COUNT_BUCKETS)
+CACHE_REQUESTS = Counter('cache_requests_total', 'Cache lookups by cache and result (hit or miss)', labels=('cache', 'result'))
+REPLICA_READS = Counter(
+    'replica_read_requests_total',
+    'Replica-eligible requests by where they read (replica, primary_pinned, primary_lagging, primary_fallback)',
+    labels=('target',),
+)
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 class Trip(models.Model):
     current_location = models.CharField(max_length=500)
@@ -11,15 +12,20 @@ class Trip(models.Model):
     dropoff_lat = models.FloatField()
     dropoff_lng = models.FloatField()
     current_cycle_hours = models.FloatField(help_text="Hours already used in current 8-day cycle")
-    driver_name = models.CharField(max_length=200, null=True, blank=True)
+    driver_name = models.CharField(max_length=200, null=True, blank=True, db_index=True)
 
     total_distance = models.FloatField(null=True, blank=True)
     estimated_drive_time = models.FloatField(null=True, blank=True)
     total_trip_time = models.FloatField(null=True, blank=True)
     fuel_stops_needed = models.IntegerField(null=True, blank=True)
     rest_breaks_needed = models.IntegerField(null=True, blank=True)
+    replan_origin = models.JSONField(
+        null=True, blank=True,
+        help_text="Where the last replan planned the remaining stops from: position, hours after the plan start, "
+                  "hours since rest, miles since fuel and route stops already completed",
+    )
 
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
@@ -60,6 +66,58 @@ class RouteStop(models.Model):
         ordering = ['trip', 'order']
 
 
+class TripWaypoint(models.Model):
+    """A planned pickup or drop of a trip, in the order the driver visits them"""
+    STOP_TYPE_CHOICES = [
+        (RouteStop.PICKUP_LOCATION, 'Pickup'),
+        (RouteStop.DROPOFF_LOCATION, 'Dropoff'),
+    ]
+
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='waypoints')
+    stop_type = models.CharField(max_length=20, choices=STOP_TYPE_CHOICES)
+    location_name = models.CharField(max_length=500)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    order = models.IntegerField()
+    load_id = models.CharField(max_length=100, blank=True, help_text="Links a load's pickups to its drops")
+
+    def __str__(self):
+        return f"{self.stop_type} - {self.location_name} (Waypoint #{self.order})"
+
+    class Meta:
+        ordering = ['trip', 'order']
+
+
+class TripGeometry(models.Model):
+    """Route polyline of a trip simplified for one band of map zoom levels"""
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='geometries')
+    min_zoom = models.IntegerField(help_text="Lowest map zoom this level is served at")
+    tolerance = models.FloatField(help_text="Douglas-Peucker tolerance used for this level, in Web Mercator meters")
+    point_count = models.IntegerField()
+    polyline = models.TextField(help_text="Google encoded polyline")
+
+    def __str__(self):
+        return f"Trip {self.trip_id} geometry (zoom {self.min_zoom}+, {self.point_count} points)"
+
+    class Meta:
+        ordering = ['trip', 'min_zoom']
+        unique_together = ['trip', 'min_zoom']
+
+
+class TripCorridorCell(models.Model):
+    """A geohash cell a trip's planned route passes through, for finding trips near a point"""
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='corridor_cells')
+    cell = models.CharField(max_length=12, help_text="Geohash of the cell")
+
+    def __str__(self):
+        return f"Trip {self.trip_id} passes {self.cell}"
+
+    class Meta:
+        ordering = ['trip', 'cell']
+        # Leading with the cell makes "trips in these cells" an index-only lookup
+        unique_together = ['cell', 'trip']
+
+
 class DailyLog(models.Model):
     STATUS_CHOICES = [
         ('off_duty', 'Off Duty'),
@@ -69,7 +127,7 @@ class DailyLog(models.Model):
     ]
 
     trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='daily_logs')
-    date = models.DateField()
+    date = models.DateField(db_index=True)
     driver_name = models.CharField(max_length=200)
     home_terminal = models.CharField(max_length=500, blank=True)
     total_miles_today = models.FloatField(default=0)
@@ -85,6 +143,11 @@ class DailyLog(models.Model):
     class Meta:
         ordering = ['trip', 'date']
         unique_together = ['trip', 'date']
+        indexes = [
+            models.Index(fields=['driver_name', 'date']),
+            # Admin prefix search (LIKE 'term%') on PostgreSQL, whatever the database collation
+            models.Index(fields=['driver_name'], name='dailylog_driver_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ]
 
 
 class LogEntry(models.Model):
@@ -107,9 +170,92 @@ class LogEntry(models.Model):
     duration_hours = models.FloatField()
     location = models.CharField(max_length=500, blank=True)
     remarks = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.status} - {self.start_time} to {self.end_time}"
 
     class Meta:
         ordering = ['daily_log', 'start_time']
+
+
+class DriverDayTimeline(models.Model):
+    """One driver's duty status over one calendar day, merged across all of their trips' log entries"""
+    driver_name = models.CharField(max_length=200)
+    date = models.DateField()
+    segments = models.JSONField(
+        default=list, help_text="[start second, end second, status, trip id, location], sorted and non-overlapping"
+    )
+    layers = models.JSONField(default=dict, help_text="Each contributing trip's own segments, by trip id")
+    total_hours_driving = models.FloatField(default=0)
+    total_hours_on_duty = models.FloatField(default=0, help_text="Hours on duty, driving included")
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Duty timeline - {self.driver_name} - {self.date}"
+
+    class Meta:
+        ordering = ['driver_name', 'date']
+        # Also the index a driver's date range is read through
+        unique_together = ['driver_name', 'date']
+        indexes = [
+            # Admin prefix search (LIKE 'term%') on PostgreSQL, whatever the database collation
+            models.Index(fields=['driver_name'], name='timeline_driver_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ]
+
+
+class DriverStatus(models.Model):
+    """Latest known hours-of-service state per driver, refreshed whenever one of their trips is planned"""
+    driver_name = models.CharField(max_length=200, unique=True)
+    location = models.CharField(max_length=500, blank=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    available_at = models.DateTimeField(help_text="When the driver finishes their last planned trip")
+    hours_since_rest = models.FloatField(help_text="Hours since the last 10-hour break at available_at")
+    remaining_drive_hours = models.FloatField()
+    remaining_window_hours = models.FloatField()
+    remaining_cycle_hours = models.FloatField()
+    last_trip = models.ForeignKey(Trip, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.driver_name} - available {self.available_at:%Y-%m-%d %H:%M}"
+
+    class Meta:
+        ordering = ['driver_name']
+        verbose_name_plural = 'driver statuses'
+
+
+class ArchivedTrip(models.Model):
+    """Index entry of a trip moved to cold storage: the gzip member of a monthly archive file holding it"""
+    trip_id = models.BigIntegerField(unique=True, help_text="Id the trip had (and gets back on restore)")
+    driver_name = models.CharField(max_length=200, blank=True, db_index=True)
+    trip_created_at = models.DateTimeField(db_index=True)
+    archive_file = models.CharField(max_length=100, help_text="File name within ARCHIVE_DIR")
+    offset = models.BigIntegerField(help_text="Byte offset of the gzip member within the file")
+    length = models.IntegerField(help_text="Byte length of the gzip member")
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived trip {self.trip_id} ({self.archive_file})"
+
+    class Meta:
+        ordering = ['trip_id']
+
+
+class IdempotencyKey(models.Model):
+    """Outcome of a request sent with an Idempotency-Key header, replayed to retries of that request"""
+    key = models.CharField(max_length=255, unique=True)
+    fingerprint = models.CharField(max_length=64, help_text="Hash of the method, path and body the key was first used with")
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Empty while the request is in flight")
+    response_body = models.TextField(blank=True)
+    claimed_at = models.DateTimeField(default=timezone.now, help_text="When the request running it took the key")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Idempotency key {self.key} ({self.status_code or 'in flight'})"
+
+    class Meta:
+        ordering = ['-created_at']
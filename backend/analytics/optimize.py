@@ -0,0 +1,150 @@
+import time
+
+import numpy as np
+
+from .models import RouteStop
+from .util import calculate_distance_matrix
+
+DEFAULT_TIME_BUDGET_SECONDS = 0.5
+# Longest run of consecutive stops or-opt tries to relocate
+OR_OPT_MAX_SEGMENT = 3
+EPSILON = 1e-9
+
+
+def waypoint_distance_matrix(start_lat, start_lng, waypoints):
+    """Pairwise miles between the start (row/column 0) and every waypoint"""
+    points = np.array([(start_lat, start_lng)] + [(w['latitude'], w['longitude']) for w in waypoints])
+    return calculate_distance_matrix(points, points)
+
+
+def precedence_constraints(waypoints):
+    """Map each waypoint index to the indices that must be visited before it (pickups of its load)"""
+    pickups = {}
+    for i, waypoint in enumerate(waypoints):
+        if waypoint.get('load_id') and waypoint['stop_type'] == RouteStop.PICKUP_LOCATION:
+            pickups.setdefault(waypoint['load_id'], []).append(i)
+
+    before = {}
+    for i, waypoint in enumerate(waypoints):
+        if waypoint.get('load_id') and waypoint['stop_type'] == RouteStop.DROPOFF_LOCATION:
+            before[i] = pickups.get(waypoint['load_id'], [])
+    return before
+
+
+class StopOrderOptimizer:
+    """Open-path sequencing of waypoints under pickup-before-drop constraints.
+
+    Builds a greedy nearest-feasible-neighbour tour, then improves it with 2-opt segment
+    reversals and or-opt segment moves until no move helps or the time budget runs out.
+    Node 0 is the driver's start; nodes 1..n are the waypoints.
+    """
+
+    def __init__(self, matrix, before, time_budget=DEFAULT_TIME_BUDGET_SECONDS):
+        self.dist = matrix.tolist()  # Plain lists: scalar indexing in the search loops is far faster
+        self.size = len(self.dist) - 1
+        # Constraints on 1-based node ids
+        self.before = {node + 1: [p + 1 for p in preds] for node, preds in before.items()}
+        self.after = {}
+        for node, preds in self.before.items():
+            for pred in preds:
+                self.after.setdefault(pred, []).append(node)
+        self.time_budget = time_budget
+        self.deadline = None
+
+    def solve(self):
+        self.deadline = time.perf_counter() + self.time_budget
+        tour = self.greedy_tour()
+        improved = True
+        while improved and not self.out_of_time():
+            improved = self.two_opt(tour) or self.or_opt(tour)
+        return [node - 1 for node in tour]
+
+    def out_of_time(self):
+        return time.perf_counter() > self.deadline
+
+    def path_length(self, tour):
+        dist = self.dist
+        length, prev = 0.0, 0
+        for node in tour:
+            length += dist[prev][node]
+            prev = node
+        return length
+
+    def is_feasible(self, tour):
+        position = {node: i for i, node in enumerate(tour)}
+        return all(position[pred] < position[node] for node, preds in self.before.items() for pred in preds)
+
+    def greedy_tour(self):
+        dist = self.dist
+        pending = {node: len(self.before.get(node, ())) for node in range(1, self.size + 1)}
+        tour, current = [], 0
+        while pending:
+            node = min((n for n, blocked in pending.items() if not blocked), key=lambda n: dist[current][n])
+            del pending[node]
+            for successor in self.after.get(node, ()):
+                pending[successor] -= 1
+            tour.append(node)
+            current = node
+        return tour
+
+    def two_opt(self, tour):
+        """Apply the first improving feasible segment reversal; return whether one was found"""
+        dist = self.dist
+        n = len(tour)
+        for i in range(n - 1):
+            a = tour[i - 1] if i > 0 else 0
+            b = tour[i]
+            for j in range(i + 1, n):
+                c = tour[j]
+                delta = dist[a][c] - dist[a][b]
+                if j + 1 < n:
+                    e = tour[j + 1]
+                    delta += dist[b][e] - dist[c][e]
+                if delta < -EPSILON and self.can_reverse(tour, i, j):
+                    tour[i:j + 1] = tour[i:j + 1][::-1]
+                    return True
+            if self.out_of_time():
+                return False
+        return False
+
+    def can_reverse(self, tour, i, j):
+        segment = set(tour[i:j + 1])
+        return not any(pred in segment for node in segment for pred in self.before.get(node, ()))
+
+    def or_opt(self, tour):
+        """Apply the first improving feasible move of a short segment; return whether one was found"""
+        dist = self.dist
+        n = len(tour)
+        for length in range(1, min(OR_OPT_MAX_SEGMENT, n - 1) + 1):
+            for i in range(n - length + 1):
+                j = i + length - 1
+                a = tour[i - 1] if i > 0 else 0
+                first, last = tour[i], tour[j]
+                e = tour[j + 1] if j + 1 < n else None
+                removed = dist[a][first] + (dist[last][e] - dist[a][e] if e is not None else 0)
+
+                rest = tour[:i] + tour[j + 1:]
+                for k in range(len(rest) + 1):
+                    if k == i:
+                        continue
+                    p = rest[k - 1] if k > 0 else 0
+                    q = rest[k] if k < len(rest) else None
+                    added = dist[p][first] + (dist[last][q] - dist[p][q] if q is not None else 0)
+                    if added - removed < -EPSILON:
+                        candidate = rest[:k] + tour[i:j + 1] + rest[k:]
+                        if self.is_feasible(candidate):
+                            tour[:] = candidate
+                            return True
+                if self.out_of_time():
+                    return False
+        return False
+
+
+def optimize_stop_order(start_lat, start_lng, waypoints, time_budget=DEFAULT_TIME_BUDGET_SECONDS):
+    """Reorder waypoints to shorten the trip while keeping each load's pickups before its drops"""
+    if len(waypoints) < 2:
+        return list(waypoints)
+
+    matrix = waypoint_distance_matrix(start_lat, start_lng, waypoints)
+    optimizer = StopOrderOptimizer(matrix, precedence_constraints(waypoints), time_budget=time_budget)
+    return [waypoints[i] for i in optimizer.solve()]
@@ -0,0 +1,87 @@
+"""
+Warming the planning cache with the lanes the fleet runs most.
+
+Most trips repeat a few hundred lanes between fixed terminals. Their plans and log timelines are mined
+from trip history, computed in a process pool and written to the 'planning' cache, so requests after a
+deploy find them there instead of running the planner cold. Cycle hours only reach the planner as hours
+since the last 10-hour break, so trips are bucketed by that value rather than by raw cycle hours.
+"""
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.db.models import Count
+
+from .models import Trip
+from .util import (
+    default_log_start, log_timeline_key, log_timeline_offsets, plan_route, planning_cache, route_plan_key,
+    trip_hours_since_rest, trip_waypoints,
+)
+
+LANE_FIELDS = [
+    'current_lat', 'current_lng', 'pickup_location', 'pickup_lat', 'pickup_lng',
+    'dropoff_location', 'dropoff_lat', 'dropoff_lng',
+]
+WARM_CHUNK_SIZE = 50
+
+
+def lane_plan_inputs(trip_data):
+    """(start_lat, start_lng, waypoints, hours_since_rest) of a trip, as generate_route_stops plans it"""
+    return (
+        trip_data['current_lat'], trip_data['current_lng'], trip_waypoints(trip_data), trip_hours_since_rest(trip_data),
+    )
+
+
+def frequent_lanes(trips, limit):
+    """The most frequent lanes of some trips as (planner inputs, trip count), most frequent first"""
+    rows = trips.order_by().values(*LANE_FIELDS, 'current_cycle_hours').annotate(trips=Count('id'))
+    counts, inputs = Counter(), {}
+    for row in rows.iterator():
+        lane = lane_plan_inputs(row)
+        key = route_plan_key(*lane)
+        inputs.setdefault(key, lane)
+        counts[key] += row['trips']
+    return [(inputs[key], count) for key, count in counts.most_common(limit)]
+
+
+def plan_lanes(lanes):
+    """Worker task: the cache entries (plan and log timeline) of a chunk of lanes"""
+    entries = {}
+    start = default_log_start()
+    for start_lat, start_lng, waypoints, hours_since_rest in lanes:
+        plan = plan_route(start_lat, start_lng, waypoints, hours_since_rest=hours_since_rest)
+        entries[route_plan_key(start_lat, start_lng, waypoints, hours_since_rest)] = plan
+        entries[log_timeline_key(plan[0], start.time())] = log_timeline_offsets(plan[0], start)
+    return entries
+
+
+def warm_lanes(lanes, workers=None):
+    """Plan lanes in a process pool (inline with workers=0) and store them in the planning cache.
+
+    Returns the number of cache entries written.
+    """
+    chunks = [lanes[first:first + WARM_CHUNK_SIZE] for first in range(0, len(lanes), WARM_CHUNK_SIZE)]
+    if workers == 0:
+        results = map(plan_lanes, chunks)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=django.setup)
+        results = executor.map(plan_lanes, chunks)
+
+    written = 0
+    try:
+        for entries in results:
+            planning_cache().set_many(entries)
+            written += len(entries)
+    finally:
+        if workers != 0:
+            executor.shutdown()
+    return written
+
+
+def plan_hit_rate(trips):
+    """Share of these trips whose plan the planning cache already holds"""
+    keys = [route_plan_key(*lane_plan_inputs(row)) for row in trips.values(*LANE_FIELDS, 'current_cycle_hours')]
+    if not keys:
+        return 0.0
+    cached = planning_cache().get_many(set(keys))
+    return sum(key in cached for key in keys) / len(keys)
@@ -0,0 +1,103 @@
+"""
+Bulk deletion of trips without Django's cascade collector.
+
+Model.delete() loads every related row into memory before deleting it. Here each chunk of trip ids
+becomes one raw statement per table, children first (log entries, then daily logs, route stops, ...),
+and references with on_delete=SET_NULL are cleared with an UPDATE. Every chunk runs in its own short
+transaction so SQLite's write lock is never held for long.
+"""
+import time
+
+from django.db import connection, models, transaction
+
+from .models import Trip
+from .timeline import remove_trips_from_timelines
+
+PURGE_CHUNK_SIZE = 500
+
+
+def reverse_relations(model):
+    """Foreign keys pointing at a model, including those hidden with related_name='+'"""
+    return [
+        field for field in model._meta.get_fields(include_hidden=True)
+        if field.auto_created and not field.concrete and (field.one_to_many or field.one_to_one)
+    ]
+
+
+def purge_statements(model, ids_sql):
+    """(kind, table, where, column) for every table to touch when deleting rows whose pk is in ids_sql.
+
+    Descendants come before their parents, so no statement ever leaves a dangling reference.
+    """
+    quote = connection.ops.quote_name
+    statements = []
+    for relation in reverse_relations(model):
+        child = relation.related_model
+        table, column = child._meta.db_table, relation.field.column
+        where = f'{quote(column)} IN ({ids_sql})'
+
+        if relation.on_delete is models.CASCADE:
+            child_ids = f'SELECT {quote(child._meta.pk.column)} FROM {quote(table)} WHERE {where}'
+            statements += purge_statements(child, child_ids)
+            statements.append(('delete', table, where, column))
+        elif relation.on_delete is models.SET_NULL:
+            statements.append(('set_null', table, where, column))
+        elif relation.on_delete is not models.DO_NOTHING:
+            raise ValueError(f'Cannot purge through {child.__name__}.{relation.field.name} ({relation.on_delete.__name__})')
+    return statements
+
+
+def trip_purge_statements(chunk_size):
+    """The statements that purge one chunk of trips, the trips themselves last"""
+    ids_sql = ', '.join(['%s'] * chunk_size)
+    quote = connection.ops.quote_name
+    pk = quote(Trip._meta.pk.column)
+    return purge_statements(Trip, ids_sql) + [('delete', Trip._meta.db_table, f'{pk} IN ({ids_sql})', None)]
+
+
+def purge_chunk(trip_ids, dry_run=False):
+    """Delete (or with dry_run, count) the rows of these trips table by table; returns rows per table"""
+    quote = connection.ops.quote_name
+    counts = {}
+    with connection.cursor() as cursor:
+        for kind, table, where, column in trip_purge_statements(len(trip_ids)):
+            if dry_run:
+                cursor.execute(f'SELECT COUNT(*) FROM {quote(table)} WHERE {where}', trip_ids)
+                rows = cursor.fetchone()[0]
+            elif kind == 'delete':
+                cursor.execute(f'DELETE FROM {quote(table)} WHERE {where}', trip_ids)
+                rows = cursor.rowcount
+            else:
+                cursor.execute(f'UPDATE {quote(table)} SET {quote(column)} = NULL WHERE {where}', trip_ids)
+                rows = cursor.rowcount
+            counts[table] = counts.get(table, 0) + rows
+    return counts
+
+
+def purge_trips(queryset, chunk_size=PURGE_CHUNK_SIZE, dry_run=False):
+    """Purge the trips of a queryset in ascending id chunks, one transaction each.
+
+    Yields the running totals after every chunk: trips, rows per table, rows (all tables), seconds
+    and rows_per_second. With dry_run nothing is deleted and the rows that would be are counted.
+    """
+    started = time.perf_counter()
+    totals = {'trips': 0, 'tables': {}, 'rows': 0, 'seconds': 0.0, 'rows_per_second': 0.0}
+    last_id = 0
+    while True:
+        trip_ids = list(queryset.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not trip_ids:
+            return
+        last_id = trip_ids[-1]
+
+        with transaction.atomic():
+            if not dry_run:
+                remove_trips_from_timelines(trip_ids)
+            counts = purge_chunk(trip_ids, dry_run=dry_run)
+
+        totals['trips'] += len(trip_ids)
+        for table, rows in counts.items():
+            totals['tables'][table] = totals['tables'].get(table, 0) + rows
+        totals['rows'] = sum(totals['tables'].values())
+        totals['seconds'] = time.perf_counter() - started
+        totals['rows_per_second'] = totals['rows'] / totals['seconds'] if totals['seconds'] else 0.0
+        yield totals
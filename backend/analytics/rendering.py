@@ -0,0 +1,344 @@
+import io
+import zlib
+from xml.sax.saxutils import escape
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from .metrics import CACHE_REQUESTS
+from .models import DailyLog, LogEntry
+
+# Letter landscape, in points; the SVG uses the same units so both formats share one layout
+SHEET_WIDTH = 792
+SHEET_HEIGHT = 612
+GRID_LEFT = 160
+GRID_TOP = 150
+HOUR_WIDTH = 22
+ROW_HEIGHT = 30
+TOTALS_X = GRID_LEFT + 24 * HOUR_WIDTH + 40
+REMARKS_TOP = 332
+REMARK_LINE_HEIGHT = 12
+REMARK_COLUMN_WIDTH = 360
+REMARK_LINES_PER_COLUMN = (SHEET_HEIGHT - 36 - REMARKS_TOP) // REMARK_LINE_HEIGHT
+STATUS_LINE_WIDTH = 2
+HEADER_FIELD_WIDTH = 250
+# Rendered sheets are keyed by updated_at, so stale entries are never served and only need to expire
+SHEET_CACHE_TIMEOUT = 60 * 60 * 24
+
+SHEET_FORMATS = {
+    'svg': 'image/svg+xml',
+    'pdf': 'application/pdf',
+}
+STATUS_ROWS = [LogEntry.OFF_DUTY, LogEntry.SLEEPER_BERTH, LogEntry.DRIVING, LogEntry.ON_DUTY]
+STATUS_LABELS = dict(LogEntry.STATUS_CHOICES)
+LOG_FIELDS = [
+    'id', 'trip_id', 'date', 'driver_name', 'home_terminal', 'total_miles_today', 'total_hours_driving',
+    'total_hours_on_duty', 'updated_at', 'trip__pickup_location', 'trip__dropoff_location',
+]
+ENTRY_FIELDS = ['daily_log_id', 'status', 'start_time', 'end_time', 'duration_hours', 'location', 'remarks']
+
+# Advance widths of the standard Helvetica font for ASCII 32-126, in 1/1000 em
+HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+
+
+def sheet_from_values(log, entries):
+    """Plain, picklable log sheet from a DailyLog values() row and its entry rows"""
+    return {
+        'id': log['id'],
+        'trip_id': log['trip_id'],
+        'date': log['date'],
+        'driver_name': log['driver_name'],
+        'home_terminal': log['home_terminal'],
+        'from_location': log['trip__pickup_location'],
+        'to_location': log['trip__dropoff_location'],
+        'total_miles': log['total_miles_today'],
+        'updated_at': log['updated_at'],
+        'entries': [
+            {field: entry[field] for field in ENTRY_FIELDS if field != 'daily_log_id'}
+            for entry in sorted(entries, key=lambda e: e['start_time'])
+        ],
+    }
+
+
+def log_sheet_data(daily_log):
+    """The log sheet of one DailyLog, read with two values() queries"""
+    log = DailyLog.objects.filter(pk=daily_log.pk).values(*LOG_FIELDS).get()
+    entries = LogEntry.objects.filter(daily_log_id=daily_log.pk).values(*ENTRY_FIELDS)
+    return sheet_from_values(log, list(entries))
+
+
+def minute_of_day(value, end=False):
+    """Minutes since midnight; an entry ending at 23:59 runs to the end of the day"""
+    minutes = value.hour * 60 + value.minute
+    return 24 * 60 if end and minutes == 24 * 60 - 1 else minutes
+
+
+def status_segments(entries):
+    """(status, start minute, end minute) covering the whole day; unlogged time is off duty"""
+    segments, clock = [], 0
+    for entry in entries:
+        start, end = minute_of_day(entry['start_time']), minute_of_day(entry['end_time'], end=True)
+        if start > clock:
+            segments.append((LogEntry.OFF_DUTY, clock, start))
+        if end > start:
+            segments.append((entry['status'], start, end))
+            clock = end
+    if clock < 24 * 60:
+        segments.append((LogEntry.OFF_DUTY, clock, 24 * 60))
+    return segments
+
+
+def hour_label(hour):
+    if hour in (0, 24):
+        return 'Mid.'
+    if hour == 12:
+        return 'Noon'
+    return str(hour % 12)
+
+
+def sheet_shapes(sheet):
+    """Lay out one FMCSA-style grid log sheet as lines, a status path and text, y pointing down.
+
+    Returns ('line', x1, y1, x2, y2, width), ('path', points, width) and
+    ('text', x, y, text, size, anchor, bold) tuples that the SVG and PDF writers both draw.
+    """
+    shapes = []
+    line = lambda x1, y1, x2, y2, width=0.5: shapes.append(('line', x1, y1, x2, y2, width))
+    text = lambda x, y, value, size=9, anchor='start', bold=False: shapes.append(
+        ('text', x, y, str(value), size, anchor, bold)
+    )
+
+    text(36, 48, "Driver's Daily Log", size=18, bold=True)
+    text(SHEET_WIDTH - 36, 48, sheet['date'].strftime('%A, %B %d, %Y'), size=12, anchor='end')
+    field = lambda x, y, label, value: text(x, y, fit_text(f'{label}: {value or "-"}', 10, HEADER_FIELD_WIDTH), size=10)
+    field(36, 76, 'Driver', sheet['driver_name'])
+    field(300, 76, 'Home terminal', sheet['home_terminal'])
+    text(SHEET_WIDTH - 36, 76, f"Trip #{sheet['trip_id']}", size=10, anchor='end')
+    field(36, 94, 'From', sheet['from_location'])
+    field(300, 94, 'To', sheet['to_location'])
+    text(SHEET_WIDTH - 36, 94, f"Total miles today: {sheet['total_miles']:.0f}", size=10, anchor='end')
+
+    grid_right = GRID_LEFT + 24 * HOUR_WIDTH
+    grid_bottom = GRID_TOP + len(STATUS_ROWS) * ROW_HEIGHT
+
+    for hour in range(25):
+        x = GRID_LEFT + hour * HOUR_WIDTH
+        text(x, GRID_TOP - 6, hour_label(hour), size=7, anchor='middle')
+        line(x, GRID_TOP, x, grid_bottom, 0.75 if hour % 6 else 1)
+    text(TOTALS_X, GRID_TOP - 6, 'Total Hours', size=8, anchor='middle', bold=True)
+
+    segments = status_segments(sheet['entries'])
+    for row, status in enumerate(STATUS_ROWS):
+        top = GRID_TOP + row * ROW_HEIGHT
+        line(GRID_LEFT, top, grid_right, top, 1)
+        text(36, top + ROW_HEIGHT / 2 + 3, f'{row + 1}. {STATUS_LABELS[status]}', size=8)
+        # Quarter-hour ticks hang from the top of each row; half hours are longer
+        for quarter in range(1, 24 * 4):
+            if quarter % 4:
+                x = GRID_LEFT + quarter * HOUR_WIDTH / 4
+                line(x, top, x, top + (ROW_HEIGHT / 2 if quarter % 2 == 0 else ROW_HEIGHT / 4), 0.3)
+        hours = sum(end - start for s, start, end in segments if s == status) / 60
+        text(TOTALS_X, top + ROW_HEIGHT / 2 + 3, f'{hours:.2f}', size=9, anchor='middle')
+    line(GRID_LEFT, grid_bottom, grid_right, grid_bottom, 1)
+    total = sum(end - start for _, start, end in segments) / 60
+    text(TOTALS_X, grid_bottom + 14, f'= {total:.2f}', size=9, anchor='middle', bold=True)
+
+    # The duty status line: across each row for the time spent in it, down or up at every change
+    points = []
+    for status, start, end in segments:
+        y = GRID_TOP + (STATUS_ROWS.index(status) + 0.5) * ROW_HEIGHT
+        points.append((GRID_LEFT + start * HOUR_WIDTH / 60, y))
+        points.append((GRID_LEFT + end * HOUR_WIDTH / 60, y))
+    shapes.append(('path', points, STATUS_LINE_WIDTH))
+
+    text(36, grid_bottom + 40, 'Remarks', size=11, bold=True)
+    line(36, grid_bottom + 46, SHEET_WIDTH - 36, grid_bottom + 46, 0.5)
+    capacity = 2 * REMARK_LINES_PER_COLUMN
+    entries = sheet['entries']
+    for index, entry in enumerate(entries[:capacity]):
+        column, row = divmod(index, REMARK_LINES_PER_COLUMN)
+        if index == capacity - 1 and len(entries) > capacity:
+            remark = f'... {len(entries) - index} more entries'
+        else:
+            remark = f"{entry['start_time']:%H:%M}  {STATUS_LABELS[entry['status']]}"
+            if entry['location']:
+                remark += f" - {entry['location']}"
+            if entry['remarks']:
+                remark += f" ({entry['remarks']})"
+        x = 36 + column * REMARK_COLUMN_WIDTH
+        text(x, REMARKS_TOP + row * REMARK_LINE_HEIGHT, fit_text(remark, 8, REMARK_COLUMN_WIDTH - 12), size=8)
+
+    return shapes
+
+
+def text_width(value, size):
+    """Width of a string set in Helvetica, in points"""
+    return sum(HELVETICA_WIDTHS[ord(c) - 32] if 32 <= ord(c) <= 126 else 556 for c in value) * size / 1000
+
+
+def fit_text(value, size, width):
+    """Cut a string short with an ellipsis so it fits the given width"""
+    if text_width(value, size) <= width:
+        return value
+    while value and text_width(value + '...', size) > width:
+        value = value[:-1]
+    return value + '...'
+
+
+def render_svg(sheet):
+    """Draw a log sheet as a standalone SVG document"""
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{SHEET_WIDTH}pt" height="{SHEET_HEIGHT}pt" '
+        f'viewBox="0 0 {SHEET_WIDTH} {SHEET_HEIGHT}" font-family="Helvetica, Arial, sans-serif">',
+        f'<rect width="{SHEET_WIDTH}" height="{SHEET_HEIGHT}" fill="#fff"/>',
+        '<g stroke="#000" stroke-linecap="square">',
+    ]
+    texts = []
+    for shape in sheet_shapes(sheet):
+        if shape[0] == 'line':
+            _, x1, y1, x2, y2, width = shape
+            parts.append(f'<line x1="{x1:g}" y1="{y1:g}" x2="{x2:g}" y2="{y2:g}" stroke-width="{width:g}"/>')
+        elif shape[0] == 'path':
+            _, points, width = shape
+            coords = ' '.join(f'{x:.2f},{y:.2f}' for x, y in points)
+            parts.append(f'<polyline points="{coords}" fill="none" stroke-width="{width:g}"/>')
+        else:
+            _, x, y, value, size, anchor, bold = shape
+            weight = ' font-weight="bold"' if bold else ''
+            texts.append(
+                f'<text x="{x:g}" y="{y:g}" font-size="{size:g}" text-anchor="{anchor}"{weight}>{escape(value)}</text>'
+            )
+    parts.append('</g>')
+    parts.extend(texts)
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+
+def pdf_string(value):
+    """A PDF literal string in WinAnsiEncoding"""
+    encoded = value.encode('cp1252', errors='replace')
+    return b'(' + encoded.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def pdf_page_content(sheet):
+    """Draw a log sheet as a compressed PDF page content stream"""
+    ops = []
+    flip = lambda y: SHEET_HEIGHT - y
+    for shape in sheet_shapes(sheet):
+        if shape[0] == 'line':
+            _, x1, y1, x2, y2, width = shape
+            ops.append(f'{width:g} w {x1:g} {flip(y1):g} m {x2:g} {flip(y2):g} l S'.encode())
+        elif shape[0] == 'path':
+            _, points, width = shape
+            (x, y), rest = points[0], points[1:]
+            path = [f'{width:g} w 1 j {x:.2f} {flip(y):.2f} m']
+            path.extend(f'{x:.2f} {flip(y):.2f} l' for x, y in rest)
+            ops.append((' '.join(path) + ' S').encode())
+        else:
+            _, x, y, value, size, anchor, bold = shape
+            if anchor != 'start':
+                x -= text_width(value, size) / (2 if anchor == 'middle' else 1)
+            font = b'/F2' if bold else b'/F1'
+            ops.append(b'BT %s %g Tf %.2f %.2f Td %s Tj ET' % (font, size, x, flip(y), pdf_string(value)))
+    return zlib.compress(b'\n'.join(ops))
+
+
+class PdfWriter:
+    """Minimal streaming PDF writer for vector log sheets.
+
+    Pages are written to the output as they are added, so a long document never has to be held in
+    memory; only the byte offsets of its objects are kept for the cross-reference table.
+    """
+    CATALOG, PAGES, REGULAR_FONT, BOLD_FONT = 1, 2, 3, 4
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.offsets = {}
+        self.position = 0
+        self.page_ids = []
+        self.next_id = 5
+        self.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self.write_object(self.REGULAR_FONT, self.font('Helvetica'))
+        self.write_object(self.BOLD_FONT, self.font('Helvetica-Bold'))
+
+    @staticmethod
+    def font(name):
+        return b'<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>' % name.encode()
+
+    def write(self, data):
+        self.stream.write(data)
+        self.position += len(data)
+
+    def write_object(self, object_id, body):
+        self.offsets[object_id] = self.position
+        self.write(b'%d 0 obj\n%s\nendobj\n' % (object_id, body))
+
+    def add_page(self, content):
+        """Append a page from a content stream made by pdf_page_content"""
+        content_id, page_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self.write_object(
+            content_id, b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(content), content)
+        )
+        self.write_object(page_id, (
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R '
+            b'/Resources << /Font << /F1 %d 0 R /F2 %d 0 R >> >> >>'
+        ) % (self.PAGES, SHEET_WIDTH, SHEET_HEIGHT, content_id, self.REGULAR_FONT, self.BOLD_FONT))
+        self.page_ids.append(page_id)
+
+    def close(self):
+        """Write the page tree, catalog and cross-reference table"""
+        kids = b' '.join(b'%d 0 R' % page_id for page_id in self.page_ids)
+        self.write_object(self.PAGES, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self.page_ids)))
+        self.write_object(self.CATALOG, b'<< /Type /Catalog /Pages %d 0 R >>' % self.PAGES)
+
+        xref_offset = self.position
+        lines = [b'xref', b'0 %d' % self.next_id, b'0000000000 65535 f ']
+        lines.extend(b'%010d 00000 n ' % self.offsets[object_id] for object_id in range(1, self.next_id))
+        lines.append(b'trailer\n<< /Size %d /Root %d 0 R >>' % (self.next_id, self.CATALOG))
+        lines.append(b'startxref\n%d\n%%%%EOF\n' % xref_offset)
+        self.write(b'\n'.join(lines))
+
+
+def render_pdf(sheets, stream=None):
+    """Draw log sheets as a PDF with one page per sheet; returns the bytes unless a stream is given"""
+    output = stream if stream is not None else io.BytesIO()
+    writer = PdfWriter(output)
+    for sheet in sheets:
+        writer.add_page(pdf_page_content(sheet))
+    writer.close()
+    return None if stream is not None else output.getvalue()
+
+
+def render_sheet(sheet, fmt):
+    """A single log sheet as SVG text or PDF bytes"""
+    return render_svg(sheet) if fmt == 'svg' else render_pdf([sheet])
+
+
+def sheet_version(daily_log):
+    """Changes whenever the log or any of its entries is saved, or an entry is added or deleted"""
+    entries = daily_log.entries.aggregate(latest=Max('updated_at'), count=Count('id'))
+    latest = entries['latest'].timestamp() if entries['latest'] else 0
+    return f'{daily_log.updated_at.timestamp()}:{latest}:{entries["count"]}'
+
+
+def sheet_cache_key(log_id, version, fmt):
+    return f'log-sheet:{fmt}:{log_id}:{version}'
+
+
+def cached_log_sheet(daily_log, fmt):
+    """Render a DailyLog, reusing the cached file until the log or one of its entries changes"""
+    key = sheet_cache_key(daily_log.pk, sheet_version(daily_log), fmt)
+    rendered = cache.get(key)
+    CACHE_REQUESTS.inc(cache='log_sheet', result='miss' if rendered is None else 'hit')
+    if rendered is None:
+        rendered = render_sheet(log_sheet_data(daily_log), fmt)
+        cache.set(key, rendered, SHEET_CACHE_TIMEOUT)
+    return rendered
@@ -0,0 +1,230 @@
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .availability import update_driver_status
+from .constants import TripConstants
+from .corridor import route_progress, save_trip_corridor
+from .geometry import save_trip_geometry
+from .models import DailyLog, LogEntry, RouteStop
+from .timeline import update_driver_timelines
+from .util import (
+    build_log_timeline, calculate_distance, daily_totals, plan_route, plan_start, trip_hours_since_rest,
+)
+
+STOP_FIELDS = [
+    'stop_type', 'location_name', 'latitude', 'longitude', 'duration_hours',
+    'distance_from_previous', 'cumulative_hours',
+]
+ENTRY_FIELDS = ['status', 'start_time', 'end_time', 'duration_hours', 'location']
+# A driver reported this close to a route stop is at that stop
+ARRIVAL_RADIUS_MILES = 2.0
+
+
+def completed_stop_count(trip, stops, current_lat, current_lng, elapsed_hours):
+    """How many of the trip's route stops (in order) lie behind the driver's reported position.
+
+    Progress comes from projecting the position onto the planned route, never from the clock alone, so
+    a late driver keeps every pickup and drop-off still ahead. A stop the driver is at counts as done
+    once its planned time there is over.
+    """
+    points = [(trip.current_lat, trip.current_lng)] + [(s.latitude, s.longitude) for s in stops]
+    progress = route_progress(points, current_lat, current_lng)
+    completed = 0
+    for index, stop in enumerate(stops, start=1):
+        if index > progress:
+            break
+        at_stop = calculate_distance(stop.latitude, stop.longitude, current_lat, current_lng) <= ARRIVAL_RADIUS_MILES
+        if at_stop and stop.cumulative_hours + stop.duration_hours > elapsed_hours:
+            break
+        completed = index
+    return completed
+
+
+def remaining_route(trip):
+    """What the stored plan still has ahead: (origin, pickup and drop-off waypoints, rests already taken).
+
+    The origin is where the route was last planned from (the trip's start, or the last replan's position)
+    with the driver's state there and its hours after the plan start.
+    """
+    origin = trip.replan_origin or {
+        'latitude': trip.current_lat,
+        'longitude': trip.current_lng,
+        'elapsed_hours': 0.0,
+        'hours_since_rest': trip_hours_since_rest({'current_cycle_hours': trip.current_cycle_hours}),
+        'miles_since_fuel': 0.0,
+        'completed_stops': 0,
+    }
+    stops = list(trip.route_stops.order_by('order').values('stop_type', 'location_name', 'latitude', 'longitude'))
+    completed, remaining = stops[:origin['completed_stops']], stops[origin['completed_stops']:]
+    waypoints = [s for s in remaining if s['stop_type'] in (RouteStop.PICKUP_LOCATION, RouteStop.DROPOFF_LOCATION)]
+    completed_rests = sum(1 for s in completed if s['stop_type'] == RouteStop.REST_BREAK)
+    return origin, waypoints, completed_rests
+
+
+def assign_changed(instance, values, fields):
+    """Copy values onto a model instance; return whether anything actually changed"""
+    changed = False
+    for field in fields:
+        if getattr(instance, field) != values[field]:
+            setattr(instance, field, values[field])
+            changed = True
+    return changed
+
+
+def sync_rows(existing, desired, fields, make):
+    """Pair existing rows with desired values in order; update, create and delete only the difference"""
+    to_update = [row for row, values in zip(existing, desired) if assign_changed(row, values, fields)]
+    to_create = [make(values) for values in desired[len(existing):]]
+    to_delete = [row.pk for row in existing[len(desired):]]
+    return to_update, to_create, to_delete
+
+
+@transaction.atomic
+def replan_trip(trip, current_lat, current_lng, hours_since_rest, current_time=None, completed_stops=None,
+                cycle_hours=None):
+    """Re-plan the rest of a trip from the driver's live position.
+
+    Route stops and log entries before the driver's position are kept; the planner only runs for
+    the remaining waypoints, and only rows whose values differ from the new plan are written.
+    completed_stops defaults to the stops behind the reported position (completed_stop_count).
+    Returns the number of rows created, updated and deleted per table.
+    """
+    current_time = timezone.make_naive(current_time or timezone.now())
+    start = plan_start(trip)
+    elapsed_hours = max(0.0, (current_time - start).total_seconds() / 3600)
+
+    stops = list(trip.route_stops.order_by('order'))
+    if completed_stops is None:
+        completed_stops = completed_stop_count(trip, stops, current_lat, current_lng, elapsed_hours)
+    completed, remaining = stops[:completed_stops], stops[completed_stops:]
+
+    waypoints = [
+        {'stop_type': s.stop_type, 'location_name': s.location_name, 'latitude': s.latitude, 'longitude': s.longitude}
+        for s in remaining if s.stop_type in (RouteStop.PICKUP_LOCATION, RouteStop.DROPOFF_LOCATION)
+    ]
+
+    # Miles driven since the last completed fuel stop, including the way to the current position
+    miles_since_fuel = 0.0
+    for stop in completed:
+        miles_since_fuel = 0.0 if stop.stop_type == RouteStop.FUEL_STOP else miles_since_fuel + stop.distance_from_previous
+    if completed:
+        miles_since_fuel += calculate_distance(completed[-1].latitude, completed[-1].longitude, current_lat, current_lng)
+
+    new_stops, remaining_distance, remaining_time = plan_route(
+        current_lat, current_lng, waypoints, hours_since_rest=hours_since_rest, miles_since_fuel=miles_since_fuel
+    )
+    for stop in new_stops:
+        stop['order'] += completed_stops
+        stop['cumulative_hours'] += elapsed_hours
+
+    changes = {}
+    to_update, to_create, to_delete = sync_rows(
+        remaining, new_stops, STOP_FIELDS, lambda values: RouteStop(trip=trip, **values)
+    )
+    RouteStop.objects.bulk_update(to_update, STOP_FIELDS)
+    RouteStop.objects.bulk_create(to_create)
+    RouteStop.objects.filter(pk__in=to_delete).delete()
+    changes['route_stops'] = {'updated': len(to_update), 'created': len(to_create), 'deleted': len(to_delete)}
+
+    changes['log_entries'] = replan_daily_logs(trip, new_stops, current_time)
+
+    all_stops = [{'stop_type': s.stop_type} for s in completed] + new_stops
+    trip.total_distance = sum(s.distance_from_previous for s in completed) + remaining_distance
+    trip.estimated_drive_time = trip.total_distance / TripConstants.AVERAGE_SPEED_MILES_PER_HOUR
+    trip.total_trip_time = elapsed_hours + remaining_time
+    trip.fuel_stops_needed = sum(1 for s in all_stops if s['stop_type'] == RouteStop.FUEL_STOP)
+    trip.rest_breaks_needed = sum(1 for s in all_stops if s['stop_type'] == RouteStop.REST_BREAK)
+    trip.replan_origin = {
+        'latitude': current_lat,
+        'longitude': current_lng,
+        'elapsed_hours': elapsed_hours,
+        'hours_since_rest': hours_since_rest,
+        'miles_since_fuel': miles_since_fuel,
+        'completed_stops': completed_stops,
+    }
+    trip.save(update_fields=[
+        'total_distance', 'estimated_drive_time', 'total_trip_time', 'fuel_stops_needed',
+        'rest_breaks_needed', 'replan_origin', 'updated_at',
+    ])
+
+    route_points = list(trip.route_stops.order_by('order').values('latitude', 'longitude'))
+    save_trip_geometry(trip, route_points)
+    save_trip_corridor(trip, route_points)
+
+    if new_stops:
+        if cycle_hours is None:
+            rest_hours = sum(s.duration_hours for s in completed if s.stop_type == RouteStop.REST_BREAK)
+            cycle_hours = trip.current_cycle_hours + elapsed_hours - rest_hours
+        trip_data = {'current_cycle_hours': cycle_hours, 'hours_since_rest': hours_since_rest}
+        available_at = timezone.make_aware(current_time) + timedelta(hours=remaining_time)
+        update_driver_status(trip, new_stops, remaining_time, trip_data, available_at=available_at)
+
+    return changes
+
+
+def replan_daily_logs(trip, new_stops, current_time):
+    """Rewrite the log timeline from current_time on, touching only entries that differ"""
+    timeline = build_log_timeline(new_stops, current_time)
+    cut_date, cut_time = current_time.date(), current_time.time()
+
+    logs = {log.date: log for log in trip.daily_logs.filter(date__gte=cut_date)}
+    entries_by_log = {}
+    for entry in LogEntry.objects.filter(daily_log__in=logs.values()).order_by('start_time'):
+        entries_by_log.setdefault(entry.daily_log_id, []).append(entry)
+
+    to_update, to_create, to_delete, touched_logs = [], [], [], []
+    changed_days = {}
+
+    for log_date in sorted(set(logs) | set(timeline)):
+        new_entries = timeline.get(log_date, [])
+        log = logs.get(log_date)
+        if log is None:
+            log = DailyLog.objects.create(
+                trip=trip, date=log_date, driver_name=trip.driver_name or '', home_terminal=trip.current_location
+            )
+        existing = entries_by_log.get(log.pk, [])
+
+        kept, truncated = [], False
+        if log_date == cut_date:
+            # Entries before the driver's position stay; one in progress is cut short at the position
+            kept = [entry for entry in existing if entry.start_time < cut_time]
+            existing = existing[len(kept):]
+            if kept and kept[-1].end_time > cut_time:
+                in_progress = kept[-1]
+                elapsed = datetime.combine(log_date, cut_time) - datetime.combine(log_date, in_progress.start_time)
+                in_progress.end_time = cut_time
+                in_progress.duration_hours = elapsed.total_seconds() / 3600
+                to_update.append(in_progress)
+                truncated = True
+
+        updated, created, deleted = sync_rows(
+            existing, new_entries, ENTRY_FIELDS, lambda values, log=log: LogEntry(daily_log=log, **values)
+        )
+        to_update += updated
+        to_create += created
+        to_delete += deleted
+
+        if not kept and not new_entries:
+            log.delete()
+            changed_days[log_date] = []
+            continue
+        if updated or created or deleted or truncated:
+            touched_logs.append((log, kept + new_entries))
+            changed_days[log_date] = kept + new_entries
+
+    LogEntry.objects.bulk_update(to_update, ENTRY_FIELDS)
+    LogEntry.objects.bulk_create(to_create)
+    LogEntry.objects.filter(pk__in=to_delete).delete()
+
+    for log, entries in touched_logs:
+        log.total_hours_driving, log.total_hours_on_duty = daily_totals([
+            entry if isinstance(entry, dict) else {'status': entry.status, 'duration_hours': entry.duration_hours}
+            for entry in entries
+        ])
+        # Saving bumps updated_at, which keys anything cached per log
+        log.save(update_fields=['total_hours_driving', 'total_hours_on_duty', 'updated_at'])
+    update_driver_timelines(trip, changed_days)
+
+    return {'updated': len(to_update), 'created': len(to_create), 'deleted': len(to_delete)}
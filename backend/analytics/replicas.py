@@ -0,0 +1,223 @@
+"""
+Routing of read-only API reads to read replicas of the default database.
+
+Only views wrapped in ``replica_reads`` read from a replica, and each request sticks to one replica so
+its reads are consistent with each other. Everything else — writes, management commands, reads of any
+other view — uses the primary, and so does a request once it has written (read-after-write). Lag is
+tolerated three ways: a client that wrote keeps reading from the primary for REPLICA_PIN_SECONDS (a
+cookie set by ReplicaRoutingMiddleware), a replica read that 404s is retried on the primary (a trip
+created a moment ago may not have replicated yet), and replicas measured further behind than
+REPLICA_MAX_LAG_SECONDS are skipped until they catch up.
+"""
+import contextvars
+import functools
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.http import Http404
+
+from .metrics import REPLICA_READS
+
+PRIMARY = 'default'
+PIN_COOKIE = 'primary_pin'
+# How long a replica's measured lag is trusted before it is measured again
+REPLICA_HEALTH_INTERVAL_SECONDS = 5.0
+
+
+class RoutingState:
+    """Where the current request reads from"""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None
+
+
+_state = contextvars.ContextVar('replica_routing_state', default=None)
+
+
+def replica_aliases():
+    return list(getattr(settings, 'REPLICA_DATABASES', []))
+
+
+class ReplicaLagMonitor:
+    """Per-process replication lag of each replica, re-measured every REPLICA_HEALTH_INTERVAL_SECONDS"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked = {}
+
+    def lag(self, alias):
+        """Seconds the replica is behind the primary; None if it cannot be reached"""
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                if connection.vendor != 'postgresql':
+                    # File copies and mirrors have no replay position to compare; reaching them is enough
+                    cursor.execute('SELECT 1')
+                    return 0.0
+                # An idle primary sends nothing to replay, so an up-to-date replica counts as no lag
+                cursor.execute(
+                    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+                    'ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END'
+                )
+                return float(cursor.fetchone()[0])
+        except DatabaseError:
+            return None
+
+    def healthy(self, alias):
+        now = time.monotonic()
+        with self.lock:
+            checked = self.checked.get(alias)
+        if checked is None or now - checked[0] > REPLICA_HEALTH_INTERVAL_SECONDS:
+            checked = (now, self.lag(alias))
+            with self.lock:
+                self.checked[alias] = checked
+        lag = checked[1]
+        return lag is not None and lag <= settings.REPLICA_MAX_LAG_SECONDS
+
+    def reset(self):
+        with self.lock:
+            self.checked.clear()
+
+
+MONITOR = ReplicaLagMonitor()
+
+
+def choose_replica():
+    """A replica that is reachable and caught up, picked at random to spread the load; None if none is"""
+    candidates = [alias for alias in replica_aliases() if MONITOR.healthy(alias)]
+    return random.choice(candidates) if candidates else None
+
+
+class ReplicaRouter:
+    """Sends a request's reads to its chosen replica and every write to the primary"""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.wrote or state.replica is None:
+            return PRIMARY
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # Whatever the request reads from now on must see this write
+            state.wrote = True
+            state.replica = None
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema by replication
+        return db not in replica_aliases()
+
+
+def start_replica_reads(state):
+    """Pick the replica for the request; returns the routing outcome"""
+    if state.pinned or state.wrote:
+        return 'primary_pinned'
+    state.replica = choose_replica()
+    return 'replica' if state.replica else 'primary_lagging'
+
+
+def replica_reads(view):
+    """Decorator for read-only view methods: read from a replica, retrying on the primary on a 404"""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        state = _state.get()
+        if state is None or not replica_aliases():
+            return view(*args, **kwargs)
+
+        outcome = start_replica_reads(state)
+        try:
+            response = view(*args, **kwargs)
+        except Http404:
+            if state.replica is None:
+                raise
+            outcome = 'primary_fallback'
+            state.replica = None
+            response = view(*args, **kwargs)
+        else:
+            if getattr(response, 'status_code', None) == 404 and state.replica is not None:
+                outcome = 'primary_fallback'
+                state.replica = None
+                response = view(*args, **kwargs)
+        finally:
+            REPLICA_READS.inc(target=outcome)
+        return response
+
+    return wrapper
+
+
+def on_replica(chunks, alias):
+    """Iterate a streaming response body with its reads routed to the replica its request started on.
+
+    The body is consumed after the view has returned, so each chunk is produced under a state of its own.
+    """
+    iterator = iter(chunks)
+    while True:
+        state = RoutingState()
+        state.replica = alias
+        token = _state.set(state)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _state.reset(token)
+        yield chunk
+
+
+def current_replica():
+    """Alias the current request reads from, None when it reads from the primary"""
+    state = _state.get()
+    if state is None or state.wrote:
+        return None
+    return state.replica
+
+
+class ReplicaRoutingMiddleware:
+    """Gives each request its own routing state, and keeps a client that wrote on the primary for a while"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        state = RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.pin(state, response)
+
+    async def __acall__(self, request):
+        state = RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.pin(state, response)
+
+    def pin(self, state, response):
+        if state.wrote and replica_aliases():
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, samesite='Lax')
+        return response
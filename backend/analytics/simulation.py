@@ -0,0 +1,147 @@
+"""
+Monte Carlo ETA and hours-of-service risk for a trip.
+
+plan_route drives at a constant TripConstants.AVERAGE_SPEED_MILES_PER_HOUR and stops for exactly
+HOSConstants.STOP_DURATION_HOURS, so its total_trip_time is a single, optimistic number. Here every
+sample gets its own speeds and dwell times and goes through the planner's own rules (a 10-hour rest once
+the hours since the last one reach the driving limit, fuel every FUEL_INTERVAL_MILES). All samples advance
+together as numpy arrays: the Python loop runs once per leg and per stop event, never per sample. With
+every spread set to zero a sample reproduces plan_route exactly.
+
+Speeds are lognormal around the planner's average: one factor per sample for the whole trip (weather,
+the driver) times one per leg (traffic on that stretch). Pickup, drop and fuel dwell times are lognormal
+with the planner's stop duration as their mean, so detention shows up as a long right tail.
+"""
+import numpy as np
+
+from .constants import HOSConstants, TripConstants
+from .util import calculate_distances
+
+DEFAULT_SAMPLES = 10000
+MAX_SAMPLES = 100000
+ETA_PERCENTILES = [10, 50, 80, 95]
+
+TRIP_SPEED_SIGMA = 0.08
+LEG_SPEED_SIGMA = 0.12
+DWELL_SIGMA = 0.6
+FUEL_DWELL_SIGMA = 0.3
+MIN_SPEED_MILES_PER_HOUR = 20
+MAX_SPEED_MILES_PER_HOUR = 70
+
+
+def lognormal(rng, mean, sigma, size):
+    """Lognormal samples with the given mean (not median); exactly the mean when sigma is 0"""
+    if sigma == 0:
+        return np.full(size, float(mean))
+    return rng.lognormal(np.log(mean) - sigma ** 2 / 2, sigma, size)
+
+
+def leg_distances(start_lat, start_lng, waypoints):
+    """Great-circle miles of each leg: start -> first waypoint -> ... -> last waypoint"""
+    points = np.array([(start_lat, start_lng)] + [(w['latitude'], w['longitude']) for w in waypoints],
+                      dtype=np.float64)
+    return calculate_distances(points[:-1, 0], points[:-1, 1], points[1:, 0], points[1:, 1])
+
+
+def simulate_route(start_lat, start_lng, waypoints, hours_since_rest=0.0, miles_since_fuel=0.0,
+                   samples=DEFAULT_SAMPLES, seed=None, trip_speed_sigma=TRIP_SPEED_SIGMA,
+                   leg_speed_sigma=LEG_SPEED_SIGMA, dwell_sigma=DWELL_SIGMA, fuel_dwell_sigma=FUEL_DWELL_SIGMA):
+    """Run the planner's rules for many sampled trips at once.
+
+    Returns per-sample arrays: arrival (hours until reaching the last waypoint), total (hours until its
+    stop is done, as total_trip_time counts it) and rests (number of 10-hour rests taken).
+    """
+    rng = np.random.default_rng(seed)
+    distances = leg_distances(start_lat, start_lng, waypoints)
+    max_driving = HOSConstants.MAX_DRIVING_HOURS
+    stop_hours = HOSConstants.STOP_DURATION_HOURS
+
+    speeds = np.clip(
+        TripConstants.AVERAGE_SPEED_MILES_PER_HOUR
+        * lognormal(rng, 1.0, trip_speed_sigma, (samples, 1))
+        * lognormal(rng, 1.0, leg_speed_sigma, (samples, len(distances))),
+        MIN_SPEED_MILES_PER_HOUR, MAX_SPEED_MILES_PER_HOUR,
+    )
+
+    elapsed = np.zeros(samples)
+    since_rest = np.full(samples, float(hours_since_rest))
+    since_fuel = np.full(samples, float(miles_since_fuel))
+    rests = np.zeros(samples, dtype=np.int64)
+    arrival = elapsed
+
+    for leg, leg_distance in enumerate(distances):
+        speed = speeds[:, leg]
+        covered = np.zeros(samples)
+
+        while True:
+            remaining = leg_distance - covered
+            miles_to_rest = np.maximum(0, max_driving - since_rest) * speed
+            miles_to_fuel = TripConstants.FUEL_INTERVAL_MILES - since_fuel
+            stopping = (remaining > miles_to_rest) | (remaining > miles_to_fuel)
+            if not stopping.any():
+                break
+
+            rest = stopping & (miles_to_rest <= miles_to_fuel)
+            fuel = stopping & ~rest
+            distance = np.where(rest, miles_to_rest, np.where(fuel, miles_to_fuel, 0.0))
+            drive = distance / speed
+            dwell = np.where(rest, HOSConstants.REQUIRED_REST_HOURS,
+                             np.where(fuel, lognormal(rng, stop_hours, fuel_dwell_sigma, samples), 0.0))
+
+            covered += distance
+            elapsed += drive + dwell
+            since_fuel = np.where(fuel, 0.0, since_fuel + distance)
+            since_rest = np.where(rest, 0.0, np.where(fuel, since_rest + drive + dwell, since_rest))
+            rests += rest
+
+        drive = (leg_distance - covered) / speed
+        arrival = elapsed + drive
+        dwell = lognormal(rng, stop_hours, dwell_sigma, samples)
+        elapsed = arrival + dwell
+        since_fuel = since_fuel + (leg_distance - covered)
+        since_rest = since_rest + drive + dwell
+
+    return {'arrival': arrival, 'total': elapsed, 'rests': rests}
+
+
+def percentile_hours(values):
+    points = np.percentile(values, ETA_PERCENTILES)
+    return {f'p{p}': round(float(v), 3) for p, v in zip(ETA_PERCENTILES, points)}
+
+
+def simulate_trip(start_lat, start_lng, waypoints, hours_since_rest=0.0, miles_since_fuel=0.0, elapsed_hours=0.0,
+                  completed_rests=0, samples=DEFAULT_SAMPLES, seed=None, **spreads):
+    """ETA percentiles and HOS risk of a trip, next to what the deterministic plan says.
+
+    A partly driven trip is simulated from where it was last planned; elapsed_hours and completed_rests
+    (the time and rests before that point) are added so every figure covers the whole trip.
+    extra_reset_probability is the share of samples that need more 10-hour rests than the plan has.
+    """
+    planned = simulate_route(
+        start_lat, start_lng, waypoints, hours_since_rest, miles_since_fuel, samples=1, trip_speed_sigma=0,
+        leg_speed_sigma=0, dwell_sigma=0, fuel_dwell_sigma=0,
+    )
+    runs = simulate_route(
+        start_lat, start_lng, waypoints, hours_since_rest, miles_since_fuel, samples=samples, seed=seed, **spreads
+    )
+    for run in (planned, runs):
+        run['arrival'] = run['arrival'] + elapsed_hours
+        run['total'] = run['total'] + elapsed_hours
+        run['rests'] = run['rests'] + completed_rests
+    planned_rests = int(planned['rests'][0])
+    return {
+        'samples': samples,
+        'planned': {
+            'arrival_hours': round(float(planned['arrival'][0]), 3),
+            'total_trip_time': round(float(planned['total'][0]), 3),
+            'rest_breaks': planned_rests,
+        },
+        'arrival_hours': percentile_hours(runs['arrival']),
+        'total_trip_time': percentile_hours(runs['total']),
+        'on_time_probability': round(float(np.mean(runs['arrival'] <= planned['arrival'][0])), 4),
+        'extra_reset_probability': round(float(np.mean(runs['rests'] > planned_rests)), 4),
+        'rest_breaks': {
+            str(int(rests)): round(int(count) / samples, 4)
+            for rests, count in zip(*np.unique(runs['rests'], return_counts=True))
+        },
+    }
@@ -0,0 +1,103 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from analytics import admin as analytics_admin
+from analytics.admin import EstimatedCountPaginator, prefix_condition
+from analytics.models import DailyLog, DriverDayTimeline, LogEntry, RouteStop, Trip
+
+
+class ScalableAdminTest(TestCase):
+    """Test cases for the admin changelists of large tables"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.trip_ids = []
+        for driver, dropoff, lat, lng in (('John Doe', 'Houston, TX', 29.7604, -95.3698),
+                                          ('Johnny Roe', 'Denver, CO', 39.7392, -104.9903),
+                                          ('Jane Roe', 'Miami, FL', 25.7617, -80.1918)):
+            response = self.client.post('/api/trips/', {
+                'driver_name': driver,
+                'current_location': 'New York, NY',
+                'current_lat': 40.7128,
+                'current_lng': -74.0060,
+                'pickup_location': 'Chicago, IL',
+                'pickup_lat': 41.8781,
+                'pickup_lng': -87.6298,
+                'dropoff_location': dropoff,
+                'dropoff_lat': lat,
+                'dropoff_lng': lng,
+                'current_cycle_hours': 0,
+            }, format='json')
+            self.trip_ids.append(response.data['id'])
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+
+    def test_changelists(self):
+        """Test that every changelist renders with a number of queries that does not grow with its rows"""
+        for model in ('trip', 'routestop', 'dailylog', 'logentry', 'archivedtrip', 'idempotencykey'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(f'/admin/analytics/{model}/')
+            self.assertEqual(response.status_code, 200, model)
+            self.assertLess(len(queries), 15, model)
+
+        self.assertGreater(LogEntry.objects.count(), 20)
+        self.assertContains(self.client.get('/admin/analytics/trip/', {'created_at__year': 2000}), '0 trips')
+
+    def test_deletes_update_timelines(self):
+        """Test that deleting trips from the admin takes them out of their drivers' day timelines"""
+        response = self.client.post(f'/admin/analytics/trip/{self.trip_ids[0]}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(DriverDayTimeline.objects.filter(driver_name='John Doe').exists())
+
+        response = self.client.post('/admin/analytics/trip/', {
+            'action': 'delete_selected', '_selected_action': self.trip_ids[1:], 'post': 'yes',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Trip.objects.exists())
+        self.assertFalse(DriverDayTimeline.objects.exists())
+
+    def test_prefix_search(self):
+        """Test that search matches driver names by prefix, and ids exactly"""
+        response = self.client.get('/admin/analytics/trip/', {'q': 'John'})
+        self.assertEqual(sorted(t.driver_name for t in response.context['cl'].result_list), ['John Doe', 'Johnny Roe'])
+
+        response = self.client.get('/admin/analytics/trip/', {'q': str(self.trip_ids[2])})
+        self.assertEqual([t.pk for t in response.context['cl'].result_list], [self.trip_ids[2]])
+
+        response = self.client.get('/admin/analytics/dailylog/', {'q': 'Jane'})
+        logs = response.context['cl'].result_list
+        self.assertTrue(logs)
+        self.assertEqual({log.driver_name for log in logs}, {'Jane Roe'})
+        # Other databases match the prefix with LIKE, as their collations need not order by code point
+        lookup = Trip.objects.filter(prefix_condition('driver_name', 'John', 'postgresql'))
+        self.assertIn('LIKE', str(lookup.query))
+        self.assertEqual(sorted(lookup.values_list('driver_name', flat=True)), ['John Doe', 'Johnny Roe'])
+        # Infix matches would need a full scan
+        response = self.client.get('/admin/analytics/trip/', {'q': 'Roe'})
+        self.assertEqual(len(response.context['cl'].result_list), 0)
+
+    def test_estimated_count(self):
+        """Test that large unfiltered tables report the estimate and filtered ones a capped count"""
+        stops = RouteStop.objects.count()
+        self.assertEqual(EstimatedCountPaginator(RouteStop.objects.all(), 50).count, stops)
+
+        with mock.patch.object(analytics_admin, 'EXACT_COUNT_LIMIT', 2):
+            # Without statistics SQLite has no estimate, so the count is capped
+            self.assertEqual(EstimatedCountPaginator(RouteStop.objects.all(), 50).count, 3)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            self.assertEqual(EstimatedCountPaginator(RouteStop.objects.all(), 50).count, stops)
+
+            # Deleted rows leave the estimate once statistics are refreshed
+            RouteStop.objects.filter(trip_id=self.trip_ids[0]).delete()
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            self.assertEqual(EstimatedCountPaginator(RouteStop.objects.all(), 50).count, RouteStop.objects.count())
+            self.assertEqual(EstimatedCountPaginator(Trip.objects.filter(driver_name__startswith='J'), 50).count, 3)
+            self.assertGreater(DailyLog.objects.filter(trip_id=self.trip_ids[0]).count(), 3)
+            self.assertEqual(EstimatedCountPaginator(DailyLog.objects.filter(trip_id=self.trip_ids[0]), 50).count, 3)
@@ -0,0 +1,89 @@
+import io
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from analytics.models import ArchivedTrip, DailyLog, LogEntry, RouteStop, Trip, TripGeometry
+
+
+class TripArchiveTest(TestCase):
+    """Test cases for archiving old trips to compressed monthly files and restoring them"""
+
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir)
+        settings_override = override_settings(ARCHIVE_DIR=self.archive_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client = APIClient()
+        self.trip_ids = []
+        for dropoff, lat, lng in (('Houston, TX', 29.7604, -95.3698), ('Denver, CO', 39.7392, -104.9903),
+                                  ('Miami, FL', 25.7617, -80.1918)):
+            response = self.client.post('/api/trips/', {
+                'driver_name': 'John Doe',
+                'current_location': 'New York, NY',
+                'current_lat': 40.7128,
+                'current_lng': -74.0060,
+                'pickup_location': 'Chicago, IL',
+                'pickup_lat': 41.8781,
+                'pickup_lng': -87.6298,
+                'dropoff_location': dropoff,
+                'dropoff_lat': lat,
+                'dropoff_lng': lng,
+                'current_cycle_hours': 0,
+            }, format='json')
+            self.trip_ids.append(response.data['id'])
+
+        Trip.objects.filter(pk=self.trip_ids[0]).update(created_at=datetime(2024, 1, 10, tzinfo=dt_timezone.utc))
+        Trip.objects.filter(pk=self.trip_ids[1]).update(created_at=datetime(2024, 2, 20, tzinfo=dt_timezone.utc))
+        self.before = {
+            trip_id: (self.client.get(f'/api/trips/{trip_id}/').content,
+                      self.client.get(f'/api/trips/{trip_id}/daily_logs/').content)
+            for trip_id in self.trip_ids
+        }
+
+    def test_dry_run_changes_nothing(self):
+        """Test that a dry run only counts the trips past the cutoff"""
+        output = io.StringIO()
+        call_command('archive_trips', '--before', '2025-01-01', '--dry-run', stdout=output)
+
+        self.assertIn('2 trips', output.getvalue())
+        self.assertEqual(Trip.objects.count(), 3)
+        self.assertEqual(os.listdir(self.archive_dir), [])
+
+    def test_archive_and_read_by_id(self):
+        """Test that old trips move to per-month files and are still served byte for byte by id"""
+        call_command('archive_trips', '--before', '2025-01-01', '--batch-size', '1', stdout=io.StringIO())
+
+        self.assertEqual(list(Trip.objects.values_list('id', flat=True)), [self.trip_ids[2]])
+        self.assertFalse(RouteStop.objects.filter(trip_id__in=self.trip_ids[:2]).exists())
+        self.assertEqual(sorted(os.listdir(self.archive_dir)), ['trips-2024-01.jsonl.gz', 'trips-2024-02.jsonl.gz'])
+        self.assertEqual(ArchivedTrip.objects.count(), 2)
+
+        for trip_id in self.trip_ids:
+            self.assertEqual(self.client.get(f'/api/trips/{trip_id}/').content, self.before[trip_id][0])
+            self.assertEqual(self.client.get(f'/api/trips/{trip_id}/daily_logs/').content, self.before[trip_id][1])
+        self.assertEqual(self.client.get('/api/trips/999999/').status_code, 404)
+
+    def test_restore(self):
+        """Test that restored trips come back with their ids, timestamps and children"""
+        counts = (RouteStop.objects.count(), DailyLog.objects.count(), LogEntry.objects.count())
+        geometry = list(TripGeometry.objects.order_by('trip_id', 'min_zoom').values_list('trip_id', 'polyline'))
+        call_command('archive_trips', '--before', '2025-01-01', stdout=io.StringIO())
+        call_command('restore_trips', '--month', '2024-01', stdout=io.StringIO())
+        call_command('restore_trips', str(self.trip_ids[1]), stdout=io.StringIO())
+
+        self.assertEqual(ArchivedTrip.objects.count(), 0)
+        self.assertEqual(sorted(Trip.objects.values_list('id', flat=True)), sorted(self.trip_ids))
+        self.assertEqual((RouteStop.objects.count(), DailyLog.objects.count(), LogEntry.objects.count()), counts)
+        self.assertEqual(
+            list(TripGeometry.objects.order_by('trip_id', 'min_zoom').values_list('trip_id', 'polyline')), geometry
+        )
+        for trip_id in self.trip_ids:
+            self.assertEqual(self.client.get(f'/api/trips/{trip_id}/').content, self.before[trip_id][0])
@@ -0,0 +1,145 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from analytics.availability import DriverStatusIndex, driver_state_after_trip, find_available_drivers
+from analytics.models import DriverStatus, Trip
+from analytics.util import plan_start
+
+
+class DriverAvailabilityTest(TestCase):
+    """Test cases for the driver availability index and query"""
+
+    def setUp(self):
+        self.now = timezone.now()
+        # Chicago-area pickup, load to Indianapolis (~165 miles)
+        self.load = {
+            'pickup_lat': 41.8781,
+            'pickup_lng': -87.6298,
+            'dropoff_lat': 39.7684,
+            'dropoff_lng': -86.1581,
+        }
+
+    def create_status(self, name, lat, lng, available_in=0.0, hours_since_rest=0.0, cycle=70.0):
+        return DriverStatus.objects.create(
+            driver_name=name,
+            location=name,
+            latitude=lat,
+            longitude=lng,
+            available_at=self.now + timedelta(hours=available_in),
+            hours_since_rest=hours_since_rest,
+            remaining_drive_hours=11 - hours_since_rest,
+            remaining_window_hours=14 - hours_since_rest,
+            remaining_cycle_hours=cycle,
+        )
+
+    def test_state_after_trip_without_rest(self):
+        """Test that the HOS clock keeps running when the plan has no rest stop"""
+        route_stops = [
+            {'stop_type': 'pickup', 'duration_hours': 1.0, 'cumulative_hours': 2.0},
+            {'stop_type': 'dropoff', 'duration_hours': 1.0, 'cumulative_hours': 5.0},
+        ]
+        state = driver_state_after_trip({'current_cycle_hours': 3.0}, route_stops, 6.0)
+
+        self.assertEqual(state['hours_since_rest'], 9.0)
+        self.assertEqual(state['remaining_drive_hours'], 2.0)
+        self.assertEqual(state['remaining_window_hours'], 5.0)
+        self.assertEqual(state['remaining_cycle_hours'], 61.0)
+
+    def test_state_after_trip_with_rest(self):
+        """Test that the HOS clock restarts after the last rest stop"""
+        route_stops = [
+            {'stop_type': 'rest', 'duration_hours': 10.0, 'cumulative_hours': 11.0},
+            {'stop_type': 'dropoff', 'duration_hours': 1.0, 'cumulative_hours': 24.0},
+        ]
+        state = driver_state_after_trip({'current_cycle_hours': 0.0}, route_stops, 25.0)
+
+        self.assertEqual(state['hours_since_rest'], 4.0)
+        self.assertEqual(state['remaining_cycle_hours'], 55.0)
+
+    def test_filters_and_ranks_candidates(self):
+        """Test that only drivers able to run the load without a reset are ranked, nearest first"""
+        self.create_status('Near', 41.85, -87.65)
+        self.create_status('Far', 40.7128, -74.0060)
+        self.create_status('Tired', 41.88, -87.63, hours_since_rest=9.0)
+        self.create_status('Busy', 41.88, -87.63, available_in=5.0)
+        self.create_status('Rested', 41.90, -87.70, available_in=-12.0, hours_since_rest=10.5)
+        self.create_status('Out of cycle', 41.88, -87.63, cycle=2.0)
+
+        load_miles, candidates = find_available_drivers(now=self.now, **self.load)
+
+        self.assertAlmostEqual(load_miles, 165, delta=5)
+        self.assertEqual([c['driver_name'] for c in candidates], ['Near', 'Rested'])
+        self.assertEqual(candidates[0]['fuel_stops_needed'], 0)
+        self.assertLess(candidates[0]['hours_to_dropoff'], candidates[1]['hours_to_dropoff'])
+
+    def test_limit_and_empty_index(self):
+        """Test the result limit and the empty fleet case"""
+        load_miles, candidates = find_available_drivers(now=self.now, **self.load)
+        self.assertEqual(candidates, [])
+
+        for i in range(5):
+            self.create_status(f'Driver {i}', 41.8 + i * 0.01, -87.6)
+        index = DriverStatusIndex.from_queryset()
+        _, candidates = find_available_drivers(now=self.now, limit=2, index=index, **self.load)
+        self.assertEqual(len(candidates), 2)
+
+    def test_planner_rejections_do_not_starve_the_limit(self):
+        """Test that drivers the full planner rejects are skipped, not counted against the shortlist"""
+        # Close enough to pass the prefilter, but the pickup hour pushes them into a 10-hour rest
+        for i in range(8):
+            self.create_status(f'Almost out {i}', 41.878 + i * 0.001, -87.63, hours_since_rest=7.0)
+        self.create_status('Fresh A', 41.95, -87.70)
+        self.create_status('Fresh B', 42.00, -87.75)
+
+        _, candidates = find_available_drivers(now=self.now, limit=2, **self.load)
+        self.assertEqual([c['driver_name'] for c in candidates], ['Fresh A', 'Fresh B'])
+
+
+class DriverAvailabilityAPITest(TestCase):
+    """Test cases for the availability endpoint and status maintenance on trip creation"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_trip_creation_updates_driver_status(self):
+        """Test that planning a trip records where and when the driver becomes available"""
+        response = self.client.post('/api/trips/', {
+            'driver_name': 'John Doe',
+            'current_location': 'New York, NY',
+            'current_lat': 40.7128,
+            'current_lng': -74.0060,
+            'pickup_location': 'Philadelphia, PA',
+            'pickup_lat': 39.9526,
+            'pickup_lng': -75.1652,
+            'dropoff_location': 'Washington, DC',
+            'dropoff_lat': 38.9072,
+            'dropoff_lng': -77.0369,
+            'current_cycle_hours': 0,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        status = DriverStatus.objects.get(driver_name='John Doe')
+        trip = Trip.objects.get()
+        self.assertEqual(status.last_trip, trip)
+        self.assertEqual(status.location, 'Washington, DC')
+        logs_end = timezone.make_aware(plan_start(trip)) + timedelta(hours=trip.total_trip_time)
+        self.assertEqual(status.available_at, logs_end)
+
+        response = self.client.get('/api/drivers/availability/', {
+            'pickup_lat': 38.9072,
+            'pickup_lng': -77.0369,
+            'dropoff_lat': 39.2904,
+            'dropoff_lng': -76.6122,
+            'start_within_hours': 24,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([c['driver_name'] for c in response.data['candidates']], ['John Doe'])
+
+    def test_invalid_query(self):
+        """Test that missing coordinates are rejected"""
+        response = self.client.get('/api/drivers/availability/', {'pickup_lat': 38.9})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('pickup_lng', response.data)
@@ -0,0 +1,86 @@
+import io
+
+import numpy as np
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from analytics.corridor import distances_to_segments, geohash, query_cells
+from analytics.models import Trip, TripCorridorCell
+from analytics.geometry import densify_route
+from analytics.util import calculate_distance, calculate_distances
+
+
+class CorridorIndexTest(TestCase):
+    """Test cases for the geohash corridor index and the trips-near-a-point query"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.trip_ids = []
+        for dropoff, lat, lng in (('Houston, TX', 29.7604, -95.3698), ('Denver, CO', 39.7392, -104.9903)):
+            response = self.client.post('/api/trips/', {
+                'driver_name': 'John Doe',
+                'current_location': 'New York, NY',
+                'current_lat': 40.7128,
+                'current_lng': -74.0060,
+                'pickup_location': 'Chicago, IL',
+                'pickup_lat': 41.8781,
+                'pickup_lng': -87.6298,
+                'dropoff_location': dropoff,
+                'dropoff_lat': lat,
+                'dropoff_lng': lng,
+                'current_cycle_hours': 0,
+            }, format='json')
+            self.trip_ids.append(response.data['id'])
+
+    def test_geohash(self):
+        """Test the geohash of well-known points"""
+        self.assertEqual(geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(geohash(40.7128, -74.0060, 5), 'dr5re')
+
+    def test_segment_distance(self):
+        """Test point-to-segment distances across the segment and beyond its ends"""
+        starts = np.array([[40.0, -100.0], [40.0, -100.0]])
+        ends = np.array([[40.0, -90.0], [40.0, -99.0]])
+        distances = distances_to_segments((40.5, -95.0), starts, ends)
+
+        dense = densify_route([(40.0, -100.0), (40.0, -90.0)], spacing_miles=0.1)
+        self.assertAlmostEqual(distances[0], calculate_distances(dense[:, 0], dense[:, 1], 40.5, -95.0).min(), places=2)
+        self.assertAlmostEqual(distances[1], calculate_distance(40.5, -95.0, 40.0, -99.0), places=6)
+
+    def test_large_radius_uses_coarser_cells(self):
+        """Test that wide queries fall back to a few coarse prefixes"""
+        precision, cells = query_cells(39.0, -95.0, 500)
+        self.assertLess(precision, 4)
+        self.assertLessEqual(len(cells), 64)
+
+    def test_trips_near(self):
+        """Test that only routes passing within the radius are returned, with their exact distance"""
+        # Between New York and Chicago: both trips drive that leg
+        response = self.client.get('/api/trips/near/', {'lat': 41.2, 'lng': -80.0, 'radius': 50})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(r['id'] for r in response.data), sorted(self.trip_ids))
+        self.assertTrue(all(r['distance_miles'] <= 50 for r in response.data))
+
+        # In Arkansas, 30 miles off the way from Chicago to Houston
+        response = self.client.get('/api/trips/near/', {'lat': 35.88, 'lng': -92.33, 'radius': 40})
+        self.assertEqual([r['id'] for r in response.data], [self.trip_ids[0]])
+        trip = Trip.objects.get(pk=self.trip_ids[0])
+        route = [(trip.current_lat, trip.current_lng)] + list(trip.route_stops.values_list('latitude', 'longitude'))
+        dense = densify_route(route, spacing_miles=0.1)
+        self.assertAlmostEqual(
+            response.data[0]['distance_miles'], calculate_distances(dense[:, 0], dense[:, 1], 35.88, -92.33).min(), places=1
+        )
+        response = self.client.get('/api/trips/near/', {'lat': 35.88, 'lng': -92.33, 'radius': 20})
+        self.assertEqual(response.data, [])
+
+        response = self.client.get('/api/trips/near/', {'lat': 47.6, 'lng': -122.3, 'radius': 50})
+        self.assertEqual(response.data, [])
+        self.assertEqual(self.client.get('/api/trips/near/', {'lat': 100, 'lng': 0}).status_code, 400)
+
+    def test_rebuild_command(self):
+        """Test that trips without corridor cells get them back"""
+        cells = TripCorridorCell.objects.count()
+        TripCorridorCell.objects.all().delete()
+        call_command('rebuild_corridor_index', stdout=io.StringIO())
+        self.assertEqual(TripCorridorCell.objects.count(), cells)
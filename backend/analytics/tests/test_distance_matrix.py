@@ -0,0 +1,97 @@
+from unittest import mock
+
+import numpy as np
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from analytics.api.serializers import DistanceMatrixSerializer
+from analytics.util import calculate_distance, calculate_distance_matrix, nearest_destinations
+
+CITIES = [
+    [40.7128, -74.0060],  # New York
+    [39.9526, -75.1652],  # Philadelphia
+    [38.9072, -77.0369],  # Washington
+    [41.8781, -87.6298],  # Chicago
+    [34.0522, -118.2437],  # Los Angeles
+]
+
+
+class DistanceMatrixTest(TestCase):
+    """Test cases for the chunked many-to-many distance functions"""
+
+    def test_matrix_matches_calculate_distance(self):
+        """Test that every cell equals the scalar Haversine, regardless of chunk size"""
+        matrix = calculate_distance_matrix(CITIES, CITIES[1:], chunk_rows=2)
+
+        self.assertEqual(matrix.shape, (5, 4))
+        for i, (lat1, lng1) in enumerate(CITIES):
+            for j, (lat2, lng2) in enumerate(CITIES[1:]):
+                self.assertAlmostEqual(matrix[i, j], calculate_distance(lat1, lng1, lat2, lng2), places=6)
+
+    def test_nearest_destinations(self):
+        """Test that the k nearest destinations come back sorted, across chunk boundaries"""
+        rng = np.random.default_rng(7)
+        origins = np.column_stack([rng.uniform(30, 45, 50), rng.uniform(-120, -75, 50)])
+        destinations = np.column_stack([rng.uniform(30, 45, 300), rng.uniform(-120, -75, 300)])
+
+        indices, distances = nearest_destinations(origins, destinations, 5, chunk_rows=16)
+        matrix = calculate_distance_matrix(origins, destinations)
+
+        np.testing.assert_array_equal(indices, np.argsort(matrix, axis=1, kind='stable')[:, :5])
+        np.testing.assert_allclose(distances, np.sort(matrix, axis=1)[:, :5])
+
+    def test_k_larger_than_destinations(self):
+        """Test that k is capped at the number of destinations"""
+        indices, distances = nearest_destinations(CITIES[:2], CITIES[2:], 10)
+        self.assertEqual(indices.shape, (2, 3))
+        self.assertTrue((np.diff(distances, axis=1) >= 0).all())
+
+
+class DistanceMatrixAPITest(TestCase):
+    """Test cases for the distance matrix endpoint"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_full_matrix(self):
+        """Test the full matrix response"""
+        response = self.client.post('/api/distance-matrix/', {'origins': CITIES[:2], 'destinations': CITIES}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['distances']), 2)
+        self.assertEqual(response.data['distances'][0][0], 0)
+        self.assertAlmostEqual(response.data['distances'][0][1], calculate_distance(*CITIES[0], *CITIES[1]), places=2)
+
+    def test_k_nearest(self):
+        """Test that k returns only the nearest destinations per origin"""
+        response = self.client.post(
+            '/api/distance-matrix/', {'origins': [CITIES[0]], 'destinations': CITIES[1:], 'k': 2}, format='json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['indices'], [[0, 1]])
+
+    def test_k_bounds_the_response(self):
+        """Test that a k query is capped on the results it returns as well as the pairs it computes"""
+        body = {'origins': CITIES, 'destinations': CITIES, 'k': 3}
+        with mock.patch.object(DistanceMatrixSerializer, 'MAX_MATRIX_CELLS', len(CITIES) * 2):
+            response = self.client.post('/api/distance-matrix/', body, format='json')
+            self.assertEqual(response.status_code, 400)
+
+            body['k'] = 2
+            response = self.client.post('/api/distance-matrix/', body, format='json')
+            self.assertEqual(response.status_code, 200)
+
+        with mock.patch.object(DistanceMatrixSerializer, 'MAX_NEAREST_CELLS', len(CITIES) ** 2 - 1):
+            response = self.client.post('/api/distance-matrix/', body, format='json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_invalid_coordinates(self):
+        """Test that malformed and out-of-range coordinates are rejected"""
+        response = self.client.post(
+            '/api/distance-matrix/', {'origins': [[91, 0]], 'destinations': [[1, 2, 3]]}, format='json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('origins', response.data)
+        self.assertIn('destinations', response.data)
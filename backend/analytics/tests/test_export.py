@@ -0,0 +1,93 @@
+import io
+import json
+import zipfile
+from datetime import date, timedelta
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from analytics.export import AuditExport, ChunkedStream, audit_logs, export_pool
+from analytics.models import DailyLog
+
+
+class AuditExportTest(TestCase):
+    """Test cases for the bulk log sheet export and its endpoint"""
+
+    def setUp(self):
+        self.client = APIClient()
+        for driver in ('Ann Lee', 'Bob Stone', 'Ann Lee'):
+            self.client.post('/api/trips/', {
+                'driver_name': driver,
+                'current_location': 'New York, NY',
+                'current_lat': 40.7128,
+                'current_lng': -74.0060,
+                'pickup_location': 'Chicago, IL',
+                'pickup_lat': 41.8781,
+                'pickup_lng': -87.6298,
+                'dropoff_location': 'Houston, TX',
+                'dropoff_lat': 29.7604,
+                'dropoff_lng': -95.3698,
+                'current_cycle_hours': 0,
+            }, format='json')
+        self.today = date.today()
+        self.logs = audit_logs(self.today - timedelta(days=1), self.today + timedelta(days=30))
+
+    def test_one_file_per_sheet(self):
+        """Test that every log becomes its own file, grouped in a folder per driver"""
+        output = io.BytesIO()
+        export = AuditExport(self.logs, fmt='svg', workers=0, batch_size=2)
+        progress = list(export.write_to(output))
+
+        archive = zipfile.ZipFile(output)
+        sheets = [name for name in archive.namelist() if name != 'export.json']
+        self.assertEqual(len(sheets), DailyLog.objects.count())
+        self.assertTrue(all(name.startswith(('ann-lee/', 'bob-stone/')) for name in sheets))
+        self.assertTrue(archive.read(sheets[0]).startswith(b'<svg'))
+        self.assertEqual(progress[-1]['sheets'], len(sheets))
+
+        manifest = json.loads(archive.read('export.json'))
+        self.assertEqual(manifest['sheets'], len(sheets))
+        self.assertGreater(manifest['sheets_per_second'], 0)
+
+    def test_merged_pdf_per_driver_from_process_pool(self):
+        """Test that merged exports render in worker processes into one PDF per driver on an unseekable stream"""
+        sink, chunks = ChunkedStream(), []
+        export = AuditExport(self.logs, merge=True, workers=2, batch_size=1)
+        for _ in export.write_to(sink):
+            chunks.append(sink.drain())
+        chunks.append(sink.drain())
+
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        self.assertEqual(sorted(archive.namelist()), ['ann-lee.pdf', 'bob-stone.pdf', 'export.json'])
+        self.assertIs(export_pool(), export_pool())
+        ann_pages = self.logs.filter(driver_name='Ann Lee').count()
+        self.assertIn(b'/Count %d' % ann_pages, archive.read('ann-lee.pdf'))
+
+    def test_export_endpoint(self):
+        """Test that the endpoint streams a ZIP filtered by driver and validates the range"""
+        response = self.client.get('/api/daily-logs/export/', {
+            'start': self.today.isoformat(), 'end': (self.today + timedelta(days=30)).isoformat(),
+            'driver_name': 'Bob Stone',
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(int(response['X-Sheet-Count']), DailyLog.objects.filter(driver_name='Bob Stone').count())
+        self.assertEqual(len(archive.namelist()) - 1, int(response['X-Sheet-Count']))
+
+        invalid = self.client.get('/api/daily-logs/export/', {'start': '2025-02-01', 'end': '2025-01-01'})
+        self.assertEqual(invalid.status_code, 400)
+
+    async def test_export_endpoint_streams_under_asgi(self):
+        """Test that under ASGI the archive is sent as an async stream, one chunk per batch"""
+        response = await self.async_client.get('/api/daily-logs/export/', {
+            'start': self.today.isoformat(), 'end': (self.today + timedelta(days=30)).isoformat(),
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertGreater(len(chunks), 1)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        self.assertEqual(len(archive.namelist()) - 1, int(response['X-Sheet-Count']))
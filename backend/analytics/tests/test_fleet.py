@@ -0,0 +1,104 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from analytics import fleet, metrics
+from analytics.models import DailyLog, RouteStop, Trip
+from analytics.util import plan_start
+
+
+class FleetMapTest(TestCase):
+    """Test cases for the clustered fleet map of active route stops"""
+
+    def setUp(self):
+        fleet._index = None
+        self.client = APIClient()
+        self.create_trip('Houston, TX', 29.7604, -95.3698)
+
+    def create_trip(self, dropoff, lat, lng):
+        return self.client.post('/api/trips/', {
+            'driver_name': 'John Doe',
+            'current_location': 'New York, NY',
+            'current_lat': 40.7128,
+            'current_lng': -74.0060,
+            'pickup_location': 'Chicago, IL',
+            'pickup_lat': 41.8781,
+            'pickup_lng': -87.6298,
+            'dropoff_location': dropoff,
+            'dropoff_lat': lat,
+            'dropoff_lng': lng,
+            'current_cycle_hours': 0,
+        }, format='json').data['id']
+
+    def fleet_map(self, bbox='-130,20,-60,55', zoom=3):
+        response = self.client.get('/api/fleet/map/', {'bbox': bbox, 'zoom': zoom})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def index_requests(self, result):
+        return metrics.REGISTRY['cache_requests_total'].values.get(('active_stop_index', result), 0)
+
+    def test_clusters_are_bounded_by_the_view(self):
+        """Test that stops merge into few clusters zoomed out and split into single stops zoomed in"""
+        data = self.fleet_map(zoom=2)
+        self.assertEqual(sum(c['count'] for c in data['clusters']), RouteStop.objects.count())
+        self.assertLess(len(data['clusters']), RouteStop.objects.count())
+
+        stop = RouteStop.objects.get(stop_type='pickup')
+        bbox = f'{stop.longitude - 0.01},{stop.latitude - 0.01},{stop.longitude + 0.01},{stop.latitude + 0.01}'
+        data = self.fleet_map(bbox, zoom=15)
+        self.assertEqual(data['clusters'], [{
+            'tile': data['clusters'][0]['tile'], 'count': 1, 'lat': round(stop.latitude, 6),
+            'lng': round(stop.longitude, 6), 'trip_id': stop.trip_id, 'stop_type': 'pickup',
+        }])
+
+        # A world view at street zoom is clustered at a coarser zoom instead
+        data = self.fleet_map('-180,-85,180,85', zoom=18)
+        self.assertLess(data['zoom'], 18)
+        self.assertLessEqual(len(data['clusters']), fleet.MAX_CLUSTER_CELLS)
+
+    def test_incremental_refresh(self):
+        """Test that new trips are added to the index in place and deleted ones force a rebuild"""
+        self.fleet_map()
+        misses = self.index_requests('miss')
+
+        trip_id = self.create_trip('Denver, CO', 39.7392, -104.9903)
+        data = self.fleet_map()
+        self.assertEqual(self.index_requests('miss'), misses)
+        self.assertEqual(sum(c['count'] for c in data['clusters']), RouteStop.objects.count())
+
+        Trip.objects.filter(pk=trip_id).delete()
+        data = self.fleet_map()
+        self.assertEqual(self.index_requests('miss'), misses + 1)
+        self.assertEqual(sum(c['count'] for c in data['clusters']), RouteStop.objects.count())
+
+    def test_finished_trips_are_hidden(self):
+        """Test that trips whose planned time has passed are not drawn"""
+        five_days_ago = timezone.now() - timedelta(days=5)
+        Trip.objects.update(created_at=five_days_ago)
+        for log in DailyLog.objects.order_by('date'):
+            log.date -= timedelta(days=5)
+            log.save(update_fields=['date'])
+        self.assertEqual(self.fleet_map()['clusters'], [])
+
+    def test_window_follows_the_logs(self):
+        """Test that a trip is active while its logs run, not from when it was created"""
+        trip = Trip.objects.get()
+        start = timezone.make_aware(plan_start(trip))
+        end = start + timedelta(hours=trip.total_trip_time)
+        # Planned in the evening, the trip's logs still start in the morning
+        Trip.objects.update(created_at=start + timedelta(hours=10))
+        bbox = (-130, 20, -60, 55)
+
+        _, clusters = fleet.fleet_map_clusters(*bbox, 3, moment=start + timedelta(hours=1))
+        self.assertEqual(sum(c['count'] for c in clusters), RouteStop.objects.count())
+        _, clusters = fleet.fleet_map_clusters(*bbox, 3, moment=end + timedelta(minutes=1))
+        self.assertEqual(clusters, [])
+
+    def test_invalid_bbox(self):
+        """Test that malformed bounding boxes are rejected"""
+        for bbox in ('1,2,3', '10,20,-10,30', 'a,b,c,d'):
+            response = self.client.get('/api/fleet/map/', {'bbox': bbox, 'zoom': 3})
+            self.assertEqual(response.status_code, 400)
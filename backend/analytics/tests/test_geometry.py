@@ -0,0 +1,94 @@
+import numpy as np
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from analytics.geometry import (
+    GEOMETRY_ZOOM_LEVELS, decode_polyline, densify_route, encode_polyline, simplify, tolerance_for_zoom,
+)
+from analytics.models import Trip, TripGeometry
+from analytics.util import calculate_distances
+
+
+class GeometryTest(TestCase):
+    """Test cases for route densification, simplification and polyline encoding"""
+
+    def test_encode_polyline_reference(self):
+        """Test against the reference example of the encoded polyline format"""
+        points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+        encoded = encode_polyline(points)
+
+        self.assertEqual(encoded, '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+        self.assertEqual(decode_polyline(encoded), points)
+
+    def test_densify_follows_great_circle(self):
+        """Test vertex spacing and that densified points stay on the route"""
+        dense = densify_route([(40.7128, -74.0060), (34.0522, -118.2437)], spacing_miles=5)
+        steps = calculate_distances(dense[:-1, 0], dense[:-1, 1], dense[1:, 0], dense[1:, 1])
+
+        self.assertGreater(len(dense), 400)
+        self.assertLessEqual(steps.max(), 5 + 1e-6)
+        np.testing.assert_allclose(dense[[0, -1]], [(40.7128, -74.0060), (34.0522, -118.2437)], atol=1e-9)
+
+    def test_simplify_keeps_corners(self):
+        """Test that corners always survive while curve detail depends on the tolerance"""
+        corner = (41.8781, -87.6298)
+        dense = densify_route([(40.7128, -74.0060), corner, (29.7604, -95.3698)])
+
+        coarse = simplify(dense, tolerance_for_zoom(2))
+        fine = simplify(dense, tolerance_for_zoom(12))
+        self.assertTrue((coarse == corner).all(axis=1).any())
+        self.assertTrue((fine == corner).all(axis=1).any())
+        self.assertLess(len(coarse), len(fine))
+        self.assertLess(len(fine), len(dense))
+
+    def test_simplify_straight_mercator_line(self):
+        """Test that a line of constant latitude, straight on the map, collapses to its ends"""
+        points = np.column_stack([np.full(50, 40.0), np.linspace(-100, -90, 50)])
+        self.assertEqual(len(simplify(points, tolerance_for_zoom(18))), 2)
+
+
+class TripGeometryAPITest(TestCase):
+    """Test cases for geometry generation at planning time and the geometry endpoint"""
+
+    def setUp(self):
+        self.client = APIClient()
+        response = self.client.post('/api/trips/', {
+            'driver_name': 'John Doe',
+            'current_location': 'New York, NY',
+            'current_lat': 40.7128,
+            'current_lng': -74.0060,
+            'pickup_location': 'Chicago, IL',
+            'pickup_lat': 41.8781,
+            'pickup_lng': -87.6298,
+            'dropoff_location': 'Houston, TX',
+            'dropoff_lat': 29.7604,
+            'dropoff_lng': -95.3698,
+            'current_cycle_hours': 0,
+        }, format='json')
+        self.trip = Trip.objects.get(pk=response.data['id'])
+
+    def test_levels_created_at_planning_time(self):
+        """Test that every zoom level is stored and detail never shrinks as zoom grows"""
+        levels = list(self.trip.geometries.order_by('min_zoom'))
+
+        self.assertEqual([g.min_zoom for g in levels], GEOMETRY_ZOOM_LEVELS)
+        counts = [g.point_count for g in levels]
+        self.assertEqual(counts, sorted(counts))
+        self.assertEqual(len(decode_polyline(levels[-1].polyline)), counts[-1])
+
+    def test_geometry_for_zoom(self):
+        """Test that a zoom is served by the closest level at or below it"""
+        response = self.client.get(f'/api/trips/{self.trip.id}/geometry/', {'zoom': 8})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['min_zoom'], 7)
+        self.assertEqual(self.client.get(f'/api/trips/{self.trip.id}/geometry/', {'zoom': 40}).status_code, 400)
+
+    def test_geometry_built_lazily_for_older_trips(self):
+        """Test that trips planned before geometry existed get it on first request"""
+        TripGeometry.objects.all().delete()
+        response = self.client.get(f'/api/trips/{self.trip.id}/geometry/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['min_zoom'], 0)
+        self.assertEqual(self.trip.geometries.count(), len(GEOMETRY_ZOOM_LEVELS))
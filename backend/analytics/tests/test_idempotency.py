@@ -0,0 +1,127 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from analytics.idempotency import IDEMPOTENCY_LEASE_SECONDS, request_fingerprint, take_over
+from analytics.models import IdempotencyKey, RouteStop, Trip
+
+TRIP_DATA = {
+    'driver_name': 'John Doe',
+    'current_location': 'New York, NY',
+    'current_lat': 40.7128,
+    'current_lng': -74.0060,
+    'pickup_location': 'Chicago, IL',
+    'pickup_lat': 41.8781,
+    'pickup_lng': -87.6298,
+    'dropoff_location': 'Houston, TX',
+    'dropoff_lat': 29.7604,
+    'dropoff_lng': -95.3698,
+    'current_cycle_hours': 0,
+}
+
+
+class IdempotencyKeyTest(TestCase):
+    """Test cases for the Idempotency-Key header on trip creation"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_retry_replays_the_first_response(self):
+        """Test that a retried POST gets the stored response and writes nothing"""
+        first = self.client.post('/api/trips/', TRIP_DATA, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        stops = RouteStop.objects.count()
+        retry = self.client.post('/api/trips/', TRIP_DATA, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Trip.objects.count(), 1)
+        self.assertEqual(RouteStop.objects.count(), stops)
+
+        self.client.post('/api/trips/', TRIP_DATA, format='json', HTTP_IDEMPOTENCY_KEY='def')
+        self.client.post('/api/trips/', TRIP_DATA, format='json')
+        self.assertEqual(Trip.objects.count(), 3)
+
+    def test_key_reused_for_another_request(self):
+        """Test that a key sent with a different body is rejected"""
+        self.client.post('/api/trips/', TRIP_DATA, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        response = self.client.post('/api/trips/', {**TRIP_DATA, 'current_cycle_hours': 5}, format='json',
+                                    HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Trip.objects.count(), 1)
+
+    def test_validation_errors_are_replayed(self):
+        """Test that a rejected request is answered the same way on retry"""
+        for _ in range(2):
+            response = self.client.post('/api/trips/', {'driver_name': 'John Doe'}, format='json',
+                                        HTTP_IDEMPOTENCY_KEY='bad')
+            self.assertEqual(response.status_code, 400)
+        self.assertIn('current_location', response.json())
+
+
+    def stale_entry(self, key):
+        """An in-flight row for TRIP_DATA whose request died before its lease ran out"""
+        request = Request(APIRequestFactory().post('/api/trips/', TRIP_DATA, format='json'), parsers=[JSONParser()])
+        return IdempotencyKey.objects.create(
+            key=key, fingerprint=request_fingerprint(request),
+            claimed_at=timezone.now() - timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS + 1),
+        )
+
+    def test_stale_in_flight_key_is_taken_over(self):
+        """Test that a retry takes over a key whose holder died and stores its own outcome"""
+        stale = self.stale_entry('abc')
+
+        response = self.client.post('/api/trips/', TRIP_DATA, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(Trip.objects.count(), 1)
+        entry = IdempotencyKey.objects.get(key='abc')
+        self.assertEqual(entry.status_code, 201)
+        self.assertGreater(entry.claimed_at, stale.claimed_at)
+
+        retry = self.client.post('/api/trips/', TRIP_DATA, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Trip.objects.count(), 1)
+
+    def test_only_one_waiter_takes_over(self):
+        """Test that of two waiters that saw the same stale lease, only the first gets the key"""
+        stale = self.stale_entry('abc')
+
+        self.assertIsNotNone(take_over(stale))
+        self.assertIsNone(take_over(stale))
+
+
+class ConcurrentIdempotencyKeyTest(TransactionTestCase):
+    """Test cases for duplicates arriving while the first request is still running"""
+
+    def test_duplicate_waits_for_the_request_in_flight(self):
+        """Test that a duplicate waits for the in-flight request and replays its response"""
+        first = APIClient().post('/api/trips/', TRIP_DATA, format='json')
+        request = Request(APIRequestFactory().post('/api/trips/', TRIP_DATA, format='json'), parsers=[JSONParser()])
+        entry = IdempotencyKey.objects.create(key='abc', fingerprint=request_fingerprint(request))
+        responses = []
+
+        def duplicate():
+            responses.append(APIClient().post('/api/trips/', TRIP_DATA, format='json', HTTP_IDEMPOTENCY_KEY='abc'))
+            connection.close()
+
+        thread = threading.Thread(target=duplicate)
+        thread.start()
+        time.sleep(0.3)
+        self.assertEqual(responses, [])
+
+        # The request holding the key finishes while the duplicate waits
+        IdempotencyKey.objects.filter(pk=entry.pk).update(status_code=201, response_body=first.content.decode())
+        thread.join(5)
+
+        self.assertEqual(responses[0].status_code, 201)
+        self.assertEqual(responses[0].json()['id'], first.json()['id'])
+        self.assertEqual(Trip.objects.count(), 1)
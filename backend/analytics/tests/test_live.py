@@ -0,0 +1,149 @@
+import asyncio
+import json
+import threading
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from analytics.live import SUBSCRIBER_QUEUE_SIZE, TripEventHub, publish_position
+from analytics.models import Trip
+from analytics.replan import plan_start
+
+
+def parse_event(chunk):
+    """The event name and decoded data of one text/event-stream message"""
+    fields = dict(line.split(': ', 1) for line in chunk.decode().strip().splitlines())
+    return fields['event'], json.loads(fields['data'])
+
+
+class TripEventHubTest(TestCase):
+    """Test cases for the in-process trip event hub"""
+
+    def test_publish_from_another_thread(self):
+        """Test that events published by a worker thread reach only the subscribers of that trip"""
+        hub = TripEventHub()
+
+        async def receive():
+            subscription, other = hub.subscribe(1), hub.subscribe(2)
+            thread = threading.Thread(target=hub.publish, args=(1, 'position', {'lat': 1.0}))
+            thread.start()
+            message = await asyncio.wait_for(subscription.get(), 1)
+            thread.join()
+            self.assertFalse(other.events)
+            hub.unsubscribe(subscription)
+            hub.unsubscribe(other)
+            return message
+
+        message = asyncio.run(receive())
+        self.assertEqual((message['event'], message['data']), ('position', {'lat': 1.0}))
+        self.assertEqual(hub.subscriber_count(), 0)
+
+    def test_slow_subscriber_is_told_to_resync(self):
+        """Test that a subscriber that fell too far behind gets one resync event instead of a backlog"""
+        hub = TripEventHub()
+
+        async def overflow():
+            subscription = hub.subscribe(1)
+            for number in range(SUBSCRIBER_QUEUE_SIZE + 5):
+                hub.publish(1, 'position', {'number': number})
+            await asyncio.sleep(0)
+            return await subscription.get(), len(subscription.events)
+
+        message, backlog = asyncio.run(overflow())
+        self.assertEqual(message['event'], 'resync')
+        self.assertEqual(backlog, 0)
+
+
+    def test_progress_is_kept_only_while_watched(self):
+        """Test that a trip's progress is dropped with its last stream and not kept for unwatched trips"""
+        hub = TripEventHub()
+        self.assertEqual(hub.update_progress(1, duty_status='driving'), {'duty_status': 'driving'})
+        self.assertEqual(hub.progress, {})
+
+        async def watch():
+            subscription = hub.subscribe(1)
+            hub.update_progress(1, duty_status='driving')
+            unchanged = hub.update_progress(1, duty_status='driving')
+            hub.unsubscribe(subscription)
+            return unchanged
+
+        self.assertEqual(asyncio.run(watch()), {})
+        self.assertEqual(hub.progress, {})
+
+
+class TripEventsViewTest(TestCase):
+    """Test cases for the live progress stream of a trip"""
+
+    def setUp(self):
+        response = APIClient().post('/api/trips/', {
+            'driver_name': 'John Doe',
+            'current_location': 'New York, NY',
+            'current_lat': 40.7128,
+            'current_lng': -74.0060,
+            'pickup_location': 'Chicago, IL',
+            'pickup_lat': 41.8781,
+            'pickup_lng': -87.6298,
+            'dropoff_location': 'Houston, TX',
+            'dropoff_lat': 29.7604,
+            'dropoff_lng': -95.3698,
+            'current_cycle_hours': 0,
+        }, format='json')
+        self.trip = Trip.objects.get(pk=response.data['id'])
+
+    async def test_stream_position_stop_and_status(self):
+        """Test that a reported position reaches the stream with the stop reached and the duty status"""
+        response = await self.async_client.get(f'/api/trips/{self.trip.pk}/events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertIn(b': connected', await anext(stream))
+
+        first_stop = await self.trip.route_stops.order_by('order').afirst()
+        start = await sync_to_async(plan_start)(self.trip)
+        moment = timezone.make_aware(start + timedelta(hours=first_stop.cumulative_hours + 0.01))
+        client = APIClient()
+        reply = await sync_to_async(client.post)(f'/api/trips/{self.trip.pk}/position/', {
+            'current_lat': first_stop.latitude, 'current_lng': first_stop.longitude,
+            'current_time': moment.isoformat(),
+        }, format='json')
+        self.assertEqual(reply.status_code, 200)
+
+        events = [parse_event(await anext(stream)) for _ in range(3)]
+        self.assertEqual([name for name, _ in events], ['position', 'stop_reached', 'duty_status'])
+        self.assertEqual(events[1][1]['order'], first_stop.order)
+        self.assertEqual(events[2][1]['status'], reply.data['duty_status'])
+
+        # Unchanged progress only sends the position again
+        await sync_to_async(client.post)(f'/api/trips/{self.trip.pk}/position/', {
+            'current_lat': first_stop.latitude, 'current_lng': first_stop.longitude,
+            'current_time': moment.isoformat(),
+        }, format='json')
+        self.assertEqual(parse_event(await anext(stream))[0], 'position')
+        await stream.aclose()
+
+    def test_stop_reached_follows_position(self):
+        """Test that a late driver has reached no stop, however much time has passed, until they get there"""
+        hub = TripEventHub()
+        stops = list(self.trip.route_stops.order_by('order'))
+        late = timezone.make_aware(plan_start(self.trip) + timedelta(hours=stops[1].cumulative_hours + 1))
+
+        progress = publish_position(self.trip, self.trip.current_lat, self.trip.current_lng, late, hub=hub)
+        self.assertIsNone(progress['stop_reached'])
+
+        # Half way to the first stop, then at it (GPS a little short), then past it
+        halfway = ((self.trip.current_lat + stops[0].latitude) / 2, (self.trip.current_lng + stops[0].longitude) / 2)
+        self.assertIsNone(publish_position(self.trip, *halfway, late, hub=hub)['stop_reached'])
+        near = (stops[0].latitude + 0.01, stops[0].longitude)
+        self.assertEqual(publish_position(self.trip, *near, late, hub=hub)['stop_reached']['order'], stops[0].order)
+        beyond = (
+            stops[0].latitude + (stops[1].latitude - stops[0].latitude) * 0.2,
+            stops[0].longitude + (stops[1].longitude - stops[0].longitude) * 0.2,
+        )
+        self.assertEqual(publish_position(self.trip, *beyond, late, hub=hub)['stop_reached']['order'], stops[0].order)
+
+    async def test_unknown_trip(self):
+        """Test that streams are only opened for existing trips"""
+        response = await self.async_client.get('/api/trips/999999/events/')
+        self.assertEqual(response.status_code, 404)
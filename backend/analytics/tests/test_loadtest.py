@@ -0,0 +1,40 @@
+import io
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test import LiveServerTestCase
+
+from analytics.loadtest import parse_mix
+from analytics.models import Trip
+
+
+class LoadTestCommandTest(LiveServerTestCase):
+    """Test cases for the load generator, run against a live test server"""
+
+    def test_short_run(self):
+        """Test that a short run hits every operation and writes a comparable JSON report"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.json')
+            call_command(
+                'loadtest', '--url', self.live_server_url, '--rps', '20', '--duration', '1', '--clients', '2',
+                '--mix', 'create=1,list=1,retrieve=1,daily_logs=1', '--json', path, stdout=io.StringIO(),
+            )
+            with open(path) as f:
+                report = json.load(f)
+
+        self.assertEqual(report['requests'], 20)
+        self.assertEqual(report['errors'], 0)
+        self.assertEqual(sorted(report['operations']), ['create', 'daily_logs', 'list', 'retrieve'])
+        self.assertLessEqual(report['latency_ms']['p50'], report['latency_ms']['p99'])
+        self.assertGreater(report['throughput_rps'], 0)
+        self.assertEqual(Trip.objects.count(), 1 + report['operations']['create']['requests'])
+        # The test database lives in memory, out of reach of the lock probe
+        self.assertFalse(report['db_lock_waits']['supported'])
+
+    def test_parse_mix(self):
+        """Test the operation weights option"""
+        self.assertEqual(parse_mix('create=1,retrieve=2.5'), {'create': 1.0, 'retrieve': 2.5})
+        with self.assertRaises(ValueError):
+            parse_mix('delete=1')
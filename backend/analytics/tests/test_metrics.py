@@ -0,0 +1,92 @@
+import multiprocessing
+import re
+import tempfile
+
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from analytics import metrics
+from analytics.metrics import Counter, Histogram
+
+
+def sample_value(text, sample):
+    """The value of one sample line in a Prometheus text exposition"""
+    match = re.search(rf'^{re.escape(sample)} (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+def record_in_child(counter_name):
+    metrics.REGISTRY[counter_name].inc(5, result='hit')
+    metrics.flush()
+
+
+class MetricsRegistryTest(TestCase):
+    """Test cases for the metrics registry and its multi-process aggregation"""
+
+    def tearDown(self):
+        for name in ('test_latency_seconds', 'test_lookups_total'):
+            metrics.REGISTRY.pop(name, None)
+
+    def test_histogram_exposition(self):
+        """Test cumulative buckets, sum and count of a labelled histogram"""
+        histogram = Histogram('test_latency_seconds', 'Test latency', labels=('step',), buckets=[0.1, 1])
+        for value in (0.05, 0.5, 0.7, 3):
+            histogram.observe(value, step='plan')
+        text = metrics.render_metrics()
+
+        self.assertIn('# TYPE test_latency_seconds histogram', text)
+        self.assertEqual(sample_value(text, 'test_latency_seconds_bucket{step="plan",le="0.1"}'), 1)
+        self.assertEqual(sample_value(text, 'test_latency_seconds_bucket{step="plan",le="1.0"}'), 3)
+        self.assertEqual(sample_value(text, 'test_latency_seconds_bucket{step="plan",le="+Inf"}'), 4)
+        self.assertAlmostEqual(sample_value(text, 'test_latency_seconds_sum{step="plan"}'), 4.25)
+        self.assertEqual(sample_value(text, 'test_latency_seconds_count{step="plan"}'), 4)
+
+    def test_worker_processes_are_summed(self):
+        """Test that snapshots flushed by other processes are added to this process's live values"""
+        counter = Counter('test_lookups_total', 'Test lookups', labels=('result',))
+        counter.inc(result='hit')
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            for _ in range(2):
+                child = multiprocessing.get_context('fork').Process(target=record_in_child, args=(counter.name,))
+                child.start()
+                child.join()
+            text = metrics.render_metrics()
+
+        self.assertEqual(sample_value(text, 'test_lookups_total{result="hit"}'), 11)
+
+
+class MetricsEndpointTest(TestCase):
+    """Test cases for the /metrics endpoint and the instrumented API"""
+
+    def test_api_and_planner_metrics(self):
+        """Test that trip requests, planner steps, per-trip sizes and query counts are exposed"""
+        client = APIClient()
+        response = client.post('/api/trips/', {
+            'driver_name': 'John Doe',
+            'current_location': 'New York, NY',
+            'current_lat': 40.7128,
+            'current_lng': -74.0060,
+            'pickup_location': 'Chicago, IL',
+            'pickup_lat': 41.8781,
+            'pickup_lng': -87.6298,
+            'dropoff_location': 'Houston, TX',
+            'dropoff_lat': 29.7604,
+            'dropoff_lng': -95.3698,
+            'current_cycle_hours': 0,
+        }, format='json')
+        client.get(f'/api/trips/{response.data["id"]}/')
+
+        scrape = client.get('/metrics')
+        text = scrape.content.decode()
+        self.assertEqual(scrape.status_code, 200)
+        self.assertTrue(scrape['Content-Type'].startswith('text/plain; version=0.0.4'))
+        labels = 'view="TripViewSet",action="retrieve",method="GET",status="200"'
+        self.assertGreaterEqual(sample_value(text, f'http_request_duration_seconds_count{{{labels}}}'), 1)
+        self.assertGreaterEqual(
+            sample_value(text, 'http_request_db_queries_sum{view="TripViewSet",action="create"}'), 5
+        )
+        self.assertGreaterEqual(sample_value(text, 'planner_duration_seconds_count{step="generate_route_stops"}'), 1)
+        self.assertGreaterEqual(sample_value(text, 'planner_duration_seconds_count{step="generate_daily_logs"}'), 1)
+        self.assertGreaterEqual(sample_value(text, 'trip_route_stops_count'), 1)
+        self.assertGreaterEqual(sample_value(text, 'trip_log_entries_count'), 1)
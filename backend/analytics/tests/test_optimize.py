@@ -0,0 +1,94 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from analytics.benchmarks.optimizer import random_loads
+from analytics.models import Trip
+from analytics.optimize import (
+    StopOrderOptimizer, optimize_stop_order, precedence_constraints, waypoint_distance_matrix,
+)
+from analytics.util import calculate_distance
+
+
+def waypoint(stop_type, name, lat, lng, load_id=''):
+    return {'stop_type': stop_type, 'location_name': name, 'latitude': lat, 'longitude': lng, 'load_id': load_id}
+
+
+class StopOrderOptimizerTest(TestCase):
+    """Test cases for stop-order optimization"""
+
+    def test_distance_matrix_matches_calculate_distance(self):
+        """Test that the broadcast matrix agrees with the scalar Haversine"""
+        waypoints = random_loads(6)
+        matrix = waypoint_distance_matrix(40.7128, -74.0060, waypoints)
+        points = [(40.7128, -74.0060)] + [(w['latitude'], w['longitude']) for w in waypoints]
+
+        for i, (lat1, lng1) in enumerate(points):
+            for j, (lat2, lng2) in enumerate(points):
+                self.assertAlmostEqual(matrix[i, j], calculate_distance(lat1, lng1, lat2, lng2), places=6)
+
+    def test_orders_along_a_line(self):
+        """Test that unconstrained drops along a line are visited nearest first"""
+        waypoints = [waypoint('dropoff', f'Mile {m}', 40.0, -75.0 + m / 50) for m in (40, 10, 30, 20)]
+        ordered = optimize_stop_order(40.0, -75.0, waypoints)
+        self.assertEqual([w['location_name'] for w in ordered], ['Mile 10', 'Mile 20', 'Mile 30', 'Mile 40'])
+
+    def test_respects_pickup_before_drop(self):
+        """Test that a drop is never sequenced before its load's pickup, even when it is closer"""
+        waypoints = [
+            waypoint('dropoff', 'Drop A', 40.0, -74.9, 'A'),
+            waypoint('pickup', 'Pickup A', 40.0, -73.0, 'A'),
+        ]
+        ordered = optimize_stop_order(40.0, -75.0, waypoints)
+        self.assertEqual([w['location_name'] for w in ordered], ['Pickup A', 'Drop A'])
+
+    def test_improves_on_given_order(self):
+        """Test that the optimized sequence is feasible and no longer than the input order"""
+        waypoints = random_loads(30, seed=3)
+        matrix = waypoint_distance_matrix(40.7128, -74.0060, waypoints)
+        optimizer = StopOrderOptimizer(matrix, precedence_constraints(waypoints), time_budget=2)
+        tour = [node + 1 for node in optimizer.solve()]
+
+        self.assertEqual(sorted(tour), list(range(1, 31)))
+        self.assertTrue(optimizer.is_feasible(tour))
+        self.assertLess(optimizer.path_length(tour), optimizer.path_length(list(range(1, 31))))
+
+
+class OptimizedTripAPITest(TestCase):
+    """Test cases for the optimize_order trip creation mode"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.payload = {
+            'driver_name': 'Jane Smith',
+            'current_location': 'New York, NY',
+            'current_lat': 40.7128,
+            'current_lng': -74.0060,
+            'current_cycle_hours': 0,
+            'optimize_order': True,
+            'waypoints': [
+                waypoint('dropoff', 'Washington, DC', 38.9072, -77.0369, 'L1'),
+                waypoint('pickup', 'Baltimore, MD', 39.2904, -76.6122, 'L1'),
+                waypoint('pickup', 'Philadelphia, PA', 39.9526, -75.1652, 'L2'),
+                waypoint('dropoff', 'Newark, NJ', 40.7357, -74.1724, 'L2'),
+            ],
+        }
+
+    def test_create_trip_with_optimized_order(self):
+        """Test that the trip is planned and stored in the optimized order"""
+        response = self.client.post('/api/trips/', self.payload, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        trip = Trip.objects.get()
+        names = list(trip.waypoints.values_list('location_name', flat=True))
+        self.assertLess(names.index('Baltimore, MD'), names.index('Washington, DC'))
+        self.assertLess(names.index('Philadelphia, PA'), names.index('Newark, NJ'))
+        self.assertEqual(trip.pickup_location, names[0])
+        self.assertEqual(trip.dropoff_location, names[-1])
+
+    def test_rejects_drop_without_pickup(self):
+        """Test that a load with only a drop cannot be optimized"""
+        self.payload['waypoints'] = self.payload['waypoints'][:1] + self.payload['waypoints'][2:]
+        response = self.client.post('/api/trips/', self.payload, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('L1', str(response.data['waypoints']))
@@ -0,0 +1,79 @@
+import unittest
+
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from analytics.api import renderers
+from analytics.api.payloads import daily_log_payloads, trip_payloads
+from analytics.api.renderers import OrjsonRenderer
+from analytics.api.serializers import DailyLogSerializer, TripSerializer
+from analytics.models import LogEntry, RouteStop, Trip
+
+
+class TripPayloadTest(TestCase):
+    """Test cases for the values()-based trip payloads and the orjson renderer"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.post('/api/trips/', {
+            'driver_name': 'José Núñez',
+            'current_location': 'New York, NY',
+            'current_lat': 40.7128,
+            'current_lng': -74.0060,
+            'pickup_location': 'Chicago, IL',
+            'pickup_lat': 41.8781,
+            'pickup_lng': -87.6298,
+            'dropoff_location': 'Houston, TX',
+            'dropoff_lat': 29.7604,
+            'dropoff_lng': -95.3698,
+            'current_cycle_hours': 12.5,
+        }, format='json')
+        self.client.post('/api/trips/', {
+            'current_location': 'Dallas, TX',
+            'current_lat': 32.7767,
+            'current_lng': -96.7970,
+            'waypoints': [
+                {'stop_type': 'pickup', 'location_name': 'Austin, TX', 'latitude': 30.2672,
+                 'longitude': -97.7431, 'load_id': 'A'},
+                {'stop_type': 'pickup', 'location_name': 'Waco, TX', 'latitude': 31.5493, 'longitude': -97.1467},
+                {'stop_type': 'dropoff', 'location_name': 'Denver, CO', 'latitude': 39.7392,
+                 'longitude': -104.9903, 'load_id': 'A'},
+            ],
+            'current_cycle_hours': 0,
+        }, format='json')
+        self.trip = Trip.objects.order_by('id').first()
+
+    def render(self, data, renderer_class=JSONRenderer):
+        return renderer_class().render(data)
+
+    def test_payloads_match_serializers(self):
+        """Test that the fast path renders to the exact bytes of the nested serializers"""
+        trips = Trip.objects.all()
+
+        self.assertEqual(self.render(trip_payloads(trips)), self.render(TripSerializer(trips, many=True).data))
+        logs = self.trip.daily_logs.all()
+        self.assertEqual(self.render(daily_log_payloads(logs)), self.render(DailyLogSerializer(logs, many=True).data))
+
+    def test_endpoints_match_serializers(self):
+        """Test list, retrieve and daily_logs responses against the serializers, with a constant query count"""
+        with self.assertNumQueries(5):
+            listed = self.client.get('/api/trips/', format='json')
+        retrieved = self.client.get(f'/api/trips/{self.trip.id}/', format='json')
+        logs = self.client.get(f'/api/trips/{self.trip.id}/daily_logs/', format='json')
+
+        self.assertEqual(listed.content, self.render(TripSerializer(Trip.objects.all(), many=True).data))
+        self.assertEqual(retrieved.content, self.render(TripSerializer(self.trip).data))
+        self.assertEqual(logs.content, self.render(DailyLogSerializer(self.trip.daily_logs.all(), many=True).data))
+
+    @unittest.skipIf(renderers.orjson is None, 'orjson is not installed')
+    def test_orjson_renderer_is_byte_compatible(self):
+        """Test orjson output against the stock renderer, including line separators and exponent floats"""
+        data = TripSerializer(Trip.objects.all(), many=True).data
+        self.assertEqual(self.render(data, OrjsonRenderer), self.render(data))
+
+        LogEntry.objects.filter(daily_log__trip=self.trip).update(location='Line break ')
+        RouteStop.objects.filter(trip=self.trip).update(distance_from_previous=1e-05)
+        data = TripSerializer(Trip.objects.all(), many=True).data
+        self.assertEqual(self.render(data, OrjsonRenderer), self.render(data))
+        self.assertEqual(self.render(trip_payloads(Trip.objects.all()), OrjsonRenderer), self.render(data))
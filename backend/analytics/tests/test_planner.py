@@ -0,0 +1,153 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from analytics.api.serializers import TripCreateSerializer
+from analytics.constants import TripConstants, HOSConstants
+from analytics.models import Trip, TripWaypoint
+from analytics.util import generate_route_stops, plan_route
+
+
+def waypoint(stop_type, name, lat, lng):
+    return {'stop_type': stop_type, 'location_name': name, 'latitude': lat, 'longitude': lng}
+
+
+class PlanRouteTest(TestCase):
+    """Test cases for the single-pass multi-leg planner"""
+
+    def setUp(self):
+        # New York -> Los Angeles -> Seattle -> Denver
+        self.waypoints = [
+            waypoint('pickup', 'Los Angeles, CA', 34.0522, -118.2437),
+            waypoint('dropoff', 'Seattle, WA', 47.6062, -122.3321),
+            waypoint('dropoff', 'Denver, CO', 39.7392, -104.9903),
+        ]
+
+    def test_short_trip_has_no_extra_stops(self):
+        """Test that a short trip only visits its waypoints"""
+        route_stops, total_distance, total_time = generate_route_stops({
+            'current_lat': 40.7128,
+            'current_lng': -74.0060,
+            'pickup_location': 'Philadelphia, PA',
+            'pickup_lat': 39.9526,
+            'pickup_lng': -75.1652,
+            'dropoff_location': 'Washington, DC',
+            'dropoff_lat': 38.9072,
+            'dropoff_lng': -77.0369,
+            'current_cycle_hours': 0,
+        })
+
+        self.assertEqual([s['stop_type'] for s in route_stops], ['pickup', 'dropoff'])
+        self.assertAlmostEqual(sum(s['distance_from_previous'] for s in route_stops), total_distance)
+        self.assertAlmostEqual(total_time, total_distance / TripConstants.AVERAGE_SPEED_MILES_PER_HOUR + 2)
+
+    def test_hos_and_fuel_limits_hold_across_legs(self):
+        """Test that no stretch exceeds the driving limit or fuel range, even across waypoints"""
+        route_stops, total_distance, total_time = plan_route(40.7128, -74.0060, self.waypoints)
+
+        self.assertEqual(
+            [s['location_name'] for s in route_stops if s['stop_type'] in ('pickup', 'dropoff')],
+            ['Los Angeles, CA', 'Seattle, WA', 'Denver, CO'],
+        )
+        self.assertEqual([s['order'] for s in route_stops], list(range(1, len(route_stops) + 1)))
+
+        hours_since_rest = 0
+        miles_since_fuel = 0
+        for stop in route_stops:
+            drive_time = stop['distance_from_previous'] / TripConstants.AVERAGE_SPEED_MILES_PER_HOUR
+            hours_since_rest += drive_time
+            miles_since_fuel += stop['distance_from_previous']
+            if drive_time > 0:
+                self.assertLessEqual(hours_since_rest, HOSConstants.MAX_DRIVING_HOURS + 1e-9)
+            self.assertLessEqual(miles_since_fuel, TripConstants.FUEL_INTERVAL_MILES + 1e-9)
+
+            if stop['stop_type'] == 'rest':
+                hours_since_rest = 0
+            else:
+                hours_since_rest += stop['duration_hours']
+            if stop['stop_type'] == 'fuel':
+                miles_since_fuel = 0
+
+        last = route_stops[-1]
+        self.assertAlmostEqual(total_time, last['cumulative_hours'] + last['duration_hours'])
+        self.assertAlmostEqual(sum(s['distance_from_previous'] for s in route_stops), total_distance)
+
+    def test_state_carries_into_next_leg(self):
+        """Test that hours driven on one leg count toward the rest break on the next"""
+        waypoints = [
+            waypoint('pickup', 'Philadelphia, PA', 39.9526, -75.1652),
+            waypoint('dropoff', 'Baltimore, MD', 39.2904, -76.6122),
+        ]
+        fresh_stops, _, _ = plan_route(40.7128, -74.0060, waypoints, hours_since_rest=0)
+        tired_stops, _, _ = plan_route(40.7128, -74.0060, waypoints, hours_since_rest=8)
+
+        self.assertEqual([s['stop_type'] for s in fresh_stops], ['pickup', 'dropoff'])
+        self.assertEqual([s['stop_type'] for s in tired_stops], ['pickup', 'rest', 'dropoff'])
+
+        # Rest is due once the 11-hour clock runs out part-way through the second leg
+        pickup_clock = 8 + tired_stops[0]['distance_from_previous'] / TripConstants.AVERAGE_SPEED_MILES_PER_HOUR + 1
+        self.assertAlmostEqual(
+            tired_stops[1]['distance_from_previous'],
+            (HOSConstants.MAX_DRIVING_HOURS - pickup_clock) * TripConstants.AVERAGE_SPEED_MILES_PER_HOUR,
+        )
+
+
+class MultiWaypointTripAPITest(TestCase):
+    """Test cases for creating trips from an ordered list of waypoints"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.payload = {
+            'driver_name': 'Jane Smith',
+            'current_location': 'New York, NY',
+            'current_lat': 40.7128,
+            'current_lng': -74.0060,
+            'current_cycle_hours': 0,
+            'waypoints': [
+                waypoint('pickup', 'Philadelphia, PA', 39.9526, -75.1652),
+                waypoint('dropoff', 'Baltimore, MD', 39.2904, -76.6122),
+                waypoint('dropoff', 'Washington, DC', 38.9072, -77.0369),
+            ],
+        }
+
+    def test_create_trip_with_waypoints(self):
+        """Test that every waypoint is persisted and planned in order"""
+        response = self.client.post('/api/trips/', self.payload, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        trip = Trip.objects.get()
+        self.assertEqual(trip.pickup_location, 'Philadelphia, PA')
+        self.assertEqual(trip.dropoff_location, 'Washington, DC')
+        self.assertEqual(
+            list(trip.waypoints.values_list('order', 'location_name')),
+            [(1, 'Philadelphia, PA'), (2, 'Baltimore, MD'), (3, 'Washington, DC')],
+        )
+        self.assertEqual([s['stop_type'] for s in response.data['route_stops']], ['pickup', 'dropoff', 'dropoff'])
+        self.assertEqual(len(response.data['waypoints']), 3)
+
+    def test_classic_payload_creates_two_waypoints(self):
+        """Test that the pickup/dropoff pair still works and is stored as two waypoints"""
+        payload = {k: v for k, v in self.payload.items() if k != 'waypoints'}
+        payload.update({
+            'pickup_location': 'Philadelphia, PA',
+            'pickup_lat': 39.9526,
+            'pickup_lng': -75.1652,
+            'dropoff_location': 'Washington, DC',
+            'dropoff_lat': 38.9072,
+            'dropoff_lng': -77.0369,
+        })
+        response = self.client.post('/api/trips/', payload, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            list(TripWaypoint.objects.values_list('stop_type', flat=True)),
+            ['pickup', 'dropoff'],
+        )
+
+    def test_requires_waypoints_or_pickup_and_dropoff(self):
+        """Test validation when neither form of destination is given"""
+        payload = {k: v for k, v in self.payload.items() if k != 'waypoints'}
+        serializer = TripCreateSerializer(data=payload)
+
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('pickup_lat', serializer.errors)
+        self.assertIn('dropoff_location', serializer.errors)
@@ -0,0 +1,80 @@
+import io
+from datetime import datetime
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from analytics import metrics
+from analytics.models import LogEntry, Trip
+from analytics.util import build_log_timeline, cached_log_timeline, plan_route, trip_waypoints
+
+PLANNING_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'planning': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-planning'},
+}
+
+
+@override_settings(CACHES=PLANNING_CACHE)
+class PlanningCacheTest(TestCase):
+    """Test cases for the planning cache and the command that warms it with frequent lanes"""
+
+    def setUp(self):
+        caches['planning'].clear()
+        self.client = APIClient()
+
+    def trip_data(self, dropoff='Houston, TX', lat=29.7604, lng=-95.3698, cycle_hours=0):
+        return {
+            'driver_name': 'John Doe',
+            'current_location': 'New York, NY',
+            'current_lat': 40.7128,
+            'current_lng': -74.0060,
+            'pickup_location': 'Chicago, IL',
+            'pickup_lat': 41.8781,
+            'pickup_lng': -87.6298,
+            'dropoff_location': dropoff,
+            'dropoff_lat': lat,
+            'dropoff_lng': lng,
+            'current_cycle_hours': cycle_hours,
+        }
+
+    def hits(self, cache_name):
+        return metrics.REGISTRY['cache_requests_total'].values.get((cache_name, 'hit'), 0)
+
+    def test_cached_timeline_moves_to_the_start_date(self):
+        """Test that a timeline cached for one day is laid out identically on another"""
+        route_stops, _, _ = plan_route(40.7128, -74.0060, trip_waypoints(self.trip_data()))
+        cached_log_timeline(route_stops, datetime(2025, 3, 1, 8))
+        hits = self.hits('log_timeline')
+
+        timeline = cached_log_timeline(route_stops, datetime(2025, 6, 30, 8))
+        self.assertEqual(self.hits('log_timeline'), hits + 1)
+        self.assertEqual(timeline, build_log_timeline(route_stops, datetime(2025, 6, 30, 8)))
+
+    def test_warm_frequent_lanes(self):
+        """Test that the most frequent lane (cycle hours folded by hours since rest) is warmed and then hit"""
+        for cycle_hours in (0, 11, 22):
+            self.client.post('/api/trips/', self.trip_data(cycle_hours=cycle_hours), format='json')
+        self.client.post('/api/trips/', self.trip_data('Denver, CO', 39.7392, -104.9903), format='json')
+        uncached = {
+            trip.pk: list(LogEntry.objects.filter(daily_log__trip=trip).values_list('status', 'start_time', 'end_time'))
+            for trip in Trip.objects.all()
+        }
+        caches['planning'].clear()
+
+        output = io.StringIO()
+        call_command('warm_planning_cache', '--lanes', '1', '--workers', '0', stdout=output)
+        self.assertIn('1 lanes cover 3 of 4 trips', output.getvalue())
+        self.assertIn('0.0% -> 75.0% (+75.0%)', output.getvalue())
+
+        route_hits, timeline_hits = self.hits('route_plan'), self.hits('log_timeline')
+        response = self.client.post('/api/trips/', self.trip_data(cycle_hours=33), format='json')
+        self.assertEqual(self.hits('route_plan'), route_hits + 1)
+        self.assertEqual(self.hits('log_timeline'), timeline_hits + 1)
+
+        entries = list(
+            LogEntry.objects.filter(daily_log__trip_id=response.data['id']).values_list('status', 'start_time', 'end_time')
+        )
+        first_trip = Trip.objects.order_by('id').first()
+        self.assertEqual(entries, uncached[first_trip.pk])
@@ -0,0 +1,85 @@
+import io
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from analytics.models import DailyLog, DriverStatus, LogEntry, RouteStop, Trip, TripCorridorCell, TripGeometry, TripWaypoint
+from analytics.purge import purge_trips
+
+
+class TripPurgeTest(TestCase):
+    """Test cases for the chunked, cascade-free bulk purge of trips"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.trip_ids = []
+        for driver, dropoff, lat, lng in (('John Doe', 'Houston, TX', 29.7604, -95.3698),
+                                          ('John Doe', 'Denver, CO', 39.7392, -104.9903),
+                                          ('Jane Roe', 'Miami, FL', 25.7617, -80.1918)):
+            response = self.client.post('/api/trips/', {
+                'driver_name': driver,
+                'current_location': 'New York, NY',
+                'current_lat': 40.7128,
+                'current_lng': -74.0060,
+                'pickup_location': 'Chicago, IL',
+                'pickup_lat': 41.8781,
+                'pickup_lng': -87.6298,
+                'dropoff_location': dropoff,
+                'dropoff_lat': lat,
+                'dropoff_lng': lng,
+                'current_cycle_hours': 0,
+            }, format='json')
+            self.trip_ids.append(response.data['id'])
+
+    def related_counts(self, trip_ids):
+        return {
+            'route_stops': RouteStop.objects.filter(trip_id__in=trip_ids).count(),
+            'daily_logs': DailyLog.objects.filter(trip_id__in=trip_ids).count(),
+            'entries': LogEntry.objects.filter(daily_log__trip_id__in=trip_ids).count(),
+            'waypoints': TripWaypoint.objects.filter(trip_id__in=trip_ids).count(),
+            'geometries': TripGeometry.objects.filter(trip_id__in=trip_ids).count(),
+            'corridor_cells': TripCorridorCell.objects.filter(trip_id__in=trip_ids).count(),
+        }
+
+    def test_purge_in_chunks(self):
+        """Test that purged trips lose every child row, other trips are untouched and references are cleared"""
+        purged, kept = self.trip_ids[:2], self.trip_ids[2:]
+        kept_counts = self.related_counts(kept)
+        expected_rows = sum(self.related_counts(purged).values()) + len(purged)
+
+        progress = [dict(totals) for totals in purge_trips(Trip.objects.filter(pk__in=purged), chunk_size=1)]
+
+        self.assertEqual([p['trips'] for p in progress], [1, 2])
+        self.assertEqual(progress[-1]['tables']['analytics_trip'], 2)
+        self.assertEqual(progress[-1]['tables']['analytics_driverstatus'], 1)
+        self.assertEqual(progress[-1]['rows'], expected_rows + 1)
+        self.assertEqual(list(Trip.objects.values_list('id', flat=True)), kept)
+        self.assertEqual(sum(self.related_counts(purged).values()), 0)
+        self.assertEqual(self.related_counts(kept), kept_counts)
+        self.assertIsNone(DriverStatus.objects.get(driver_name='John Doe').last_trip_id)
+        self.assertEqual(DriverStatus.objects.get(driver_name='Jane Roe').last_trip_id, kept[0])
+
+    def test_dry_run_command(self):
+        """Test that a dry run reports the rows it would delete and deletes nothing"""
+        counts = self.related_counts(self.trip_ids)
+        output = io.StringIO()
+        call_command('purge_trips', '--driver', 'John Doe', '--dry-run', stdout=output)
+
+        self.assertIn('Would purge 2 trips', output.getvalue())
+        self.assertIn('rows/s', output.getvalue())
+        self.assertEqual(Trip.objects.count(), 3)
+        self.assertEqual(self.related_counts(self.trip_ids), counts)
+
+    def test_admin_action(self):
+        """Test the purge action of the trip admin"""
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        response = self.client.post('/admin/analytics/trip/', {
+            'action': 'purge_selected', '_selected_action': [self.trip_ids[0]],
+        }, follow=True)
+
+        self.assertContains(response, 'Purged 1 trips')
+        self.assertFalse(Trip.objects.filter(pk=self.trip_ids[0]).exists())
+        self.assertEqual(self.related_counts([self.trip_ids[0]])['entries'], 0)
@@ -0,0 +1,143 @@
+import time as clock
+import zlib
+from datetime import date, time
+from xml.etree import ElementTree
+
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from analytics.models import DailyLog, LogEntry, Trip
+from analytics.rendering import (
+    GRID_LEFT, HOUR_WIDTH, log_sheet_data, pdf_page_content, render_pdf, render_svg,
+    sheet_cache_key, sheet_version, status_segments,
+)
+
+
+class LogSheetRenderingTest(TestCase):
+    """Test cases for drawing daily logs as SVG and PDF log sheets"""
+
+    def setUp(self):
+        self.trip = Trip.objects.create(
+            driver_name='John Doe', current_location='New York, NY', current_lat=40.7128, current_lng=-74.0060,
+            pickup_location='Chicago, IL', pickup_lat=41.8781, pickup_lng=-87.6298,
+            dropoff_location='Houston, TX', dropoff_lat=29.7604, dropoff_lng=-95.3698, current_cycle_hours=0,
+        )
+        self.log = DailyLog.objects.create(
+            trip=self.trip, date=date(2025, 3, 4), driver_name='John Doe', home_terminal='New York, NY & Co',
+        )
+        LogEntry.objects.bulk_create([
+            LogEntry(daily_log=self.log, status='on_duty', start_time=time(8, 0), end_time=time(9, 0),
+                     duration_hours=1, location='Chicago, IL'),
+            LogEntry(daily_log=self.log, status='driving', start_time=time(9, 0), end_time=time(19, 0),
+                     duration_hours=10, location='Memphis, TN'),
+            LogEntry(daily_log=self.log, status='sleeper', start_time=time(19, 0), end_time=time(23, 59),
+                     duration_hours=5, location='Memphis, TN'),
+        ])
+        self.sheet = log_sheet_data(self.log)
+
+    def test_status_segments_cover_the_day(self):
+        """Test that unlogged time is drawn as off duty and 23:59 runs to midnight"""
+        segments = status_segments(self.sheet['entries'])
+
+        self.assertEqual(segments[0], ('off_duty', 0, 8 * 60))
+        self.assertEqual(segments[-1], ('sleeper', 19 * 60, 24 * 60))
+        self.assertEqual(sum(end - start for _, start, end in segments), 24 * 60)
+
+    def test_svg_status_line(self):
+        """Test that the SVG parses and the status line steps through the duty rows"""
+        svg = ElementTree.fromstring(render_svg(self.sheet))
+        namespace = '{http://www.w3.org/2000/svg}'
+
+        polyline = svg.find(f'.//{namespace}polyline')
+        points = [tuple(map(float, p.split(','))) for p in polyline.get('points').split()]
+        self.assertEqual(points[0][0], GRID_LEFT)
+        self.assertEqual(points[-1][0], GRID_LEFT + 24 * HOUR_WIDTH)
+        self.assertEqual(len({y for _, y in points}), 4)
+        texts = [t.text for t in svg.iter(f'{namespace}text')]
+        self.assertIn('Home terminal: New York, NY & Co', texts)
+        self.assertIn('10.00', texts)
+
+    def test_pdf_structure(self):
+        """Test that the PDF has one page per sheet and a cross-reference table pointing at its objects"""
+        pdf = render_pdf([self.sheet, self.sheet])
+
+        self.assertTrue(pdf.startswith(b'%PDF-1.4'))
+        self.assertTrue(pdf.endswith(b'%%EOF\n'))
+        self.assertIn(b'/Count 2', pdf)
+        xref_offset = int(pdf.rsplit(b'startxref\n', 1)[1].split(b'\n')[0])
+        self.assertTrue(pdf[xref_offset:].startswith(b'xref'))
+        first_offset = int(pdf[xref_offset:].split(b'\n')[3][:10])
+        self.assertTrue(pdf[first_offset:].startswith(b'1 0 obj'))
+
+        content = zlib.decompress(pdf_page_content(self.sheet))
+        self.assertIn(b'(Home terminal: New York, NY & Co) Tj', content)
+
+    def test_render_is_fast(self):
+        """Test that rendering one day takes only a few milliseconds"""
+        started = clock.perf_counter()
+        for _ in range(20):
+            render_svg(self.sheet)
+            render_pdf([self.sheet])
+        self.assertLess((clock.perf_counter() - started) / 20, 0.02)
+
+
+class DailyLogSheetAPITest(TestCase):
+    """Test cases for the log sheet endpoint and its render cache"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        response = self.client.post('/api/trips/', {
+            'driver_name': 'John Doe',
+            'current_location': 'New York, NY',
+            'current_lat': 40.7128,
+            'current_lng': -74.0060,
+            'pickup_location': 'Chicago, IL',
+            'pickup_lat': 41.8781,
+            'pickup_lng': -87.6298,
+            'dropoff_location': 'Houston, TX',
+            'dropoff_lat': 29.7604,
+            'dropoff_lng': -95.3698,
+            'current_cycle_hours': 0,
+        }, format='json')
+        self.log = DailyLog.objects.filter(trip_id=response.data['id']).first()
+
+    def test_sheet_formats(self):
+        """Test that both formats are served with their content types and unknown ones are not found"""
+        svg = self.client.get(f'/api/daily-logs/{self.log.id}/sheet.svg')
+        pdf = self.client.get(f'/api/daily-logs/{self.log.id}/sheet.pdf')
+
+        self.assertEqual(svg.status_code, 200)
+        self.assertEqual(svg['Content-Type'], 'image/svg+xml')
+        self.assertTrue(svg.content.startswith(b'<svg'))
+        self.assertEqual(pdf.status_code, 200)
+        self.assertEqual(pdf['Content-Type'], 'application/pdf')
+        self.assertTrue(pdf.content.startswith(b'%PDF'))
+        self.assertEqual(self.client.get(f'/api/daily-logs/{self.log.id}/sheet.png').status_code, 404)
+        self.assertEqual(self.client.get('/api/daily-logs/999999/sheet.svg').status_code, 404)
+
+    def test_cache_follows_updated_at(self):
+        """Test that a cached sheet is reused until the log is saved again"""
+        self.client.get(f'/api/daily-logs/{self.log.id}/sheet.svg')
+        key = sheet_cache_key(self.log.id, sheet_version(self.log), 'svg')
+        cache.set(key, '<svg>cached</svg>')
+        self.assertEqual(self.client.get(f'/api/daily-logs/{self.log.id}/sheet.svg').content, b'<svg>cached</svg>')
+
+        self.log.save()
+        self.assertNotEqual(self.client.get(f'/api/daily-logs/{self.log.id}/sheet.svg').content, b'<svg>cached</svg>')
+
+    def test_cache_follows_entry_edits(self):
+        """Test that editing or deleting a log entry invalidates the cached sheet"""
+        url = f'/api/daily-logs/{self.log.id}/sheet.svg'
+        cache.set(sheet_cache_key(self.log.id, sheet_version(self.log), 'svg'), '<svg>cached</svg>')
+        self.assertEqual(self.client.get(url).content, b'<svg>cached</svg>')
+
+        entry = self.log.entries.order_by('start_time').first()
+        entry.remarks = 'Corrected by dispatch'
+        entry.save()
+        self.assertNotEqual(self.client.get(url).content, b'<svg>cached</svg>')
+
+        cache.set(sheet_cache_key(self.log.id, sheet_version(self.log), 'svg'), '<svg>cached</svg>')
+        self.log.entries.order_by('-start_time').first().delete()
+        self.assertNotEqual(self.client.get(url).content, b'<svg>cached</svg>')
@@ -0,0 +1,150 @@
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from analytics.models import DailyLog, LogEntry, RouteStop, Trip
+from analytics.replan import plan_start, replan_trip
+
+
+class ReplanTripTest(TestCase):
+    """Test cases for incremental mid-trip replanning"""
+
+    def setUp(self):
+        self.client = APIClient()
+        response = self.client.post('/api/trips/', {
+            'driver_name': 'John Doe',
+            'current_location': 'New York, NY',
+            'current_lat': 40.7128,
+            'current_lng': -74.0060,
+            'pickup_location': 'Chicago, IL',
+            'pickup_lat': 41.8781,
+            'pickup_lng': -87.6298,
+            'dropoff_location': 'Denver, CO',
+            'dropoff_lat': 39.7392,
+            'dropoff_lng': -104.9903,
+            'current_cycle_hours': 0,
+        }, format='json')
+        self.trip = Trip.objects.get(pk=response.data['id'])
+        self.start = plan_start(self.trip)
+
+    def snapshot_stops(self):
+        return list(self.trip.route_stops.order_by('order').values())
+
+    def test_replan_at_start_changes_nothing(self):
+        """Test that replanning from the original start and state rewrites no rows"""
+        changes = replan_trip(
+            self.trip, self.trip.current_lat, self.trip.current_lng, hours_since_rest=0,
+            current_time=timezone.make_aware(self.start),
+        )
+
+        self.assertEqual(changes['route_stops'], {'updated': 0, 'created': 0, 'deleted': 0})
+        self.assertEqual(changes['log_entries'], {'updated': 0, 'created': 0, 'deleted': 0})
+
+    def test_delay_keeps_completed_prefix(self):
+        """Test that a delay after the first rest keeps the prefix and shifts the remaining plan"""
+        before = self.snapshot_stops()
+        first_rest = next(s for s in before if s['stop_type'] == RouteStop.REST_BREAK)
+        completed = first_rest['order']
+        rest_done = self.start + timedelta(hours=first_rest['cumulative_hours'] + first_rest['duration_hours'])
+        delay = timedelta(hours=3)
+        old_total = self.trip.total_trip_time
+        past_logs = {log.pk: log.updated_at for log in self.trip.daily_logs.filter(date__lt=rest_done.date())}
+
+        changes = replan_trip(
+            self.trip, first_rest['latitude'], first_rest['longitude'], hours_since_rest=0,
+            current_time=timezone.make_aware(rest_done + delay),
+        )
+
+        after = self.snapshot_stops()
+        self.assertEqual(after[:completed], before[:completed])
+        self.assertEqual([s['stop_type'] for s in after[completed:]], [s['stop_type'] for s in before[completed:]])
+        self.assertAlmostEqual(after[completed]['cumulative_hours'], before[completed]['cumulative_hours'] + 3, delta=0.1)
+        self.assertEqual(changes['route_stops']['created'] + changes['route_stops']['deleted'], 0)
+        self.assertLessEqual(changes['route_stops']['updated'], len(before) - completed)
+
+        self.trip.refresh_from_db()
+        self.assertAlmostEqual(self.trip.total_trip_time, old_total + 3, delta=0.1)
+        for log in DailyLog.objects.filter(pk__in=past_logs):
+            self.assertEqual(log.updated_at, past_logs[log.pk])
+
+        # The timeline never exceeds a day per log (entry times are truncated to whole minutes)
+        for log in self.trip.daily_logs.all():
+            self.assertLessEqual(sum(e.duration_hours for e in log.entries.all()), 24 + 5 / 60)
+        cut = (rest_done + delay).time()
+        cut_entries = LogEntry.objects.filter(daily_log__trip=self.trip, daily_log__date=(rest_done + delay).date())
+        self.assertTrue(cut_entries.filter(start_time=cut).exists())
+
+    def test_replan_endpoint(self):
+        """Test the replan action and its validation"""
+        response = self.client.post(f'/api/trips/{self.trip.id}/replan/', {'current_lat': 41.0}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('hours_since_rest', response.data)
+
+        current_time = timezone.make_aware(datetime.combine(self.start.date(), self.start.time()) + timedelta(hours=2))
+        response = self.client.post(f'/api/trips/{self.trip.id}/replan/', {
+            'current_lat': 40.9,
+            'current_lng': -76.0,
+            'current_time': current_time.isoformat(),
+            'hours_since_rest': 2,
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], self.trip.id)
+        self.assertAlmostEqual(response.data['route_stops'][0]['cumulative_hours'] - 2,
+                               response.data['route_stops'][0]['distance_from_previous'] / 48, places=6)
+
+
+class ReplanProgressTest(TestCase):
+    """Test cases for inferring replan progress from the driver's reported position"""
+
+    def setUp(self):
+        self.client = APIClient()
+        response = self.client.post('/api/trips/', {
+            'driver_name': 'Jane Roe',
+            'current_location': 'New York, NY',
+            'current_lat': 40.7128,
+            'current_lng': -74.0060,
+            'pickup_location': 'Philadelphia, PA',
+            'pickup_lat': 39.9526,
+            'pickup_lng': -75.1652,
+            'dropoff_location': 'Washington, DC',
+            'dropoff_lat': 38.9072,
+            'dropoff_lng': -77.0369,
+            'current_cycle_hours': 0,
+        }, format='json')
+        self.trip = Trip.objects.get(pk=response.data['id'])
+        self.start = plan_start(self.trip)
+
+    def stop_types(self):
+        return list(self.trip.route_stops.order_by('order').values_list('stop_type', flat=True))
+
+    def test_late_driver_keeps_stops_ahead(self):
+        """Test that a driver still at the start keeps the pickup the clock says is done"""
+        pickup = self.trip.route_stops.get(stop_type=RouteStop.PICKUP_LOCATION)
+        self.assertLess(pickup.cumulative_hours + pickup.duration_hours, 3)
+
+        replan_trip(
+            self.trip, 40.7128, -74.0060, hours_since_rest=0,
+            current_time=timezone.make_aware(self.start + timedelta(hours=3)),
+        )
+
+        self.assertEqual(self.stop_types(), [RouteStop.PICKUP_LOCATION, RouteStop.DROPOFF_LOCATION])
+        pickup = self.trip.route_stops.get(stop_type=RouteStop.PICKUP_LOCATION)
+        self.assertEqual(pickup.location_name, 'Philadelphia, PA')
+        self.assertAlmostEqual(pickup.cumulative_hours, 3 + pickup.distance_from_previous / 48, places=6)
+
+    def test_early_driver_past_pickup(self):
+        """Test that a driver already past the pickup is not sent back to it"""
+        # Between Philadelphia and Washington, an hour after the plan start
+        changes = replan_trip(
+            self.trip, 39.4, -76.1, hours_since_rest=3,
+            current_time=timezone.make_aware(self.start + timedelta(hours=1)),
+        )
+
+        stops = list(self.trip.route_stops.order_by('order'))
+        self.assertEqual([s.stop_type for s in stops], [RouteStop.PICKUP_LOCATION, RouteStop.DROPOFF_LOCATION])
+        self.assertEqual(changes['route_stops']['created'] + changes['route_stops']['deleted'], 0)
+        self.assertLess(stops[1].distance_from_previous, 100)
+        self.assertAlmostEqual(stops[1].cumulative_hours, 1 + stops[1].distance_from_previous / 48, places=6)
@@ -0,0 +1,99 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from analytics.replicas import MONITOR, PIN_COOKIE, ReplicaRouter
+
+TRIP = {
+    'driver_name': 'John Doe',
+    'current_location': 'New York, NY',
+    'current_lat': 40.7128,
+    'current_lng': -74.0060,
+    'pickup_location': 'Chicago, IL',
+    'pickup_lat': 41.8781,
+    'pickup_lng': -87.6298,
+    'dropoff_location': 'Houston, TX',
+    'dropoff_lat': 29.7604,
+    'dropoff_lng': -95.3698,
+    'current_cycle_hours': 0,
+}
+
+
+@override_settings(REPLICA_DATABASES=['replica1'], REPLICA_MAX_LAG_SECONDS=10)
+class ReplicaRoutingTest(TestCase):
+    """Test cases for routing trip reads to read replicas.
+
+    The router's choices are recorded while every query still runs on the test database.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.trip_id = self.client.post('/api/trips/', TRIP, format='json').data['id']
+        self.client.cookies.clear()
+        self.reads = []
+        original = ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            self.reads.append(original(router, model, **hints))
+            return 'default'
+
+        patcher = mock.patch.object(ReplicaRouter, 'db_for_read', autospec=True, side_effect=record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        lag = mock.patch.object(MONITOR, 'lag', return_value=0.0)
+        self.lag = lag.start()
+        self.addCleanup(lag.stop)
+        MONITOR.reset()
+
+    def get(self, path, **params):
+        self.reads.clear()
+        response = self.client.get(path, params)
+        return response, set(self.reads)
+
+    def test_reads_go_to_replica(self):
+        """Test that list, retrieve, daily_logs and export read from the replica, other views from the primary"""
+        for path in ('/api/trips/', f'/api/trips/{self.trip_id}/', f'/api/trips/{self.trip_id}/daily_logs/'):
+            response, databases = self.get(path)
+            self.assertEqual(response.status_code, 200, path)
+            self.assertEqual(databases, {'replica1'}, path)
+
+        self.reads.clear()
+        response = self.client.get('/api/daily-logs/export/', {'start': '2000-01-01', 'end': '2100-01-01'})
+        self.assertEqual(response.status_code, 200)
+        b''.join(response.streaming_content)
+        self.assertEqual(set(self.reads), {'replica1'})
+
+        response, databases = self.get(f'/api/trips/{self.trip_id}/geometry/')
+        self.assertEqual(databases, {'default'})
+
+    def test_read_after_write(self):
+        """Test that a client that just wrote reads from the primary until its pin expires"""
+        response = self.client.post('/api/trips/', TRIP, format='json')
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+
+        response, databases = self.get(f'/api/trips/{response.data["id"]}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(databases, {'default'})
+
+        self.client.cookies.clear()
+        _, databases = self.get(f'/api/trips/{self.trip_id}/')
+        self.assertEqual(databases, {'replica1'})
+
+    def test_lagging_replica(self):
+        """Test that replicas too far behind, or unreachable, are skipped"""
+        self.lag.return_value = 60.0
+        _, databases = self.get('/api/trips/')
+        self.assertEqual(databases, {'default'})
+
+        MONITOR.reset()
+        self.lag.return_value = None
+        _, databases = self.get('/api/trips/')
+        self.assertEqual(databases, {'default'})
+
+    def test_missing_on_replica(self):
+        """Test that a trip not found on the replica is looked up again on the primary"""
+        response, databases = self.get('/api/trips/999999/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(databases, {'replica1', 'default'})
@@ -0,0 +1,123 @@
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.test import APIClient
+
+from analytics.models import RouteStop, Trip
+from analytics.replan import plan_start, replan_trip
+from analytics.simulation import simulate_route, simulate_trip
+from analytics.util import plan_route
+
+WAYPOINTS = [
+    {'stop_type': 'pickup', 'location_name': 'Chicago, IL', 'latitude': 41.8781, 'longitude': -87.6298},
+    {'stop_type': 'dropoff', 'location_name': 'Denver, CO', 'latitude': 39.7392, 'longitude': -104.9903},
+    {'stop_type': 'dropoff', 'location_name': 'Los Angeles, CA', 'latitude': 34.0522, 'longitude': -118.2437},
+]
+
+
+class SimulationTest(TestCase):
+    """Test cases for the Monte Carlo ETA and 10-hour reset risk simulation"""
+
+    def test_zero_spread_matches_planner(self):
+        """Test that samples without any spread reproduce the deterministic plan"""
+        for hours_since_rest in (0.0, 6.5, 10.9):
+            route_stops, _, total_time = plan_route(40.7128, -74.0060, WAYPOINTS, hours_since_rest=hours_since_rest)
+            runs = simulate_route(40.7128, -74.0060, WAYPOINTS, hours_since_rest, samples=3, trip_speed_sigma=0,
+                                  leg_speed_sigma=0, dwell_sigma=0, fuel_dwell_sigma=0)
+
+            np.testing.assert_allclose(runs['total'], total_time)
+            np.testing.assert_array_equal(runs['rests'], sum(1 for s in route_stops if s['stop_type'] == 'rest'))
+            np.testing.assert_allclose(runs['arrival'], route_stops[-1]['cumulative_hours'])
+
+    def test_percentiles_and_reset_risk(self):
+        """Test that sampled trips spread around the plan and report the chance of an extra reset"""
+        result = simulate_trip(40.7128, -74.0060, WAYPOINTS, samples=10000, seed=1)
+
+        arrival = result['arrival_hours']
+        self.assertLess(arrival['p10'], arrival['p50'])
+        self.assertLess(arrival['p50'], arrival['p80'])
+        self.assertLess(arrival['p80'], arrival['p95'])
+        # Slower-than-average runs cost more time than faster ones save, so the plan is optimistic
+        self.assertGreater(arrival['p50'], result['planned']['arrival_hours'])
+        self.assertGreater(result['extra_reset_probability'], 0)
+        self.assertLess(result['extra_reset_probability'], 1)
+        self.assertAlmostEqual(sum(result['rest_breaks'].values()), 1, places=3)
+        self.assertEqual(result, simulate_trip(40.7128, -74.0060, WAYPOINTS, samples=10000, seed=1))
+
+    def test_speed(self):
+        """Test that 10k samples of a trip take well under 100 ms"""
+        simulate_trip(40.7128, -74.0060, WAYPOINTS, samples=10000, seed=0)
+        started = time.perf_counter()
+        simulate_trip(40.7128, -74.0060, WAYPOINTS, samples=10000, seed=0)
+        self.assertLess(time.perf_counter() - started, 0.1)
+
+    def test_simulation_endpoint(self):
+        """Test the simulation action of a planned trip and its validation"""
+        client = APIClient()
+        trip_id = client.post('/api/trips/', {
+            'driver_name': 'John Doe',
+            'current_location': 'New York, NY',
+            'current_lat': 40.7128,
+            'current_lng': -74.0060,
+            'pickup_location': 'Chicago, IL',
+            'pickup_lat': 41.8781,
+            'pickup_lng': -87.6298,
+            'dropoff_location': 'Houston, TX',
+            'dropoff_lat': 29.7604,
+            'dropoff_lng': -95.3698,
+            'current_cycle_hours': 0,
+        }, format='json').data['id']
+
+        response = client.get(f'/api/trips/{trip_id}/simulation/', {'samples': 2000, 'seed': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['samples'], 2000)
+        self.assertAlmostEqual(response.data['planned']['total_trip_time'], Trip.objects.get(pk=trip_id).total_trip_time,
+                               places=2)
+        self.assertEqual(set(response.data['eta']), {'p10', 'p50', 'p80', 'p95'})
+        self.assertLess(response.data['eta']['p50'], response.data['eta']['p95'])
+
+        invalid = client.get(f'/api/trips/{trip_id}/simulation/', {'samples': 10 ** 9})
+        self.assertEqual(invalid.status_code, 400)
+
+    def test_replanned_trip(self):
+        """Test that a replanned trip is simulated from the replan's position and state, over its stored route"""
+        client = APIClient()
+        trip = Trip.objects.get(pk=client.post('/api/trips/', {
+            'driver_name': 'John Doe',
+            'current_location': 'New York, NY',
+            'current_lat': 40.7128,
+            'current_lng': -74.0060,
+            'pickup_location': 'Chicago, IL',
+            'pickup_lat': 41.8781,
+            'pickup_lng': -87.6298,
+            'dropoff_location': 'Houston, TX',
+            'dropoff_lat': 29.7604,
+            'dropoff_lng': -95.3698,
+            'current_cycle_hours': 0,
+        }, format='json').data['id'])
+        first_rest = trip.route_stops.filter(stop_type=RouteStop.REST_BREAK).order_by('order').first()
+        # Three hours late leaving the first rest
+        replanned_at = plan_start(trip) + timedelta(
+            hours=first_rest.cumulative_hours + first_rest.duration_hours + 3
+        )
+        replan_trip(trip, first_rest.latitude, first_rest.longitude, hours_since_rest=0,
+                    current_time=timezone.make_aware(replanned_at))
+        trip.refresh_from_db()
+
+        response = client.get(f'/api/trips/{trip.pk}/simulation/', {'samples': 2000, 'seed': 3})
+        self.assertEqual(response.status_code, 200)
+        planned = response.data['planned']
+        self.assertAlmostEqual(planned['total_trip_time'], trip.total_trip_time, places=2)
+        self.assertEqual(planned['rest_breaks'], trip.rest_breaks_needed)
+        dropoff = trip.route_stops.order_by('order').last()
+        self.assertAlmostEqual(planned['arrival_hours'], dropoff.cumulative_hours, places=2)
+
+        # The ETA counts from the plan start, so even the fastest runs arrive after the replan
+        start = timezone.make_aware(plan_start(trip))
+        eta = parse_datetime(str(response.data['eta']['p10']))
+        self.assertGreater(eta, timezone.make_aware(replanned_at))
+        self.assertAlmostEqual((eta - start).total_seconds() / 3600, response.data['arrival_hours']['p10'], places=2)
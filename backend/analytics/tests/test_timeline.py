@@ -0,0 +1,185 @@
+import io
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from unittest import mock
+
+import numpy as np
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from analytics.archive import archive_batch
+from analytics.models import DriverDayTimeline, LogEntry, Trip
+from analytics.purge import purge_trips
+from analytics.replan import plan_start
+from analytics import timeline
+from analytics.timeline import SECONDS_PER_DAY, clock_seconds, driver_timeline, paint, rebuild_driver_timelines
+
+
+def trip_request(driver, pickup, dropoff):
+    return {
+        'driver_name': driver,
+        'current_location': 'New York, NY',
+        'current_lat': 40.7128,
+        'current_lng': -74.0060,
+        'pickup_location': pickup[0],
+        'pickup_lat': pickup[1],
+        'pickup_lng': pickup[2],
+        'dropoff_location': dropoff[0],
+        'dropoff_lat': dropoff[1],
+        'dropoff_lng': dropoff[2],
+        'current_cycle_hours': 0,
+    }
+
+
+class DriverTimelineTest(TestCase):
+    """Test cases for the per-driver day timelines merged across trips"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.long_trip = self.client.post('/api/trips/', trip_request(
+            'John Doe', ('Chicago, IL', 41.8781, -87.6298), ('Houston, TX', 29.7604, -95.3698)
+        ), format='json').data['id']
+        self.short_trip = self.client.post('/api/trips/', trip_request(
+            'John Doe', ('Philadelphia, PA', 39.9526, -75.1652), ('Baltimore, MD', 39.2904, -76.6122)
+        ), format='json').data['id']
+        self.client.post('/api/trips/', trip_request(
+            'Jane Roe', ('Boston, MA', 42.3601, -71.0589), ('Albany, NY', 42.6526, -73.7562)
+        ), format='json')
+
+    def expected_day(self, driver_name, log_date):
+        """Second by second status and trip of a day, painted from the trips' log entries, oldest trip first"""
+        statuses = np.full(SECONDS_PER_DAY, '', dtype=object)
+        trips = np.zeros(SECONDS_PER_DAY, dtype=np.int64)
+        entries = LogEntry.objects.filter(daily_log__driver_name=driver_name, daily_log__date=log_date)
+        for entry in entries.order_by('daily_log__trip_id', 'start_time'):
+            start, end = clock_seconds(entry.start_time), clock_seconds(entry.end_time, end=True)
+            statuses[start:end] = entry.status
+            trips[start:end] = entry.daily_log.trip_id
+        return statuses, trips
+
+    def assert_days_merged(self, driver_name):
+        days = DriverDayTimeline.objects.filter(driver_name=driver_name)
+        dates = set(LogEntry.objects.filter(daily_log__driver_name=driver_name).values_list('daily_log__date', flat=True))
+        self.assertEqual({day.date for day in days}, dates)
+        for day in days:
+            statuses, trips = self.expected_day(driver_name, day.date)
+            merged_statuses = np.full(SECONDS_PER_DAY, '', dtype=object)
+            merged_trips = np.zeros(SECONDS_PER_DAY, dtype=np.int64)
+            for start, end, status, trip_id, _ in day.segments:
+                self.assertTrue(np.all(merged_statuses[start:end] == ''), 'segments overlap')
+                merged_statuses[start:end] = status
+                merged_trips[start:end] = trip_id
+            np.testing.assert_array_equal(merged_statuses, statuses)
+            np.testing.assert_array_equal(merged_trips, trips)
+
+    def test_paint(self):
+        """Test that painted segments replace what they cover and split what they partly cover"""
+        segments = [[0, 100, 'driving', 1, ''], [100, 200, 'on_duty', 1, ''], [300, 400, 'sleeper', 1, '']]
+        paint(segments, [[50, 150, 'off_duty', 2, ''], [350, 500, 'driving', 2, '']])
+        self.assertEqual(segments, [
+            [0, 50, 'driving', 1, ''], [50, 150, 'off_duty', 2, ''], [150, 200, 'on_duty', 1, ''],
+            [300, 350, 'sleeper', 1, ''], [350, 500, 'driving', 2, ''],
+        ])
+
+    def test_trips_merged_per_day(self):
+        """Test that a driver's trips on the same day merge into one timeline, the later trip winning"""
+        self.assert_days_merged('John Doe')
+        self.assert_days_merged('Jane Roe')
+
+        today = DriverDayTimeline.objects.get(driver_name='John Doe', date=datetime.now().date())
+        self.assertEqual({segment[3] for segment in today.segments}, {self.long_trip, self.short_trip})
+
+    def test_day_created_concurrently(self):
+        """Test that a day row another transaction inserted after the first lookup is merged into, not duplicated"""
+        real_locked_days = timeline.locked_days
+        lookups = []
+
+        def racing_locked_days(driver_name, dates):
+            # The first lookup runs before the other transaction commits its rows, so it sees none
+            lookups.append(dates)
+            return {} if len(lookups) == 1 else real_locked_days(driver_name, dates)
+
+        with mock.patch.object(timeline, 'locked_days', racing_locked_days):
+            response = self.client.post('/api/trips/', trip_request(
+                'John Doe', ('Newark, NJ', 40.7357, -74.1724), ('Trenton, NJ', 40.2206, -74.7597)
+            ), format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(lookups), 2)
+        self.assert_days_merged('John Doe')
+        today = DriverDayTimeline.objects.get(driver_name='John Doe', date=datetime.now().date())
+        self.assertIn(response.data['id'], {segment[3] for segment in today.segments})
+
+    def test_replan_and_purge(self):
+        """Test that replanning or purging a trip repaints only its days, from the remaining trips"""
+        trip = Trip.objects.get(pk=self.long_trip)
+        current_time = timezone.make_aware(plan_start(trip) + timedelta(hours=3))
+        response = self.client.post(f'/api/trips/{trip.pk}/replan/', {
+            'current_lat': 40.9, 'current_lng': -76.0, 'current_time': current_time.isoformat(), 'hours_since_rest': 3,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assert_days_merged('John Doe')
+
+        for _ in purge_trips(Trip.objects.filter(pk=self.short_trip)):
+            pass
+        self.assert_days_merged('John Doe')
+
+        self.assertEqual(self.client.delete(f'/api/trips/{self.long_trip}/').status_code, 204)
+        self.assertFalse(DriverDayTimeline.objects.filter(driver_name='John Doe').exists())
+        self.assertTrue(DriverDayTimeline.objects.filter(driver_name='Jane Roe').exists())
+
+    def test_rebuild_command(self):
+        """Test that rebuilding from the daily logs gives the incrementally maintained timelines"""
+        maintained = list(DriverDayTimeline.objects.order_by('driver_name', 'date').values_list('segments', flat=True))
+        output = io.StringIO()
+        call_command('rebuild_driver_timelines', stdout=output)
+
+        self.assertIn(f'Rebuilt {len(maintained)} driver day timelines', output.getvalue())
+        self.assertEqual(
+            list(DriverDayTimeline.objects.order_by('driver_name', 'date').values_list('segments', flat=True)),
+            maintained,
+        )
+
+    def test_rebuild_keeps_archived_trips(self):
+        """Test that rebuilding keeps the days of archived trips, whose logs are gone"""
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir)
+        with override_settings(ARCHIVE_DIR=archive_dir):
+            archive_batch(Trip.objects.filter(pk=self.short_trip))
+        maintained = list(DriverDayTimeline.objects.order_by('driver_name', 'date').values_list('segments', flat=True))
+
+        rebuild_driver_timelines('John Doe')
+
+        self.assertEqual(
+            list(DriverDayTimeline.objects.order_by('driver_name', 'date').values_list('segments', flat=True)),
+            maintained,
+        )
+        first = driver_timeline('John Doe', datetime.now().date(), datetime.now().date())[0]
+        self.assertEqual(first['trip_ids'], [self.long_trip, self.short_trip])
+
+    def test_timeline_endpoint(self):
+        """Test that the endpoint returns full 24-hour days from one query, and validates the range"""
+        start = datetime.now().date()
+        with self.assertNumQueries(1):
+            days = driver_timeline('John Doe', start, start + timedelta(days=30))
+        self.assertGreater(len(days), 1)
+
+        response = self.client.get('/api/drivers/timeline/', {
+            'driver_name': 'John Doe', 'start': start.isoformat(), 'end': (start + timedelta(days=30)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['days'], days)
+        first = days[0]
+        self.assertEqual(first['date'], start.isoformat())
+        self.assertEqual(first['trip_ids'], [self.long_trip, self.short_trip])
+        self.assertEqual(first['entries'][0]['start_time'], '00:00:00')
+        self.assertEqual(first['entries'][0]['status'], 'off_duty')
+        self.assertAlmostEqual(sum(entry['duration_hours'] for entry in first['entries']), 24)
+
+        invalid = self.client.get('/api/drivers/timeline/', {
+            'driver_name': 'John Doe', 'start': start.isoformat(), 'end': (start + timedelta(days=31)).isoformat(),
+        })
+        self.assertEqual(invalid.status_code, 400)
@@ -0,0 +1,253 @@
+"""
+Per-driver, per-day duty timelines merged across trips.
+
+Daily logs belong to a trip, so a driver who ends one trip and starts another on the same day has two
+partial sheets. DriverDayTimeline keeps the merged day per driver instead, maintained as trips are
+planned, replanned and purged: each day row holds its merged segments plus every contributing trip's own
+segments (its layer). Where trips overlap, the newer trip (higher id) wins. A newly planned trip is newer
+than everything already merged, so its entries are painted straight over the merged segments at the cost
+of a binary search plus the segments they cover; only replanning or removing a trip repaints the days it
+touches from their layers. Reading a driver's days is one query on the (driver_name, date) unique index.
+Archiving a trip leaves its days in place: the duty record outlives the trip's rows.
+"""
+import bisect
+from datetime import time
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedTrip, DailyLog, DriverDayTimeline, LogEntry, Trip
+
+SECONDS_PER_DAY = 24 * 3600
+# Log entries that run to midnight end at 23:59
+END_OF_DAY = time(23, 59)
+# Widest date range one timeline request may read
+MAX_TIMELINE_DAYS = 31
+
+
+def clock_seconds(value, end=False):
+    if end and value == END_OF_DAY:
+        return SECONDS_PER_DAY
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def clock_time(seconds):
+    if seconds >= SECONDS_PER_DAY:
+        return END_OF_DAY
+    return time(seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+
+def trip_segments(trip_id, entries):
+    """A trip's log entries on one day (dicts or LogEntry rows) as sorted timeline segments"""
+    segments = []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            entry = {'status': entry.status, 'start_time': entry.start_time, 'end_time': entry.end_time,
+                     'location': entry.location}
+        start, end = clock_seconds(entry['start_time']), clock_seconds(entry['end_time'], end=True)
+        if end > start:
+            segments.append([start, end, entry['status'], trip_id, entry['location']])
+    return sorted(segments, key=lambda segment: segment[0])
+
+
+def paint(segments, added):
+    """Lay segments over a sorted, non-overlapping timeline in place; where they overlap, added ones win"""
+    for segment in sorted(added, key=lambda s: s[0]):
+        start, end = segment[0], segment[1]
+        # First segment ending after this one starts; ends are sorted because segments do not overlap
+        first = bisect.bisect_right(segments, start, key=lambda s: s[1])
+        last = first
+        while last < len(segments) and segments[last][0] < end:
+            last += 1
+
+        replacement = [list(segment)]
+        if first < last and segments[first][0] < start:
+            replacement.insert(0, [segments[first][0], start, *segments[first][2:]])
+        if first < last and segments[last - 1][1] > end:
+            replacement.append([end, segments[last - 1][1], *segments[last - 1][2:]])
+        segments[first:last] = replacement
+    return segments
+
+
+def merge_layers(layers):
+    """Paint every trip's segments, oldest trip first"""
+    segments = []
+    for trip_id in sorted(layers, key=int):
+        paint(segments, layers[trip_id])
+    return segments
+
+
+def segment_totals(segments):
+    """Hours driving and hours on duty (driving included), as DailyLog counts them"""
+    driving = sum(end - start for start, end, status, *_ in segments if status == LogEntry.DRIVING)
+    on_duty = sum(end - start for start, end, status, *_ in segments if status in (LogEntry.DRIVING, LogEntry.ON_DUTY))
+    return driving / 3600, on_duty / 3600
+
+
+def save_days(updated, deleted):
+    now = timezone.now()
+    for day in updated:
+        day.total_hours_driving, day.total_hours_on_duty = segment_totals(day.segments)
+        day.updated_at = now
+    DriverDayTimeline.objects.bulk_update(
+        updated, ['segments', 'layers', 'total_hours_driving', 'total_hours_on_duty', 'updated_at']
+    )
+    DriverDayTimeline.objects.filter(pk__in=deleted).delete()
+
+
+def locked_days(driver_name, dates):
+    return {
+        day.date: day
+        for day in DriverDayTimeline.objects.select_for_update().filter(driver_name=driver_name, date__in=dates)
+    }
+
+
+def lock_days(driver_name, dates_to_create, dates):
+    """The driver's day rows for the dates, locked, after creating the missing ones among dates_to_create.
+
+    select_for_update cannot lock a row that does not exist yet, so two transactions adding the same day
+    would both insert it and one would fail on the unique index. Missing days are inserted with
+    ignore_conflicts instead (whoever loses the race inserts nothing) and then locked like the others.
+    """
+    days = locked_days(driver_name, dates)
+    missing = [log_date for log_date in dates_to_create if log_date not in days]
+    if missing:
+        DriverDayTimeline.objects.bulk_create(
+            [DriverDayTimeline(driver_name=driver_name, date=log_date, segments=[], layers={}) for log_date in missing],
+            ignore_conflicts=True,
+        )
+        days.update(locked_days(driver_name, missing))
+    return days
+
+
+def update_driver_timelines(trip, entries_by_date):
+    """Merge a trip's log entries into its driver's day timelines.
+
+    entries_by_date maps each date whose entries changed to all of the trip's entries on that date; an
+    empty list takes the trip out of the day. Call inside the transaction that writes the entries.
+    """
+    if not trip.driver_name or not entries_by_date:
+        return
+    key = str(trip.pk)
+    layers = {log_date: trip_segments(trip.pk, entries) for log_date, entries in entries_by_date.items()}
+    days = lock_days(trip.driver_name, [log_date for log_date, layer in layers.items() if layer], list(layers))
+
+    updated, deleted = [], []
+    for log_date, layer in layers.items():
+        day = days.get(log_date)
+        if day is None:
+            continue
+        updated.append(day)
+
+        if key not in day.layers and all(int(other) < trip.pk for other in day.layers):
+            if layer:
+                paint(day.segments, layer)
+                day.layers[key] = layer
+            continue
+
+        day.layers.pop(key, None)
+        if layer:
+            day.layers[key] = layer
+        if not day.layers:
+            updated.remove(day)
+            deleted.append(day.pk)
+            continue
+        day.segments = merge_layers(day.layers)
+
+    save_days(updated, deleted)
+
+
+def remove_trips_from_timelines(trip_ids):
+    """Take trips about to be deleted out of the day timelines they contributed to"""
+    keys = {str(trip_id) for trip_id in trip_ids}
+    dates_by_driver = {}
+    for driver_name, log_date in (
+        DailyLog.objects.filter(trip_id__in=trip_ids).exclude(driver_name='')
+        .values_list('driver_name', 'date').distinct()
+    ):
+        dates_by_driver.setdefault(driver_name, set()).add(log_date)
+
+    updated, deleted = [], []
+    for driver_name, dates in dates_by_driver.items():
+        for day in DriverDayTimeline.objects.select_for_update().filter(driver_name=driver_name, date__in=dates):
+            for key in keys & set(day.layers):
+                del day.layers[key]
+            if day.layers:
+                day.segments = merge_layers(day.layers)
+                updated.append(day)
+            else:
+                deleted.append(day.pk)
+    save_days(updated, deleted)
+
+
+def rebuild_driver_timelines(driver_name=None):
+    """Rebuild the day timelines from the daily logs, oldest trip first; returns the days written.
+
+    Archived trips have no logs left to rebuild from, so their layers are kept as they are and the live
+    trips are merged back over them. Runs in one transaction, so readers never see a day half rebuilt.
+    """
+    days = DriverDayTimeline.objects.all()
+    logs = DailyLog.objects.exclude(driver_name='')
+    if driver_name is not None:
+        days = days.filter(driver_name=driver_name)
+        logs = logs.filter(driver_name=driver_name)
+
+    with transaction.atomic():
+        locked = list(days.select_for_update())
+        keys = {int(key) for day in locked for key in day.layers}
+        archived = {
+            str(trip_id) for trip_id in ArchivedTrip.objects.filter(trip_id__in=keys).values_list('trip_id', flat=True)
+        }
+        updated, deleted = [], []
+        for day in locked:
+            day.layers = {key: layer for key, layer in day.layers.items() if key in archived}
+            if day.layers:
+                day.segments = merge_layers(day.layers)
+                updated.append(day)
+            else:
+                deleted.append(day.pk)
+        save_days(updated, deleted)
+
+        for trip in Trip.objects.filter(pk__in=logs.values('trip_id')).order_by('pk'):
+            entries_by_date = {}
+            for entry in LogEntry.objects.filter(daily_log__trip=trip).select_related('daily_log'):
+                entries_by_date.setdefault(entry.daily_log.date, []).append(entry)
+            update_driver_timelines(trip, entries_by_date)
+        return days.count()
+
+
+def timeline_entries(segments):
+    """The day's segments as log entries covering all 24 hours, gaps filled with off duty"""
+    entries, cursor = [], 0
+    for start, end, status, trip_id, location in segments + [[SECONDS_PER_DAY, SECONDS_PER_DAY, None, None, '']]:
+        if start > cursor:
+            entries.append((cursor, start, LogEntry.OFF_DUTY, None, ''))
+        if status is not None:
+            entries.append((start, end, status, trip_id, location))
+        cursor = end
+    return [
+        {
+            'status': status,
+            'start_time': clock_time(start).isoformat(),
+            'end_time': clock_time(end).isoformat(),
+            'duration_hours': (end - start) / 3600,
+            'location': location,
+            'trip_id': trip_id,
+        }
+        for start, end, status, trip_id, location in entries
+    ]
+
+
+def driver_timeline(driver_name, start, end):
+    """A driver's merged days between two dates (days without planned duty are left out), in one query"""
+    days = DriverDayTimeline.objects.filter(driver_name=driver_name, date__range=(start, end)).order_by('date')
+    return [
+        {
+            'date': day['date'].isoformat(),
+            'total_hours_driving': day['total_hours_driving'],
+            'total_hours_on_duty': day['total_hours_on_duty'],
+            'trip_ids': sorted({segment[3] for segment in day['segments']}),
+            'entries': timeline_entries(day['segments']),
+        }
+        for day in days.values('date', 'segments', 'total_hours_driving', 'total_hours_on_duty')
+    ]
@@ -1,8 +1,15 @@
+import hashlib
 import math
 from datetime import datetime, timedelta, time
 
-from .constants import TripConstants
+import numpy as np
+from django.core.cache import caches
+from django.utils import timezone
+
+from .constants import TripConstants, HOSConstants
+from .metrics import CACHE_REQUESTS, PLANNER_DURATION, TRIP_LOG_ENTRIES
 from .models import LogEntry, DailyLog
+from .timeline import update_driver_timelines
 
 
 def calculate_distance(lat1, lon1, lat2, lon2):
@@ -18,6 +25,76 @@ def calculate_distance(lat1, lon1, lat2, lon2):
 
     return TripConstants.EARTH_RADIUS_MILES * c
 
+def calculate_distances(lat1, lon1, lat2, lon2):
+    """Vectorized Haversine distance (in miles); arguments broadcast like numpy arrays"""
+    lat1_rad = np.radians(lat1)
+    lat2_rad = np.radians(lat2)
+    delta_lat = lat2_rad - lat1_rad
+    delta_lon = np.radians(np.subtract(lon2, lon1))
+
+    a = np.sin(delta_lat / 2) ** 2 + np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(delta_lon / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    return TripConstants.EARTH_RADIUS_MILES * c
+
+DISTANCE_MATRIX_CHUNK_ROWS = 512
+
+
+def distance_matrix_chunks(origins, destinations, chunk_rows=DISTANCE_MATRIX_CHUNK_ROWS):
+    """Yield (first_row, block) slices of the origin x destination distance matrix (in miles).
+
+    origins and destinations are (n, 2) arrays of [lat, lng]. Only chunk_rows x len(destinations)
+    values are alive at a time, so memory stays bounded however many origins there are.
+    """
+    origins = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+    destinations = np.asarray(destinations, dtype=np.float64).reshape(-1, 2)
+
+    dest_lat = np.radians(destinations[:, 0])[None, :]
+    dest_lng = np.radians(destinations[:, 1])[None, :]
+    dest_cos = np.cos(dest_lat)
+
+    for first in range(0, len(origins), chunk_rows):
+        chunk = origins[first:first + chunk_rows]
+        lat = np.radians(chunk[:, 0])[:, None]
+        lng = np.radians(chunk[:, 1])[:, None]
+
+        a = np.sin((dest_lat - lat) / 2) ** 2 + np.cos(lat) * dest_cos * np.sin((dest_lng - lng) / 2) ** 2
+        c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+        yield first, TripConstants.EARTH_RADIUS_MILES * c
+
+
+def calculate_distance_matrix(origins, destinations, chunk_rows=DISTANCE_MATRIX_CHUNK_ROWS):
+    """Full origin x destination distance matrix (in miles), computed chunk by chunk"""
+    origins = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+    destinations = np.asarray(destinations, dtype=np.float64).reshape(-1, 2)
+    matrix = np.empty((len(origins), len(destinations)), dtype=np.float64)
+    for first, block in distance_matrix_chunks(origins, destinations, chunk_rows):
+        matrix[first:first + len(block)] = block
+    return matrix
+
+
+def nearest_destinations(origins, destinations, k, chunk_rows=DISTANCE_MATRIX_CHUNK_ROWS):
+    """Indices and distances of the k nearest destinations per origin, nearest first"""
+    origins = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+    k = min(k, len(destinations))
+    indices = np.empty((len(origins), k), dtype=np.int64)
+    distances = np.empty((len(origins), k), dtype=np.float64)
+
+    for first, block in distance_matrix_chunks(origins, destinations, chunk_rows):
+        if k < block.shape[1]:
+            candidates = np.argpartition(block, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.broadcast_to(np.arange(block.shape[1]), block.shape)
+        candidate_distances = np.take_along_axis(block, candidates, axis=1)
+        order = np.argsort(candidate_distances, axis=1, kind='stable')
+
+        rows = slice(first, first + len(block))
+        indices[rows] = np.take_along_axis(candidates, order, axis=1)
+        distances[rows] = np.take_along_axis(candidate_distances, order, axis=1)
+
+    return indices, distances
+
+
 def interpolate_point(lat1, lon1, lat2, lon2, fraction):
     """Interpolate a point between two coordinates using spherical interpolation"""
     lat1_rad = math.radians(lat1)
@@ -46,240 +123,166 @@ def interpolate_point(lat1, lon1, lat2, lon2, fraction):
     return math.degrees(lat_result), math.degrees(lon_result)
 
 
-def generate_route_stops(trip_data):
-    """Generate route stops including fuel and rest breaks"""
-    current_lat = trip_data['current_lat']
-    current_lng = trip_data['current_lng']
-    pickup_lat = trip_data['pickup_lat']
-    pickup_lng = trip_data['pickup_lng']
-    dropoff_lat = trip_data['dropoff_lat']
-    dropoff_lng = trip_data['dropoff_lng']
-
-    dist_to_pickup = calculate_distance(current_lat, current_lng, pickup_lat, pickup_lng)
-    dist_pickup_to_dropoff = calculate_distance(pickup_lat, pickup_lng, dropoff_lat, dropoff_lng)
-    total_distance = dist_to_pickup + dist_pickup_to_dropoff
-
-    # Average speed: 48 mph
+def trip_waypoints(trip_data):
+    """Ordered waypoints of a trip, falling back to the classic pickup/dropoff pair"""
+    if trip_data.get('waypoints'):
+        return trip_data['waypoints']
+
+    return [
+        {
+            'stop_type': 'pickup',
+            'location_name': trip_data['pickup_location'],
+            'latitude': trip_data['pickup_lat'],
+            'longitude': trip_data['pickup_lng'],
+        },
+        {
+            'stop_type': 'dropoff',
+            'location_name': trip_data['dropoff_location'],
+            'latitude': trip_data['dropoff_lat'],
+            'longitude': trip_data['dropoff_lng'],
+        },
+    ]
+
+
+def plan_route(start_lat, start_lng, waypoints, hours_since_rest=0.0, miles_since_fuel=0.0):
+    """Walk every leg of a trip once, inserting fuel and rest stops.
+
+    HOS and fuel state carry over from one leg to the next, so a multi-drop trip is planned in a
+    single linear pass. Returns the route stops, total distance and total trip time in hours.
+    """
     avg_speed = TripConstants.AVERAGE_SPEED_MILES_PER_HOUR
+    max_driving = HOSConstants.MAX_DRIVING_HOURS
+    stop_hours = HOSConstants.STOP_DURATION_HOURS
 
     route_stops = []
-    stop_order = 1
     cumulative_hours = 0
-    cumulative_distance = 0
-    hours_since_rest = trip_data['current_cycle_hours'] % 11  # Hours since last 10-hour break
-
-    segment_distance = dist_to_pickup
-    segment_time = segment_distance / avg_speed
-
-    # Check if we need rest breaks before pickup
-    if hours_since_rest + segment_time > 11:
-        time_to_rest = 11 - hours_since_rest
-        distance_to_rest = time_to_rest * avg_speed
-        fraction = distance_to_rest / segment_distance
-        rest_lat, rest_lng = interpolate_point(current_lat, current_lng, pickup_lat, pickup_lng, fraction)
+    total_distance = 0
+    prev_lat, prev_lng = start_lat, start_lng
 
+    def add_stop(stop_type, location_name, lat, lng, distance, duration):
         route_stops.append({
-            'stop_type': 'rest',
-            'location_name': f'Rest Stop (after {time_to_rest:.1f}h driving)',
-            'latitude': rest_lat,
-            'longitude': rest_lng,
-            'order': stop_order,
-            'duration_hours': 10.0,
-            'distance_from_previous': distance_to_rest,
-            'cumulative_hours': cumulative_hours + time_to_rest
+            'stop_type': stop_type,
+            'location_name': location_name,
+            'latitude': lat,
+            'longitude': lng,
+            'order': len(route_stops) + 1,
+            'duration_hours': duration,
+            'distance_from_previous': distance,
+            'cumulative_hours': cumulative_hours
         })
-        stop_order += 1
-        cumulative_hours += time_to_rest + 10
-        cumulative_distance += distance_to_rest
-        hours_since_rest = 0
-        segment_distance -= distance_to_rest
-
-    # Check for fuel stops to pickup
-    while cumulative_distance + segment_distance > cumulative_distance + 1000:
-        distance_to_fuel = 1000 - (cumulative_distance % 1000) if cumulative_distance % 1000 != 0 else 1000
-        time_to_fuel = distance_to_fuel / avg_speed
-
-        # Check if we can reach fuel stop within hours of service
-        if hours_since_rest + time_to_fuel > 11:
-            time_to_rest = 11 - hours_since_rest
-            distance_to_rest = time_to_rest * avg_speed
-            total_dist = cumulative_distance + distance_to_rest
-            remaining_from_start = dist_to_pickup - (total_dist - 0)
-            fraction = (dist_to_pickup - remaining_from_start) / dist_to_pickup
-            rest_lat, rest_lng = interpolate_point(current_lat, current_lng, pickup_lat, pickup_lng, fraction)
-
-            route_stops.append({
-                'stop_type': 'rest',
-                'location_name': f'Rest Stop',
-                'latitude': rest_lat,
-                'longitude': rest_lng,
-                'order': stop_order,
-                'duration_hours': 10.0,
-                'distance_from_previous': distance_to_rest,
-                'cumulative_hours': cumulative_hours + time_to_rest
-            })
-            stop_order += 1
-            cumulative_hours += time_to_rest + 10
-            cumulative_distance += distance_to_rest
-            hours_since_rest = 0
-            segment_distance -= distance_to_rest
-            continue
 
-        fraction = (cumulative_distance + distance_to_fuel) / dist_to_pickup
-        fuel_lat, fuel_lng = interpolate_point(current_lat, current_lng, pickup_lat, pickup_lng, fraction)
+    for waypoint in waypoints:
+        leg_lat, leg_lng = waypoint['latitude'], waypoint['longitude']
+        leg_distance = calculate_distance(prev_lat, prev_lng, leg_lat, leg_lng)
+        covered = 0  # Miles of this leg driven so far
+        last_stop_at = 0  # Position of the previous stop within this leg
 
-        route_stops.append({
-            'stop_type': 'fuel',
-            'location_name': f'Fuel Stop',
-            'latitude': fuel_lat,
-            'longitude': fuel_lng,
-            'order': stop_order,
-            'duration_hours': 1.0,
-            'distance_from_previous': distance_to_fuel,
-            'cumulative_hours': cumulative_hours + time_to_fuel
-        })
-        stop_order += 1
-        cumulative_hours += time_to_fuel + 1
-        cumulative_distance += distance_to_fuel
-        hours_since_rest += time_to_fuel + 1
-        segment_distance -= distance_to_fuel
-
-    # Pickup stop
-    remaining_time = segment_distance / avg_speed
-    route_stops.append({
-        'stop_type': 'pickup',
-        'location_name': trip_data['pickup_location'],
-        'latitude': pickup_lat,
-        'longitude': pickup_lng,
-        'order': stop_order,
-        'duration_hours': 1.0,
-        'distance_from_previous': segment_distance,
-        'cumulative_hours': cumulative_hours + remaining_time
-    })
-    stop_order += 1
-    cumulative_hours += remaining_time + 1
-    cumulative_distance += segment_distance
-    hours_since_rest += remaining_time + 1
-
-    segment_distance = dist_pickup_to_dropoff
-
-    # Continue with rest and fuel stops until dropoff
-    temp_distance = 0
-    while temp_distance < segment_distance:
-        if hours_since_rest >= 11:
-            fraction = (cumulative_distance - dist_to_pickup + temp_distance) / dist_pickup_to_dropoff
-            rest_lat, rest_lng = interpolate_point(pickup_lat, pickup_lng, dropoff_lat, dropoff_lng, fraction)
-
-            route_stops.append({
-                'stop_type': 'rest',
-                'location_name': f'Rest Stop',
-                'latitude': rest_lat,
-                'longitude': rest_lng,
-                'order': stop_order,
-                'duration_hours': 10.0,
-                'distance_from_previous': 0,
-                'cumulative_hours': cumulative_hours
-            })
-            stop_order += 1
-            cumulative_hours += 10
-            hours_since_rest = 0
-
-        # Check fuel needs
-        next_fuel_distance = 1000 - (cumulative_distance % 1000) if cumulative_distance % 1000 != 0 else 1000
-        if temp_distance + next_fuel_distance < segment_distance and next_fuel_distance < segment_distance - temp_distance:
-            time_to_fuel = next_fuel_distance / avg_speed
-
-            if hours_since_rest + time_to_fuel > 11:
-                time_to_rest = 11 - hours_since_rest
-                distance_to_rest = time_to_rest * avg_speed
-                fraction = (temp_distance + distance_to_rest) / dist_pickup_to_dropoff
-                rest_lat, rest_lng = interpolate_point(pickup_lat, pickup_lng, dropoff_lat, dropoff_lng,
-                                                       fraction)
-
-                route_stops.append({
-                    'stop_type': 'rest',
-                    'location_name': f'Rest Stop',
-                    'latitude': rest_lat,
-                    'longitude': rest_lng,
-                    'order': stop_order,
-                    'duration_hours': 10.0,
-                    'distance_from_previous': distance_to_rest,
-                    'cumulative_hours': cumulative_hours + time_to_rest
-                })
-                stop_order += 1
-                cumulative_hours += time_to_rest + 10
-                cumulative_distance += distance_to_rest
-                temp_distance += distance_to_rest
+        while True:
+            remaining = leg_distance - covered
+            miles_to_rest = max(0, max_driving - hours_since_rest) * avg_speed
+            miles_to_fuel = TripConstants.FUEL_INTERVAL_MILES - miles_since_fuel
+
+            if remaining <= miles_to_rest and remaining <= miles_to_fuel:
+                break
+
+            if miles_to_rest <= miles_to_fuel:
+                stop_type, distance, duration = 'rest', miles_to_rest, HOSConstants.REQUIRED_REST_HOURS
+            else:
+                stop_type, distance, duration = 'fuel', miles_to_fuel, stop_hours
+
+            drive_time = distance / avg_speed
+            covered += distance
+            cumulative_hours += drive_time
+            miles_since_fuel += distance
+            if leg_distance > 0:
+                stop_lat, stop_lng = interpolate_point(prev_lat, prev_lng, leg_lat, leg_lng, covered / leg_distance)
+            else:
+                stop_lat, stop_lng = prev_lat, prev_lng
+
+            add_stop(stop_type, 'Rest Stop' if stop_type == 'rest' else 'Fuel Stop',
+                     stop_lat, stop_lng, covered - last_stop_at, duration)
+            last_stop_at = covered
+            cumulative_hours += duration
+
+            if stop_type == 'rest':
                 hours_since_rest = 0
-                continue
-
-            fraction = (temp_distance + next_fuel_distance) / dist_pickup_to_dropoff
-            fuel_lat, fuel_lng = interpolate_point(pickup_lat, pickup_lng, dropoff_lat, dropoff_lng, fraction)
-
-            route_stops.append({
-                'stop_type': 'fuel',
-                'location_name': f'Fuel Stop',
-                'latitude': fuel_lat,
-                'longitude': fuel_lng,
-                'order': stop_order,
-                'duration_hours': 1.0,
-                'distance_from_previous': next_fuel_distance,
-                'cumulative_hours': cumulative_hours + time_to_fuel
-            })
-            stop_order += 1
-            cumulative_hours += time_to_fuel + 1
-            cumulative_distance += next_fuel_distance
-            temp_distance += next_fuel_distance
-            hours_since_rest += time_to_fuel + 1
-        else:
-            break
+            else:
+                miles_since_fuel = 0
+                hours_since_rest += drive_time + duration
 
-    remaining_distance = segment_distance - temp_distance
-    remaining_time = remaining_distance / avg_speed
+        drive_time = remaining / avg_speed
+        cumulative_hours += drive_time
+        miles_since_fuel += remaining
+        add_stop(waypoint['stop_type'], waypoint['location_name'], leg_lat, leg_lng,
+                 leg_distance - last_stop_at, stop_hours)
+        cumulative_hours += stop_hours
+        hours_since_rest += drive_time + stop_hours
 
-    # Check if rest needed before dropoff
-    if hours_since_rest + remaining_time > 11:
-        time_to_rest = 11 - hours_since_rest
-        distance_to_rest = time_to_rest * avg_speed
-        fraction = (temp_distance + distance_to_rest) / dist_pickup_to_dropoff
-        rest_lat, rest_lng = interpolate_point(pickup_lat, pickup_lng, dropoff_lat, dropoff_lng, fraction)
+        total_distance += leg_distance
+        prev_lat, prev_lng = leg_lat, leg_lng
 
-        route_stops.append({
-            'stop_type': 'rest',
-            'location_name': f'Rest Stop',
-            'latitude': rest_lat,
-            'longitude': rest_lng,
-            'order': stop_order,
-            'duration_hours': 10.0,
-            'distance_from_previous': distance_to_rest,
-            'cumulative_hours': cumulative_hours + time_to_rest
-        })
-        stop_order += 1
-        cumulative_hours += time_to_rest + 10
-        remaining_distance -= distance_to_rest
-        remaining_time = remaining_distance / avg_speed
-
-    route_stops.append({
-        'stop_type': 'dropoff',
-        'location_name': trip_data['dropoff_location'],
-        'latitude': dropoff_lat,
-        'longitude': dropoff_lng,
-        'order': stop_order,
-        'duration_hours': 1.0,
-        'distance_from_previous': remaining_distance,
-        'cumulative_hours': cumulative_hours + remaining_time
-    })
-
-    # +1 is for dropoff time and pickup hour
-    total_time = cumulative_hours + remaining_time + 1
-
-    return route_stops, total_distance, total_time
-
-def generate_daily_logs(trip, route_stops):
-    """Generate daily logs based on route stops"""
-    daily_logs = []
-    current_date = datetime.now().date()
-    current_time = time(8, 0)  # Start at 8 AM
+    return route_stops, total_distance, cumulative_hours
+
+
+def planning_cache():
+    """Cache of planned routes and log timelines, shared by the web workers when it is file-based"""
+    return caches['planning']
+
+
+def planning_key(prefix, parts):
+    return f'{prefix}:' + hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def route_plan_key(start_lat, start_lng, waypoints, hours_since_rest):
+    """Cache key of a plan: the exact planner inputs, so a hit returns exactly what plan_route would"""
+    stops = tuple((w['stop_type'], w['location_name'], w['latitude'], w['longitude']) for w in waypoints)
+    return planning_key('route', (start_lat, start_lng, stops, hours_since_rest))
+
+
+def cached_plan_route(start_lat, start_lng, waypoints, hours_since_rest=0.0):
+    """plan_route for a trip starting fresh on fuel, served from the planning cache when the lane is known"""
+    key = route_plan_key(start_lat, start_lng, waypoints, hours_since_rest)
+    plan = planning_cache().get(key)
+    CACHE_REQUESTS.inc(cache='route_plan', result='miss' if plan is None else 'hit')
+    if plan is None:
+        plan = plan_route(start_lat, start_lng, waypoints, hours_since_rest=hours_since_rest)
+        planning_cache().set(key, plan)
+    route_stops, total_distance, total_time = plan
+    return [dict(stop) for stop in route_stops], total_distance, total_time
+
+
+def trip_hours_since_rest(trip_data):
+    """Hours since the last 10-hour break, when the caller knows it (e.g. from the driver status index)"""
+    return trip_data.get('hours_since_rest', trip_data['current_cycle_hours'] % HOSConstants.MAX_DRIVING_HOURS)
+
+
+@PLANNER_DURATION.time(step='generate_route_stops')
+def generate_route_stops(trip_data):
+    """Generate route stops including fuel and rest breaks"""
+    return cached_plan_route(
+        trip_data['current_lat'],
+        trip_data['current_lng'],
+        trip_waypoints(trip_data),
+        hours_since_rest=trip_hours_since_rest(trip_data),
+    )
+
+def default_log_start():
+    """Planned trips start at 8 AM today"""
+    return datetime.combine(datetime.now().date(), time(8, 0))
+
+
+def plan_start(trip):
+    """When the trip's log timeline begins (the start of its first log entry)"""
+    first_entry = LogEntry.objects.filter(daily_log__trip=trip).order_by('daily_log__date', 'start_time').first()
+    if first_entry is None:
+        return timezone.make_naive(trip.created_at)
+    return datetime.combine(first_entry.daily_log.date, first_entry.start_time)
+
+
+def build_log_timeline(route_stops, start):
+    """Lay the route stops out on the clock from ``start``, as log entries grouped by date"""
+    current_date = start.date()
+    current_time = start.time()
 
     logs_by_date = {}
 
@@ -386,30 +389,71 @@ def generate_daily_logs(trip, route_stops):
             current_time = end_datetime.time()
             current_date = end_datetime.date()
 
-    # Create DailyLog objects
-    for log_date, entries in logs_by_date.items():
-        total_driving = sum(e['duration_hours'] for e in entries if e['status'] == 'driving')
-        total_on_duty = sum(e['duration_hours'] for e in entries if e['status'] in ['on_duty', 'driving'])
+    return logs_by_date
+
+
+def log_timeline_key(route_stops, start_time):
+    """Cache key of a timeline: the stop fields it depends on and the time of day it starts at"""
+    stops = tuple(
+        (s['stop_type'], s['location_name'], s['distance_from_previous'], s['duration_hours']) for s in route_stops
+    )
+    return planning_key('timeline', (start_time, stops))
+
+
+def log_timeline_offsets(route_stops, start):
+    """build_log_timeline with each date given as days after the start date"""
+    logs_by_date = build_log_timeline(route_stops, start)
+    return [((log_date - start.date()).days, entries) for log_date, entries in logs_by_date.items()]
+
 
-        daily_log = DailyLog.objects.create(
+def cached_log_timeline(route_stops, start):
+    """build_log_timeline through the planning cache.
+
+    A timeline only depends on the date it starts on by a shift, so it is cached as day offsets and
+    moved to the requested date on the way out.
+    """
+    key = log_timeline_key(route_stops, start.time())
+    timeline = planning_cache().get(key)
+    CACHE_REQUESTS.inc(cache='log_timeline', result='miss' if timeline is None else 'hit')
+    if timeline is None:
+        timeline = log_timeline_offsets(route_stops, start)
+        planning_cache().set(key, timeline)
+    return {
+        start.date() + timedelta(days=offset): [dict(entry) for entry in entries] for offset, entries in timeline
+    }
+
+
+def daily_totals(entries):
+    """Hours driving and hours on duty (driving included) in a day's entries"""
+    total_driving = sum(e['duration_hours'] for e in entries if e['status'] == 'driving')
+    total_on_duty = sum(e['duration_hours'] for e in entries if e['status'] in ['on_duty', 'driving'])
+    return total_driving, total_on_duty
+
+
+@PLANNER_DURATION.time(step='generate_daily_logs')
+def generate_daily_logs(trip, route_stops, start=None):
+    """Generate daily logs based on route stops"""
+    logs_by_date = cached_log_timeline(route_stops, start or default_log_start())
+
+    daily_logs = []
+    for log_date, entries in logs_by_date.items():
+        total_driving, total_on_duty = daily_totals(entries)
+        daily_logs.append(DailyLog(
             trip=trip,
             date=log_date,
-            driver_name=trip.driver_name,
+            driver_name=trip.driver_name or '',
             home_terminal=trip.current_location,
             total_hours_driving=total_driving,
             total_hours_on_duty=total_on_duty
-        )
-
-        for entry in entries:
-            LogEntry.objects.create(
-                daily_log=daily_log,
-                status=entry['status'],
-                start_time=entry['start_time'],
-                end_time=entry['end_time'],
-                duration_hours=entry['duration_hours'],
-                location=entry['location']
-            )
-
-        daily_logs.append(daily_log)
+        ))
+    DailyLog.objects.bulk_create(daily_logs)
+
+    log_entries = LogEntry.objects.bulk_create(
+        LogEntry(daily_log=daily_log, **entry)
+        for daily_log, entries in zip(daily_logs, logs_by_date.values())
+        for entry in entries
+    )
+    TRIP_LOG_ENTRIES.observe(len(log_entries))
+    update_driver_timelines(trip, logs_by_date)
 
     return daily_logs
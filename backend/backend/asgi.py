@@ -2,6 +2,9 @@
 ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it (e.g. ``uvicorn backend.asgi:application``) for the live trip event streams at
+``/api/trips/{id}/events/``: they are Server-Sent Events held open on the event loop, fed by the
+in-process hub in analytics.live.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -56,6 +56,7 @@ MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "corsheaders.middleware.CorsMiddleware",
+    "analytics.replicas.ReplicaRoutingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -83,6 +84,45 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "backend.wsgi.application"
 
+REST_FRAMEWORK = {
+    # Uses orjson when it is installed (pip install orjson), the stock JSON encoder otherwise
+    "DEFAULT_RENDERER_CLASSES": [
+        "analytics.api.renderers.OrjsonRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
+
+# Directory shared by all worker processes for /metrics snapshots; unset for a single process
+METRICS_DIR = os.getenv("METRICS_DIR")
+
+# Log sheet render processes per server process, shared by all concurrent exports (see analytics/export.py)
+EXPORT_POOL_WORKERS = int(os.getenv("EXPORT_POOL_WORKERS", min(4, os.cpu_count() or 1)))
+
+# Compressed monthly files of archived trips (see the archive_trips command)
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", BASE_DIR / "archive")
+
+# Planned routes and log timelines of recurring lanes (see the warm_planning_cache command). Warming at
+# deploy time only reaches the web workers through a cache they share, so set PLANNING_CACHE_DIR there.
+PLANNING_CACHE_DIR = os.getenv("PLANNING_CACHE_DIR")
+PLANNING_CACHE_MAX_ENTRIES = 20000
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "planning": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": PLANNING_CACHE_DIR,
+        "TIMEOUT": None,
+        "OPTIONS": {"MAX_ENTRIES": PLANNING_CACHE_MAX_ENTRIES},
+    } if PLANNING_CACHE_DIR else {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "planning",
+        "TIMEOUT": None,
+        "OPTIONS": {"MAX_ENTRIES": PLANNING_CACHE_MAX_ENTRIES},
+    },
+}
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
@@ -93,6 +133,29 @@ DATABASES = {
     }
 }
 
+# Read replicas of the default database, e.g. DATABASE_REPLICAS=/srv/replica1.sqlite3,/srv/replica2.sqlite3.
+# Each entry is a copy of "default" with its NAME replaced; for a server database such as PostgreSQL an
+# entry may also name the replica's server as host[:port]/name (db2:5433/trips, or just trips for another
+# database on the primary's server). Trip list, retrieve, daily_logs and export reads are spread over
+# them; see analytics/replicas.py.
+REPLICA_DATABASES = []
+for number, entry in enumerate(filter(None, os.getenv("DATABASE_REPLICAS", "").split(",")), start=1):
+    replica = {**DATABASES["default"], "NAME": entry.strip(), "TEST": {"MIRROR": "default"}}
+    if replica["ENGINE"] != "django.db.backends.sqlite3" and "/" in replica["NAME"]:
+        address, replica["NAME"] = replica["NAME"].rsplit("/", 1)
+        host, _, port = address.partition(":")
+        replica["HOST"] = host
+        if port:
+            replica["PORT"] = port
+    DATABASES[f"replica{number}"] = replica
+    REPLICA_DATABASES.append(f"replica{number}")
+
+DATABASE_ROUTERS = ["analytics.replicas.ReplicaRouter"]
+# After writing, a client reads from the primary this long, covering replication lag for its next reads
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", "5"))
+# Replicas further behind than this are skipped until they catch up
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "10"))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -119,6 +119,28 @@ describe('tripAPI', () => {
          await expect(tripAPI.getTrip(999)).rejects.toThrow('Trip not found')
       })
    })
+
+   describe('getTripGeometry', () => {
+      it('should request the geometry for a whole zoom level', async () => {
+         const mockGeometry = {
+            trip: 1,
+            min_zoom: 4,
+            tolerance: 2445.98,
+            point_count: 3,
+            polyline: '_p~iF~ps|U_ulLnnqC_mqNvxq`@',
+         }
+
+         mockAxiosInstance.get.mockResolvedValueOnce({ data: mockGeometry })
+
+         const result = await tripAPI.getTripGeometry(1, 5.6)
+
+         expect(mockAxiosInstance.get).toHaveBeenCalledWith(
+            '/trips/1/geometry/',
+            { params: { zoom: 6 } }
+         )
+         expect(result).toEqual(mockGeometry)
+      })
+   })
 })
 
 describe('geocodeLocation', () => {
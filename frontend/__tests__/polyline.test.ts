@@ -0,0 +1,16 @@
+import { describe, expect, it } from 'vitest'
+import { decodePolyline } from '../src/lib/polyline'
+
+describe('decodePolyline', () => {
+   it('should decode the reference polyline', () => {
+      expect(decodePolyline('_p~iF~ps|U_ulLnnqC_mqNvxq`@')).toEqual([
+         [38.5, -120.2],
+         [40.7, -120.95],
+         [43.252, -126.453],
+      ])
+   })
+
+   it('should return no points for an empty string', () => {
+      expect(decodePolyline('')).toEqual([])
+   })
+})
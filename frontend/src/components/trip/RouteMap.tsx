@@ -1,7 +1,7 @@
 import { useEffect, useRef } from 'react'
 import L from 'leaflet'
 import 'leaflet/dist/leaflet.css'
-import { Bed, Fuel, Map, MapPin, Package } from 'lucide-react'
+import { Bed, Fuel, Map as MapIcon, MapPin, Package } from 'lucide-react'
 import icon from 'leaflet/dist/images/marker-icon.png'
 import iconShadow from 'leaflet/dist/images/marker-shadow.png'
 import {
@@ -10,6 +10,8 @@ import {
    CardHeader,
    CardTitle,
 } from '@/components/ui/card.tsx'
+import { tripAPI } from '@/lib/api.ts'
+import { decodePolyline } from '@/lib/polyline.ts'
 import type { RouteStop } from '@/types/trip.ts'
 
 const DefaultIcon = L.icon({
@@ -21,10 +23,18 @@ const DefaultIcon = L.icon({
 
 L.Marker.prototype.options.icon = DefaultIcon
 
+// Zoom levels the server keeps a simplified route for (GEOMETRY_ZOOM_LEVELS in analytics/geometry.py)
+const GEOMETRY_ZOOM_LEVELS = [0, 4, 7, 10, 13]
+
+// The level a zoom is served from: the highest one at or below it
+const geometryLevel = (zoom: number) =>
+   GEOMETRY_ZOOM_LEVELS.filter((level) => level <= Math.round(zoom)).pop() ?? 0
+
 interface RouteMapProps {
    routeStops: RouteStop[]
    currentLat: number
    currentLng: number
+   tripId?: number
 }
 
 const getStopIcon = (stopType: string) => {
@@ -51,9 +61,11 @@ export default function RouteMap({
    routeStops,
    currentLat,
    currentLng,
+   tripId,
 }: Readonly<RouteMapProps>) {
    const mapRef = useRef<L.Map | null>(null)
    const mapContainerRef = useRef<HTMLDivElement>(null)
+   const routeLineRef = useRef<L.Polyline | null>(null)
 
    useEffect(() => {
       if (!mapContainerRef.current) return
@@ -110,7 +122,8 @@ export default function RouteMap({
             )
       })
 
-      L.polyline(coordinates, {
+      // Straight lines between stops until the route geometry for the zoom arrives
+      routeLineRef.current = L.polyline(coordinates, {
          color: '#3b82f6',
          weight: 3,
          opacity: 0.7,
@@ -123,11 +136,46 @@ export default function RouteMap({
       }
    }, [routeStops, currentLat, currentLng])
 
+   useEffect(() => {
+      const map = mapRef.current
+      if (!map || tripId === undefined) return
+
+      // Only the detail the current zoom can show is downloaded, once per server level
+      const geometryByLevel = new Map<number, [number, number][]>()
+      let cancelled = false
+
+      const loadGeometry = async () => {
+         const level = geometryLevel(map.getZoom())
+         let points = geometryByLevel.get(level)
+         if (!points) {
+            try {
+               const geometry = await tripAPI.getTripGeometry(tripId, level)
+               points = decodePolyline(geometry.polyline)
+               geometryByLevel.set(level, points)
+            } catch (error) {
+               console.error('Route geometry error:', error)
+               return
+            }
+         }
+         if (!cancelled && geometryLevel(map.getZoom()) === level) {
+            routeLineRef.current?.setLatLngs(points)
+         }
+      }
+
+      loadGeometry()
+      map.on('zoomend', loadGeometry)
+
+      return () => {
+         cancelled = true
+         map.off('zoomend', loadGeometry)
+      }
+   }, [tripId, routeStops])
+
    return (
       <Card className="w-full">
          <CardHeader>
             <div className="flex items-center gap-2">
-               <Map className="h-5 w-5 text-primary" />
+               <MapIcon className="h-5 w-5 text-primary" />
                <CardTitle>Route Map</CardTitle>
             </div>
          </CardHeader>
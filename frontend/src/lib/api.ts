@@ -1,5 +1,5 @@
 import axios from 'axios'
-import type { Trip, TripFormData } from '@/types/trip.ts'
+import type { Trip, TripFormData, TripGeometry } from '@/types/trip.ts'
 
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL
 
@@ -20,6 +20,13 @@ export const tripAPI = {
       const response = await api.get(`/trips/${id}/`)
       return response.data
    },
+
+   getTripGeometry: async (id: number, zoom: number): Promise<TripGeometry> => {
+      const response = await api.get(`/trips/${id}/geometry/`, {
+         params: { zoom: Math.max(0, Math.round(zoom)) },
+      })
+      return response.data
+   },
 }
 
 export const geocodeLocation = async (address: string) => {
@@ -0,0 +1,33 @@
+/**
+ * Decode a Google encoded polyline into [lat, lng] pairs.
+ */
+export const decodePolyline = (
+   encoded: string,
+   precision = 5
+): [number, number][] => {
+   const factor = 10 ** precision
+   const points: [number, number][] = []
+   let index = 0
+   let lat = 0
+   let lng = 0
+
+   const nextValue = () => {
+      let result = 0
+      let shift = 0
+      let byte: number
+      do {
+         byte = encoded.charCodeAt(index++) - 63
+         result |= (byte & 0x1f) << shift
+         shift += 5
+      } while (byte >= 0x20)
+      return result & 1 ? ~(result >> 1) : result >> 1
+   }
+
+   while (index < encoded.length) {
+      lat += nextValue()
+      lng += nextValue()
+      points.push([lat / factor, lng / factor])
+   }
+
+   return points
+}
@@ -68,6 +68,7 @@ function TripPage() {
                            routeStops={trip.route_stops}
                            currentLat={trip.current_lat}
                            currentLng={trip.current_lng}
+                           tripId={trip.id}
                         />
                      </TabsContent>
 
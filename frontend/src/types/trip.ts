@@ -18,10 +18,21 @@ export interface Trip {
    rest_breaks_needed: number
    created_at: string
    updated_at: string
+   waypoints: TripWaypoint[]
    route_stops: RouteStop[]
    daily_logs: DailyLog[]
 }
 
+export interface TripWaypoint {
+   id: number
+   trip: number
+   stop_type: 'pickup' | 'dropoff'
+   location_name: string
+   latitude: number
+   longitude: number
+   order: number
+}
+
 export interface RouteStop {
    id: number
    trip: number
@@ -35,6 +46,19 @@ export interface RouteStop {
    cumulative_hours: number
 }
 
+export type WaypointInput = Omit<
+   TripWaypoint,
+   'id' | 'trip' | 'order' | 'load_id'
+> & { load_id?: string }
+
+export interface TripGeometry {
+   trip: number
+   min_zoom: number
+   tolerance: number
+   point_count: number
+   polyline: string
+}
+
 export interface DailyLog {
    id: number
    trip: number
@@ -74,4 +98,6 @@ export interface TripFormData {
    dropoff_lat: number
    dropoff_lng: number
    current_cycle_hours: number
+   waypoints?: WaypointInput[]
+   optimize_order?: boolean
 }